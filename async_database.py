@@ -0,0 +1,455 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
+
+from database import UserDatabase, IDENTITY_CACHE
+from supabase_client import AsyncSupabaseClient, DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+
+
+class AsyncUserDatabase:
+    """
+    Capa de acceso a datos asíncrona para los handlers del bot de Telegram
+
+    Replica los métodos de UserDatabase que usa el bot sobre un cliente httpx
+    asíncrono, de modo que una consulta lenta a Supabase o n8n no bloquea el
+    event loop del resto de chats. Las operaciones que dependen de librerías
+    síncronas (SDK de Google Drive, extracción de texto y embeddings) se
+    delegan a la UserDatabase síncrona en un pool de hilos acotado.
+    """
+
+    def __init__(self, sync_db: UserDatabase = None, supabase_url: str = None, supabase_key: str = None,
+                 pool_size: int = None, timeout: float = None, blocking_workers: int = None):
+        """
+        Inicializar capa asíncrona
+
+        Args:
+            sync_db: UserDatabase para las operaciones que siguen siendo síncronas
+            supabase_url: URL de Supabase (por defecto SUPABASE_URL)
+            supabase_key: API key de Supabase (por defecto SUPABASE_KEY)
+            pool_size: Conexiones máximas del pool httpx (por defecto SUPABASE_POOL_SIZE)
+            timeout: Timeout por defecto de cada solicitud (por defecto SUPABASE_TIMEOUT)
+            blocking_workers: Hilos para operaciones bloqueantes (por defecto BOT_BLOCKING_WORKERS)
+        """
+        self.sync_db = sync_db
+        # Misma caché de identidad que la capa síncrona
+        self.identity_cache = sync_db.identity_cache if sync_db is not None else IDENTITY_CACHE
+        self.client = AsyncSupabaseClient(
+            supabase_url or SUPABASE_URL,
+            supabase_key or SUPABASE_KEY,
+            pool_size=pool_size or int(os.getenv('SUPABASE_POOL_SIZE', DEFAULT_POOL_SIZE)),
+            timeout=timeout or float(os.getenv('SUPABASE_TIMEOUT', DEFAULT_TIMEOUT))
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=blocking_workers or int(os.getenv('BOT_BLOCKING_WORKERS', 4)),
+            thread_name_prefix='bot-blocking'
+        )
+
+    async def _run_blocking(self, func, *args):
+        """Ejecutar una función síncrona en el pool acotado sin bloquear el loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def close(self):
+        """Liberar conexiones e hilos"""
+        await self.client.aclose()
+        self._executor.shutdown(wait=False)
+
+    # ------------------------------------------------------------------
+    # Usuarios
+    # ------------------------------------------------------------------
+
+    async def get_user(self, telegram_id) -> Optional[Dict]:
+        """Obtener información de un usuario por telegram_id"""
+        response = await self.client.get("users", params={"telegram_id": f"eq.{telegram_id}"})
+
+        if response.status_code == 200 and response.json():
+            return response.json()[0]
+
+        if self.sync_db is not None:
+            return self.sync_db.users.get(str(telegram_id))
+        return None
+
+    async def get_user_uuid(self, telegram_id) -> Optional[str]:
+        """Obtener el UUID de Supabase de un usuario de Telegram (con caché)"""
+        key = ('user', str(telegram_id))
+        user_uuid = self.identity_cache.get(key)
+        if user_uuid:
+            return user_uuid
+
+        response = await self.client.get(
+            "users",
+            params={"telegram_id": f"eq.{telegram_id}", "select": "id"}
+        )
+
+        if response.status_code == 200 and response.json():
+            user_uuid = response.json()[0]['id']
+            self.identity_cache.set(key, user_uuid)
+            return user_uuid
+        return None
+
+    def invalidate_identity(self, telegram_id):
+        """Descartar de la caché la identidad de un usuario de Telegram"""
+        self.identity_cache.invalidate(('user', str(telegram_id)))
+        self.identity_cache.invalidate(('personal_group', str(telegram_id)))
+
+    async def add_user(self, telegram_id, user_data=None) -> bool:
+        """Añadir un usuario a Supabase"""
+        if user_data is None:
+            user_data = {}
+
+        response = await self.client.get("users", params={"telegram_id": f"eq.{telegram_id}"})
+
+        if response.status_code == 200 and response.json():
+            user_id = response.json()[0]['id']
+            update_data = {}
+
+            if 'name' in user_data:
+                update_data['name'] = user_data['name']
+            if 'is_active' in user_data:
+                update_data['is_active'] = user_data['is_active']
+
+            if update_data:
+                update_response = await self.client.patch(
+                    "users",
+                    params={"id": f"eq.{user_id}"},
+                    json=update_data
+                )
+                return update_response.status_code == 204
+
+            return True
+
+        new_user = {
+            "telegram_id": telegram_id,
+            "name": user_data.get('name', ''),
+            "email": user_data.get('email', ''),
+            "created_at": datetime.datetime.now().isoformat(),
+            "is_active": True,
+            "used_storage_bytes": 0,
+            "registered_via": "telegram"
+        }
+
+        if 'current_plan_id' in user_data:
+            new_user['current_plan_id'] = user_data['current_plan_id']
+            if 'plan_duration_days' in user_data:
+                expiration = datetime.datetime.now() + datetime.timedelta(days=user_data['plan_duration_days'])
+                new_user['plan_expiration'] = expiration.isoformat()
+
+        response = await self.client.post("users", json=new_user)
+
+        # También guardar en el archivo local para compatibilidad
+        if self.sync_db is not None:
+            self.sync_db.users[str(telegram_id)] = new_user
+            await self._run_blocking(self.sync_db._save_users)
+
+        return response.status_code == 201
+
+    async def remove_user(self, telegram_id) -> bool:
+        """Eliminar un usuario de Supabase"""
+        user_id = await self.get_user_uuid(telegram_id)
+        if not user_id:
+            return False
+
+        delete_response = await self.client.delete("users", params={"id": f"eq.{user_id}"})
+        self.invalidate_identity(telegram_id)
+
+        if self.sync_db is not None and str(telegram_id) in self.sync_db.users:
+            del self.sync_db.users[str(telegram_id)]
+            await self._run_blocking(self.sync_db._save_users)
+
+        return delete_response.status_code == 204
+
+    async def get_all_users(self) -> Dict[str, Dict]:
+        """Obtener todos los usuarios indexados por telegram_id"""
+        response = await self.client.get("users")
+
+        if response.status_code == 200:
+            return {
+                str(user['telegram_id']): user
+                for user in response.json()
+                if user.get('telegram_id')
+            }
+
+        return self.sync_db.users if self.sync_db is not None else {}
+
+    async def login_telegram_user(self, telegram_id, email, password) -> Tuple[bool, str]:
+        """Iniciar sesión desde Telegram y vincular la cuenta web"""
+        email = email.lower()
+
+        response = await self.client.get("users", params={"email": f"eq.{email}"})
+        if response.status_code != 200 or not response.json():
+            if self.sync_db is None:
+                return False, "Usuario no encontrado"
+            # Respaldo con el archivo local (misma lógica que la versión síncrona)
+            success, message = await self._run_blocking(self.sync_db.login_web_user, email, password)
+            if not success:
+                return False, message
+            user_id = message
+        else:
+            user_data = response.json()[0]
+            try:
+                salt = bytes.fromhex(user_data.get('salt', ''))
+            except ValueError as e:
+                logger.error(f"Error al convertir salt: {str(e)}")
+                return False, "Error en formato de credenciales"
+
+            # PBKDF2 con 100k iteraciones es CPU: fuera del event loop
+            calculated_hash = await self._run_blocking(
+                lambda: hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100000).hex()
+            )
+            if calculated_hash != user_data.get('password_hash', ''):
+                return False, "Contraseña incorrecta"
+            user_id = user_data['id']
+
+        response = await self.client.patch(
+            "users",
+            params={"id": f"eq.{user_id}"},
+            json={"telegram_id": telegram_id}
+        )
+
+        # El telegram_id ahora apunta a otra cuenta
+        self.invalidate_identity(telegram_id)
+
+        if response.status_code == 204:
+            return True, "Inicio de sesión exitoso y cuenta vinculada"
+        return False, "Error al vincular cuenta de Telegram"
+
+    # ------------------------------------------------------------------
+    # Planes y grupo personal
+    # ------------------------------------------------------------------
+
+    async def check_user_plan(self, telegram_id) -> Dict[str, Any]:
+        """Verificar el plan del usuario y el espacio disponible"""
+        inactive = {'active': False, 'used_storage': 0, 'storage_limit': 0}
+
+        try:
+            response = await self.client.get("users", params={"telegram_id": f"eq.{telegram_id}"})
+            if response.status_code != 200 or not response.json():
+                return inactive
+
+            user_data = response.json()[0]
+            self.identity_cache.set(('user', str(telegram_id)), user_data['id'])
+            now = datetime.datetime.now().isoformat()
+            plan_active = (user_data.get('plan_expiration') or '') > now
+
+            plan_response = await self.client.get(
+                "plans",
+                params={"id": f"eq.{user_data.get('current_plan_id')}"}
+            )
+
+            if plan_response.status_code == 200 and plan_response.json():
+                plan_data = plan_response.json()[0]
+                return {
+                    'active': plan_active,
+                    'used_storage': user_data.get('used_storage_bytes', 0),
+                    'storage_limit': plan_data.get('storage_limit_bytes', 0)
+                }
+
+            return inactive
+
+        except Exception as e:
+            logger.error(f"Error al verificar plan: {e}")
+            return inactive
+
+    async def get_personal_group_id(self, telegram_id, user_uuid: str = None) -> Optional[str]:
+        """Obtener el ID del grupo personal sin crearlo (con caché)"""
+        key = ('personal_group', str(telegram_id))
+        group_id = self.identity_cache.get(key)
+        if group_id:
+            return group_id
+
+        user_uuid = user_uuid or await self.get_user_uuid(telegram_id)
+        if not user_uuid:
+            return None
+
+        response = await self.client.get(
+            "groups",
+            params={"name": f"eq.Personal_{telegram_id}", "admin_id": f"eq.{user_uuid}", "select": "id"}
+        )
+
+        if response.status_code == 200 and response.json():
+            group_id = response.json()[0]['id']
+            self.identity_cache.set(key, group_id)
+            return group_id
+        return None
+
+    async def get_or_create_personal_group(self, telegram_id) -> Optional[str]:
+        """Obtener o crear el grupo personal del usuario"""
+        user_uuid = await self.get_user_uuid(telegram_id)
+        if not user_uuid:
+            logger.error(f"Usuario con telegram_id {telegram_id} no encontrado en la base de datos")
+            return None
+
+        group_id = await self.get_personal_group_id(telegram_id, user_uuid)
+        if group_id:
+            return group_id
+
+        group_data = {
+            "name": f"Personal_{telegram_id}",
+            "description": f"Grupo personal para el usuario {telegram_id}",
+            "admin_id": user_uuid,
+            "is_active": True,
+            "created_at": datetime.datetime.now().isoformat(),
+            "shared_storage_bytes": 0
+        }
+
+        create_response = await self.client.post(
+            "groups",
+            json=group_data,
+            headers={"Prefer": "return=representation"}
+        )
+
+        if create_response.status_code != 201:
+            logger.error(f"Error al crear grupo: {create_response.status_code} - {create_response.text}")
+            return None
+
+        created = create_response.json() if create_response.content else None
+        if isinstance(created, list) and created:
+            group_id = created[0]['id']
+        else:
+            group_id = await self.get_personal_group_id(telegram_id, user_uuid)
+
+        if group_id:
+            self.identity_cache.set(('personal_group', str(telegram_id)), group_id)
+            await self.add_group_member(group_id, user_uuid, is_admin=True, status='verified')
+        return group_id
+
+    async def add_group_member(self, group_id, user_id, is_admin=False, status='pending') -> bool:
+        """Añadir un miembro a un grupo"""
+        member = {
+            "group_id": group_id,
+            "user_id": user_id,
+            "is_admin": is_admin,
+            "status": status,
+            "joined_at": datetime.datetime.now().isoformat()
+        }
+
+        response = await self.client.post("group_members", json=member)
+        return response.status_code == 201
+
+    # ------------------------------------------------------------------
+    # Documentos y contenidos
+    # ------------------------------------------------------------------
+
+    async def get_document_info(self, document_id) -> Tuple[bool, Optional[Dict]]:
+        """Obtener información específica de un documento"""
+        try:
+            response = await self.client.get(
+                "documents",
+                params={"id": f"eq.{document_id}", "select": "id,title,content,file_type,file_path,created_at"}
+            )
+
+            if response.status_code == 200 and response.json():
+                return True, response.json()[0]
+
+            return False, None
+
+        except Exception as e:
+            logger.error(f"Error obteniendo información del documento: {e}")
+            return False, None
+
+    async def get_user_documents(self, telegram_id, limit=20) -> Tuple[bool, List[Dict]]:
+        """Obtener los documentos del grupo personal del usuario"""
+        try:
+            group_id = await self.get_personal_group_id(telegram_id)
+            if not group_id:
+                return False, []
+
+            response = await self.client.get(
+                "group_documents",
+                params={
+                    "group_id": f"eq.{group_id}",
+                    "select": "id,created_at,documents(id,title,content,file_type,file_path,file_size,metadata,created_at)",
+                    "order": "created_at.desc",
+                    "limit": str(limit)
+                }
+            )
+
+            if response.status_code == 200:
+                return True, UserDatabase._format_group_documents(response.json())
+
+            return False, []
+
+        except Exception as e:
+            logger.error(f"Error obteniendo documentos del usuario: {e}")
+            return False, []
+
+    async def get_group_contents(self, group_id, user_id) -> Tuple[bool, Any]:
+        """Obtener contenidos de un grupo (solo para miembros verificados)"""
+        member_check = await self.client.get(
+            "group_members",
+            params={"group_id": f"eq.{group_id}", "user_id": f"eq.{user_id}", "status": "eq.verified"}
+        )
+
+        if member_check.status_code != 200 or not member_check.json():
+            return False, "Solo los miembros verificados pueden ver el contenido"
+
+        response = await self.client.get("group_contents", params={"group_id": f"eq.{group_id}"})
+
+        if response.status_code != 200:
+            return False, "Error al obtener contenidos"
+
+        contents = response.json()
+        for content in contents:
+            if isinstance(content.get('content_data'), str):
+                try:
+                    content['content_data'] = json.loads(content['content_data'])
+                except json.JSONDecodeError:
+                    pass
+
+        return True, contents
+
+    async def get_group_content_data(self, content_id) -> Optional[Dict]:
+        """Obtener el content_data (ya decodificado) de un registro de group_contents"""
+        response = await self.client.get(
+            "group_contents",
+            params={"id": f"eq.{content_id}", "select": "content_data"}
+        )
+
+        if response.status_code != 200 or not response.json():
+            return None
+
+        content_data = response.json()[0].get('content_data')
+        if isinstance(content_data, str):
+            try:
+                content_data = json.loads(content_data)
+            except json.JSONDecodeError:
+                return None
+
+        return content_data if isinstance(content_data, dict) else None
+
+    async def upload_and_vectorize_file(self, group_id, user_id, file, content_type) -> Tuple[bool, Any]:
+        """
+        Subir y vectorizar un archivo sin bloquear el event loop
+
+        La subida corre en el pool de hilos; la extracción y el embedding se
+        envían además al pool de procesos si PROCESSING_WORKERS > 0.
+        """
+        if self.sync_db is None:
+            return False, "UserDatabase no disponible para procesar archivos"
+
+        return await self._run_blocking(
+            self.sync_db.upload_and_vectorize_file, group_id, user_id, file, content_type
+        )
+
+    # ------------------------------------------------------------------
+    # Webhooks
+    # ------------------------------------------------------------------
+
+    async def post_webhook(self, url: str, payload: Dict[str, Any], timeout: float = 30):
+        """Enviar un payload a n8n reutilizando el pool de conexiones"""
+        if not url:
+            logger.warning("URL de webhook no configurada")
+            return None
+        return await self.client.http.post(url, json=payload, timeout=timeout)
@@ -0,0 +1 @@
+"""Benchmarks reproducibles contra servidores locales de prueba"""
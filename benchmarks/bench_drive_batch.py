@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: operaciones de Drive archivo por archivo vs en lote
+
+Compara get_file_info/delete_file en un bucle (una solicitud HTTP por
+archivo) con get_files_info/delete_files, que agrupan hasta 100 operaciones
+por solicitud de lote. Drive se simula con StubServer y una latencia
+configurable por solicitud HTTP.
+
+Uso:
+    python benchmarks/bench_drive_batch.py [--files 250] [--latency-ms 30]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+from cryptography.fernet import Fernet
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ttl_cache import TTLCache
+from supabase_client import SupabaseClient
+from google_drive_service import GoogleDriveService
+from benchmarks.stub_server import StubServer
+
+logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.WARNING)
+logging.getLogger('google_drive_service').setLevel(logging.WARNING)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=250)
+    parser.add_argument('--latency-ms', type=float, default=30)
+    args = parser.parse_args()
+
+    file_ids = [f"f{i}" for i in range(args.files)]
+
+    with StubServer() as server:
+        drive = GoogleDriveService(server.url, 'test-key', Fernet.generate_key().decode(),
+                                   supabase_client=SupabaseClient(server.url, 'test-key'))
+        drive.sessions = TTLCache(maxsize=10, ttl=3600)
+        drive.profiles = TTLCache(maxsize=10, ttl=300)
+        drive.api_endpoint = f"{server.url}/"
+        token = drive._encrypt_token({
+            'token': 'token', 'refresh_token': 'refresh', 'token_uri': f"{server.url}/token",
+            'client_id': 'id', 'client_secret': 'secret', 'scopes': drive.SCOPES,
+            'expiry': (datetime.utcnow() + timedelta(hours=1)).isoformat()
+        })
+        profile = {"id": "u1", "google_drive_connected": True, "google_drive_token": token}
+        server.routes[('GET', 'users')] = lambda params, body: (200, [profile])
+        for file_id in file_ids:
+            server.routes[('GET', f'files/{file_id}')] = lambda params, body, file_id=file_id: (
+                200, {"id": file_id, "name": f"{file_id}.pdf"}
+            )
+            server.routes[('DELETE', f'files/{file_id}')] = lambda params, body: (204, None)
+        drive._get_drive_files("u1")
+        server.latency = args.latency_ms / 1000
+
+        cases = (
+            ("get_file_info x N", lambda: [drive.get_file_info("u1", f) for f in file_ids]),
+            ("get_files_info", lambda: drive.get_files_info("u1", file_ids)),
+            ("delete_file x N", lambda: [drive.delete_file("u1", f) for f in file_ids]),
+            ("delete_files", lambda: drive.delete_files("u1", file_ids)),
+        )
+        print(f"{args.files} archivos, latencia {args.latency_ms:.0f} ms por solicitud HTTP")
+        print(f"{'operación':>18} {'solicitudes HTTP':>17} {'tiempo':>9}")
+        for name, fn in cases:
+            server.reset()
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            round_trips = server.count('POST', 'batch/drive/v3') or len(server.requests)
+            print(f"{name:>18} {round_trips:>17} {elapsed * 1000:>7.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: descargas repetidas de un mismo archivo de Drive sin y con caché local
+
+Simula ver o reprocesar varias veces el mismo documento. Sin caché cada vez
+se descarga el archivo completo; con DriveBlobCache solo se consulta
+modifiedTime y el contenido se copia desde disco. Drive se simula con
+StubServer y una latencia configurable por solicitud.
+
+Uso:
+    python benchmarks/bench_drive_blob_cache.py [--size-mb 20] [--latency-ms 30] [--repeats 5]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from cryptography.fernet import Fernet
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ttl_cache import TTLCache
+from supabase_client import SupabaseClient
+from drive_blob_cache import DriveBlobCache
+from google_drive_service import GoogleDriveService
+from benchmarks.stub_server import StubServer
+
+logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.WARNING)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=20)
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    content = os.urandom(int(args.size_mb * 1024 * 1024))
+    file_info = {"id": "f1", "size": str(len(content)), "modifiedTime": "2024-05-01T10:00:00.000Z"}
+
+    with StubServer() as server, tempfile.TemporaryDirectory() as workdir:
+        drive = GoogleDriveService(server.url, 'test-key', Fernet.generate_key().decode(),
+                                   supabase_client=SupabaseClient(server.url, 'test-key'))
+        drive.sessions = TTLCache(maxsize=10, ttl=3600)
+        drive.profiles = TTLCache(maxsize=10, ttl=300)
+        drive.api_endpoint = f"{server.url}/"
+        token = drive._encrypt_token({
+            'token': 'token', 'refresh_token': 'refresh', 'token_uri': f"{server.url}/token",
+            'client_id': 'id', 'client_secret': 'secret', 'scopes': drive.SCOPES,
+            'expiry': (datetime.utcnow() + timedelta(hours=1)).isoformat()
+        })
+        profile = {"id": "u1", "google_drive_connected": True, "google_drive_token": token}
+        server.routes[('GET', 'users')] = lambda params, body: (200, [profile])
+        server.routes[('GET', 'files/f1')] = lambda params, body: (
+            (200, content) if params.get('alt') == 'media' else (200, file_info)
+        )
+        drive._get_drive_files("u1")
+        server.latency = args.latency_ms / 1000
+        target = os.path.join(workdir, 'documento.bin')
+
+        def run(cache):
+            drive.blob_cache = cache
+            server.reset()
+            times = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                drive.download_to("u1", "f1", target)
+                times.append((time.perf_counter() - start) * 1000)
+            return times, len(server.requests)
+
+        plain, plain_requests = run(None)
+        cached, cached_requests = run(DriveBlobCache(os.path.join(workdir, 'blobs'), max_bytes=len(content) * 2))
+
+    print(f"archivo de {args.size_mb:.0f} MB, {args.repeats} descargas, latencia {args.latency_ms:.0f} ms")
+    print(f"{'camino':>18} {'primera':>9} {'siguientes':>11} {'solicitudes':>12}")
+    for name, times, requests in (("sin caché", plain, plain_requests), ("caché local", cached, cached_requests)):
+        rest = sum(times[1:]) / max(len(times) - 1, 1)
+        print(f"{name:>18} {times[0]:>7.0f}ms {rest:>9.0f}ms {requests:>12}")
+
+
+if __name__ == '__main__':
+    main()
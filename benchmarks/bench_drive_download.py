@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pico de memoria al descargar un archivo de Drive a disco
+
+Compara el camino anterior de create_document_from_drive_file
+(download_file a bytes en memoria y luego escritura en un archivo temporal)
+con download_to, que escribe cada bloque al archivo antes de pedir el
+siguiente. Drive se simula con StubServer (en el mismo proceso, así que
+tracemalloc también cuenta el bloque que prepara el servidor).
+
+Uso:
+    python benchmarks/bench_drive_download.py [--size-mb 40] [--chunk-mb 4]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+from cryptography.fernet import Fernet
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ttl_cache import TTLCache
+from supabase_client import SupabaseClient
+from google_drive_service import GoogleDriveService
+from benchmarks.stub_server import StubServer
+
+logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.WARNING)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=40)
+    parser.add_argument('--chunk-mb', type=float, default=4)
+    args = parser.parse_args()
+
+    content = os.urandom(int(args.size_mb * 1024 * 1024))
+
+    with StubServer() as server:
+        drive = GoogleDriveService(server.url, 'test-key', Fernet.generate_key().decode(),
+                                   supabase_client=SupabaseClient(server.url, 'test-key'))
+        drive.sessions = TTLCache(maxsize=10, ttl=3600)
+        drive.profiles = TTLCache(maxsize=10, ttl=300)
+        drive.api_endpoint = f"{server.url}/"
+        drive.download_chunk_size = int(args.chunk_mb * 1024 * 1024)
+        # Se mide la descarga desde Drive, no la copia desde la caché local
+        drive.blob_cache = None
+        token = drive._encrypt_token({
+            'token': 'token', 'refresh_token': 'refresh', 'token_uri': f"{server.url}/token",
+            'client_id': 'id', 'client_secret': 'secret', 'scopes': drive.SCOPES,
+            'expiry': (datetime.utcnow() + timedelta(hours=1)).isoformat()
+        })
+        profile = {"id": "u1", "google_drive_connected": True, "google_drive_token": token}
+        server.routes[('GET', 'users')] = lambda params, body: (200, [profile])
+        server.routes[('GET', 'files/f1')] = lambda params, body: (200, content)
+        drive._get_drive_files("u1")
+
+        def buffered():
+            data = drive.download_file("u1", "f1")
+            with tempfile.NamedTemporaryFile(delete=False) as f:
+                f.write(data)
+            os.unlink(f.name)
+
+        def streamed():
+            fd, path = tempfile.mkstemp()
+            os.close(fd)
+            drive.download_to("u1", "f1", path)
+            os.unlink(path)
+
+        print(f"archivo de {args.size_mb:.0f} MB, bloques de {args.chunk_mb:.0f} MB")
+        print(f"{'camino':>32} {'pico':>10} {'tiempo':>9}")
+        for name, fn in (("download_file + archivo temporal", buffered), ("download_to (por bloques)", streamed)):
+            peak, elapsed = measure(fn)
+            print(f"{name:>32} {peak / 2**20:>8.1f}MB {elapsed * 1000:>7.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
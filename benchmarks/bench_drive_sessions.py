@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: preparación de una llamada a Drive sin caché vs con sesión en caché
+
+Sin caché cada método de GoogleDriveService consultaba el usuario en
+Supabase, descifraba el token y construía el cliente con build() antes de
+hacer la llamada real. Con la caché de sesiones eso ocurre una vez por
+usuario y vencimiento de token. Supabase se simula con StubServer y una
+latencia configurable; no se hace ninguna llamada a Google.
+
+Uso:
+    python benchmarks/bench_drive_sessions.py [--latency-ms 50] [--calls 50]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from cryptography.fernet import Fernet
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from googleapiclient.discovery import build
+
+from ttl_cache import TTLCache
+from supabase_client import SupabaseClient
+from google_drive_service import GoogleDriveService
+from benchmarks.stub_server import StubServer
+
+
+# build() registra en INFO cada vez que no puede usar file_cache
+logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.WARNING)
+
+
+def timed(fn, calls):
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--calls', type=int, default=50)
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency_ms / 1000) as server:
+        service = GoogleDriveService(server.url, 'test-key', Fernet.generate_key().decode(),
+                                     supabase_client=SupabaseClient(server.url, 'test-key'))
+        service.sessions = TTLCache(maxsize=10, ttl=3600)
+        token = service._encrypt_token({
+            'token': 'token', 'refresh_token': 'refresh', 'token_uri': f"{server.url}/token",
+            'client_id': 'id', 'client_secret': 'secret', 'scopes': GoogleDriveService.SCOPES,
+            'expiry': (datetime.utcnow() + timedelta(hours=1)).isoformat()
+        })
+        profile = {"id": "u1", "google_drive_connected": True, "google_drive_token": token}
+        server.routes[('GET', 'users')] = lambda params, body: (200, [profile])
+
+        def legacy():
+            creds = service._get_user_credentials("u1")
+            build('drive', 'v3', credentials=creds).files()
+
+        def cold():
+            service.invalidate_drive_session("u1")
+            service._get_drive_files("u1")
+
+        legacy_us = timed(legacy, args.calls)
+        cold_us = timed(cold, args.calls)
+        service._get_drive_files("u1")
+        warm_us = timed(lambda: service._get_drive_files("u1"), args.calls * 100)
+
+    print(f"latencia simulada de Supabase: {args.latency_ms:.0f} ms")
+    print(f"{'ruta':>34} {'µs/llamada':>12}")
+    print(f"{'sin caché (usuario + build + files)':>34} {legacy_us:>12.0f}")
+    print(f"{'sesión nueva (primera llamada)':>34} {cold_us:>12.0f}")
+    print(f"{'sesión en caché':>34} {warm_us:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memoria y serialización de embeddings como List[float] vs Embedding
+
+Mide con tracemalloc la memoria de N embeddings guardados como listas de
+floats de Python (lo que devolvía .tolist()) y como Embedding (float32), y
+el tiempo de validar y serializar cada uno para PostgREST: json.dumps de la
+lista frente al texto pgvector de Embedding.to_pgvector().
+
+Uso:
+    python benchmarks/bench_embedding_memory.py [--count 10000] [--dim 384]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_search import Embedding
+
+
+def measure_memory(factory):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    values = factory()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return values, after - before
+
+
+def legacy_validate(embedding, dimension):
+    if not isinstance(embedding, list) or len(embedding) != dimension:
+        return False
+    for value in embedding:
+        if not isinstance(value, (int, float)) or np.isnan(value) or np.isinf(value):
+            return False
+    return True
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) * 1e6 / len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--dim', type=int, default=384)
+    args = parser.parse_args()
+
+    # Salida típica de encode() en lote: una matriz float32
+    batch = np.random.default_rng(0).normal(scale=0.05, size=(args.count, args.dim)).astype(np.float32)
+
+    lists, list_bytes = measure_memory(lambda: [row.tolist() for row in batch])
+    embeddings, embedding_bytes = measure_memory(lambda: [Embedding(row.copy()) for row in batch])
+
+    print(f"{args.count} embeddings de dimensión {args.dim}")
+    print(f"{'representación':>16} {'memoria':>10} {'bytes/emb':>10}")
+    print(f"{'List[float]':>16} {list_bytes / 2**20:>8.1f}MB {list_bytes / args.count:>10.0f}")
+    print(f"{'Embedding':>16} {embedding_bytes / 2**20:>8.1f}MB {embedding_bytes / args.count:>10.0f}")
+    print(f"reducción: {list_bytes / embedding_bytes:.1f}x")
+
+    sample = min(args.count, 2000)
+    json_text = [json.dumps(values) for values in lists[:sample]]
+    pgvector_text = [embedding.to_pgvector() for embedding in embeddings[:sample]]
+
+    print()
+    print(f"{'operación':>28} {'µs/emb':>8} {'caracteres':>11}")
+    print(f"{'validar (bucle Python)':>28} {timed(lambda e: legacy_validate(e, args.dim), lists[:sample]):>8.1f}")
+    print(f"{'validar (Embedding)':>28} {timed(lambda e: e.is_valid(args.dim), embeddings[:sample]):>8.1f}")
+    print(f"{'json.dumps(List[float])':>28} {timed(json.dumps, lists[:sample]):>8.1f} "
+          f"{sum(map(len, json_text)) / sample:>11.0f}")
+    print(f"{'Embedding.to_pgvector()':>28} {timed(Embedding.to_pgvector, embeddings[:sample]):>8.1f} "
+          f"{sum(map(len, pgvector_text)) / sample:>11.0f}")
+    print(f"{'Embedding.from_pgvector()':>28} {timed(Embedding.from_pgvector, pgvector_text):>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
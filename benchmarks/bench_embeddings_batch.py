@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chunks por segundo con generate_embedding vs generate_embeddings_batch
+
+Genera chunks sintéticos del tamaño que produce process_file_for_search y
+mide el rendimiento del modelo local codificando uno a uno frente a lotes
+de distintos tamaños.
+
+Uso:
+    python benchmarks/bench_embeddings_batch.py [--chunks 256] [--batch-sizes 1,8,32,64,128]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings_service import EmbeddingsService
+
+WORDS = ("documento grupo usuario archivo contenido búsqueda vector modelo texto "
+         "consulta plan almacenamiento drive telegram respuesta contexto").split()
+
+
+def make_chunks(count: int, chunk_size: int, seed: int = 0):
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        text = ""
+        while len(text) < chunk_size:
+            text += rng.choice(WORDS) + " "
+        chunks.append(text[:chunk_size])
+    return chunks
+
+
+def measure(label: str, fn, count: int):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    print(f"{label:<24} {elapsed:8.2f} s   {rate:8.1f} chunks/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=256)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--batch-sizes', default='1,8,32,64,128')
+    parser.add_argument('--model', default=os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))
+    args = parser.parse_args()
+
+    service = EmbeddingsService(model_name=args.model)
+    chunks = make_chunks(args.chunks, args.chunk_size)
+
+    # Calentar el modelo para no medir la primera inicialización
+    service.generate_embeddings_batch(chunks[:8])
+
+    print(f"{args.chunks} chunks de {args.chunk_size} caracteres, modelo {args.model}\n")
+    baseline = measure('generate_embedding (1x1)', lambda: [service.generate_embedding(c) for c in chunks], args.chunks)
+    for batch_size in (int(b) for b in args.batch_sizes.split(',')):
+        rate = measure(
+            f'batch_size={batch_size}',
+            lambda: service.generate_embeddings_batch(chunks, batch_size=batch_size),
+            args.chunks
+        )
+        print(f"{'':<24} {rate / baseline:8.1f}x respecto a uno a uno")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: OCR de fotos de móvil a resolución completa vs preprocesadas
+
+Genera un conjunto de fotos tipo móvil (JPEG 4032x3024 con texto, algunas
+con orientación EXIF vertical) y compara por foto:
+  - original: Image.open + decodificación completa en RGB, como hacía
+    _extract_text_from_image antes de llamar a tesseract
+  - preprocesado: OCREngine.prepare (decodificación JPEG reducida en modo
+    draft, escala de grises, orientación EXIF y reducción a max_side)
+  - caché: segunda lectura de la misma foto con OCREngine.ocr_file
+Si tesseract está instalado también mide el reconocimiento de cada variante.
+
+Uso:
+    python benchmarks/bench_ocr.py [--photos 10] [--max-side 2000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+from PIL import Image, ImageDraw
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytesseract
+
+from embedding_cache import EmbeddingCache
+from ocr import OCREngine
+
+
+def make_photos(directory, count, size=(4032, 3024)):
+    paths = []
+    for i in range(count):
+        # Texto escrito a baja resolución y ampliado: trazos gruesos como en una foto
+        small = Image.new('RGB', (size[0] // 8, size[1] // 8), (235, 230, 220))
+        draw = ImageDraw.Draw(small)
+        for line in range(20):
+            draw.text((20, 20 + line * 18), f"Factura F-2024-{i:04d} linea {line} total 1.234,56 EUR",
+                      fill=(30, 30, 30))
+        photo = small.resize(size, Image.Resampling.BILINEAR)
+        exif = Image.Exif()
+        if i % 2:
+            exif[0x0112] = 6
+        path = os.path.join(directory, f"photo_{i}.jpg")
+        photo.save(path, 'JPEG', quality=92, exif=exif.tobytes())
+        paths.append(path)
+    return paths
+
+
+def timed(fn, paths):
+    times = []
+    for path in paths:
+        start = time.perf_counter()
+        fn(path)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def original(path):
+    with Image.open(path) as image:
+        image.load()
+        return image.convert('RGB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--photos', type=int, default=10)
+    parser.add_argument('--max-side', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_photos(directory, args.photos)
+        cache = EmbeddingCache(os.path.join(directory, 'cache.sqlite3'))
+        engine = OCREngine(max_side=args.max_side, cache=cache)
+
+        def prepared(path):
+            with Image.open(path) as image:
+                return engine.prepare(image)
+
+        sample_original = original(paths[0])
+        sample_prepared = prepared(paths[0])
+        print(f"{args.photos} fotos {sample_original.width}x{sample_original.height}")
+        print(f"{'etapa':>28} {'ms/foto':>9} {'píxeles':>12} {'bytes':>12}")
+        print(f"{'original (RGB completo)':>28} {timed(original, paths):>9.1f} "
+              f"{sample_original.width * sample_original.height:>12} "
+              f"{len(sample_original.tobytes()):>12}")
+        print(f"{'preprocesado (gris, draft)':>28} {timed(prepared, paths):>9.1f} "
+              f"{sample_prepared.width * sample_prepared.height:>12} "
+              f"{len(sample_prepared.tobytes()):>12}")
+
+        if not engine.available:
+            print("tesseract no instalado: se omite el reconocimiento")
+            return
+
+        full_ms = timed(lambda path: pytesseract.image_to_string(original(path), lang=engine.lang), paths)
+        ocr_ms = timed(engine.ocr_file, paths)
+        cached_ms = timed(engine.ocr_file, paths)
+        print(f"{'OCR original':>28} {full_ms:>9.1f}")
+        print(f"{'OCR preprocesado':>28} {ocr_ms:>9.1f}")
+        print(f"{'OCR desde caché':>28} {cached_ms:>9.1f}")
+        print(engine.stats())
+
+
+if __name__ == '__main__':
+    main()
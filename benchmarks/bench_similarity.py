@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: find_similar_documents documento a documento vs vectorizado
+
+Compara la implementación anterior (np.array y normas por documento, copia
+de cada coincidencia y orden completo) con la matriz float32 normalizada,
+un solo producto matricial y argpartition. Se mide también la búsqueda con
+la matriz ya construida, que es el coste cuando se reutiliza un índice.
+
+Uso:
+    python benchmarks/bench_similarity.py [--sizes 100,10000,100000] [--dim 384]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_search import build_embedding_matrix, top_k_similar
+
+
+def legacy_find_similar(query, documents, threshold, limit):
+    results = []
+    for doc in documents:
+        vec1, vec2 = np.array(query), np.array(doc['embedding'])
+        norm1, norm2 = np.linalg.norm(vec1), np.linalg.norm(vec2)
+        similarity = 0.0 if norm1 == 0 or norm2 == 0 else max(0.0, min(1.0, float(np.dot(vec1, vec2) / (norm1 * norm2))))
+        if similarity >= threshold:
+            doc_result = doc.copy()
+            doc_result['similarity'] = similarity
+            results.append(doc_result)
+    results.sort(key=lambda x: x['similarity'], reverse=True)
+    return results[:limit]
+
+
+def vectorized_find_similar(query, documents, threshold, limit):
+    matrix, positions = build_embedding_matrix([doc['embedding'] for doc in documents], len(query))
+    results = []
+    for row, similarity in top_k_similar(query, matrix, threshold, limit):
+        doc_result = documents[positions[row]].copy()
+        doc_result['similarity'] = similarity
+        results.append(doc_result)
+    return results
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,10000,100000')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--threshold', type=float, default=0.0)
+    parser.add_argument('--limit', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    query = rng.normal(size=args.dim).tolist()
+
+    print(f"{'documentos':>10} {'anterior':>12} {'vectorizado':>12} {'solo búsqueda':>14} {'aceleración':>12}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        documents = [{'id': i, 'embedding': row} for i, row in enumerate(rng.normal(size=(size, args.dim)).tolist())]
+        matrix, _ = build_embedding_matrix([doc['embedding'] for doc in documents])
+        repeat = 3 if size <= 10000 else 1
+
+        legacy_ms = timed(lambda: legacy_find_similar(query, documents, args.threshold, args.limit), repeat)
+        vector_ms = timed(lambda: vectorized_find_similar(query, documents, args.threshold, args.limit), repeat)
+        search_ms = timed(lambda: top_k_similar(query, matrix, args.threshold, args.limit), max(repeat, 5))
+
+        print(f"{size:>10} {legacy_ms:>10.2f}ms {vector_ms:>10.2f}ms {search_ms:>12.3f}ms {legacy_ms / vector_ms:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tiempo de arranque y memoria (RSS) con carga del modelo ansiosa vs perezosa
+
+Cada modo se ejecuta en un proceso nuevo que crea tantas UserDatabase como
+el despliegue real (bot + interfaz web). El modo "eager" reproduce el
+comportamiento anterior: un EmbeddingsService propio por instancia con el
+modelo cargado en el constructor. El modo "lazy" usa el servicio compartido
+y no carga el modelo hasta el primer embedding; "lazy+encode" añade ese
+primer embedding para medir el coste diferido.
+
+Uso:
+    python benchmarks/bench_startup.py [--instances 3]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import sys, time, json, resource
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import database
+from database import UserDatabase
+dbs = [UserDatabase(db_file='/tmp/bench_startup_users.json') for _ in range({instances})]
+if database.EMBEDDINGS_AVAILABLE:
+    if {mode!r} == 'eager':
+        from embeddings_service import EmbeddingsService
+        services = [EmbeddingsService(model_name=db.embeddings_service.model_name) for db in dbs]
+        for service in services:
+            service.model
+    elif {mode!r} == 'lazy+encode':
+        dbs[0].embeddings_service.generate_embedding("hola")
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': elapsed,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'embeddings': database.EMBEDDINGS_AVAILABLE
+}}))
+'''
+
+
+def run(mode: str, instances: int) -> dict:
+    code = CHILD.format(root=ROOT, instances=instances, mode=mode)
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.instances} instancias de UserDatabase por proceso\n")
+    for mode in ('eager', 'lazy', 'lazy+encode'):
+        result = run(mode, args.instances)
+        print(f"{mode:<12} {result['seconds']:7.2f} s   RSS máx {result['rss_mb']:8.1f} MB")
+        if not result['embeddings']:
+            print("\nsentence-transformers no está instalado: los modos miden solo el resto del arranque")
+            break
+
+
+if __name__ == '__main__':
+    main()
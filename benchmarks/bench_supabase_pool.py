@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latencia por subida con requests sin sesión vs SupabaseClient
+
+Reproduce la secuencia de llamadas REST que dispara una subida desde
+Telegram contra un servidor local que añade un retardo por conexión nueva
+(simulando el handshake TCP+TLS hacia Supabase).
+
+Uso:
+    python benchmarks/bench_supabase_pool.py [--uploads 20] [--connect-delay 0.03]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase_client import SupabaseClient
+from benchmarks.stub_server import StubServer
+
+# Llamadas REST de una subida típica (check_user_plan, grupo personal,
+# upload_and_vectorize_file, add_group_content, update_group_storage)
+UPLOAD_CALLS = [
+    ('GET', 'users'), ('GET', 'plans'),
+    ('GET', 'users'), ('GET', 'groups'),
+    ('GET', 'users'),
+    ('GET', 'group_members'), ('GET', 'users'),
+    ('POST', 'documents'), ('POST', 'group_documents'),
+    ('GET', 'group_members'), ('POST', 'group_contents'),
+    ('GET', 'groups'), ('PATCH', 'groups'),
+    ('GET', 'groups'), ('PATCH', 'groups'),
+]
+
+
+def run_unpooled(base_url: str, headers: dict):
+    for method, resource in UPLOAD_CALLS:
+        requests.request(method, f"{base_url}/rest/v1/{resource}", headers=headers, json={} if method != 'GET' else None)
+
+
+def run_pooled(client: SupabaseClient):
+    for method, resource in UPLOAD_CALLS:
+        client.request(method, resource, json={} if method != 'GET' else None)
+
+
+def measure(label: str, server: StubServer, fn, uploads: int):
+    server.reset()
+    start = time.perf_counter()
+    for _ in range(uploads):
+        fn()
+    elapsed = time.perf_counter() - start
+    per_upload_ms = elapsed / uploads * 1000
+    print(f"{label:<22} {per_upload_ms:8.1f} ms/subida   conexiones={server.connections:4d}   solicitudes={len(server.requests)}")
+    return per_upload_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=20)
+    parser.add_argument('--connect-delay', type=float, default=0.03,
+                        help='segundos añadidos por conexión nueva (handshake simulado)')
+    args = parser.parse_args()
+
+    with StubServer(connect_delay=args.connect_delay) as server:
+        client = SupabaseClient(server.url, 'bench-key')
+        headers = client.get_headers()
+
+        print(f"{len(UPLOAD_CALLS)} llamadas REST por subida, retardo por conexión {args.connect_delay * 1000:.0f} ms\n")
+        unpooled = measure('requests.* sin sesión', server, lambda: run_unpooled(server.url, headers), args.uploads)
+        pooled = measure('SupabaseClient (pool)', server, lambda: run_pooled(client), args.uploads)
+        client.close()
+
+    print(f"\nAhorro: {unpooled - pooled:.1f} ms por subida ({unpooled / pooled:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
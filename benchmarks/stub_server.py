@@ -0,0 +1,193 @@
+"""
+Servidor HTTP local que imita la API REST de Supabase (PostgREST)
+
+Se usa en benchmarks y pruebas para contar solicitudes y conexiones sin
+depender de un proyecto real de Supabase. Los handlers que devuelven bytes
+se sirven como contenido binario respetando la cabecera Range (como las
+descargas de Google Drive). Un POST multipart/mixed se trata como un lote
+de Drive (salvo que tenga ruta propia): cada parte se despacha a su ruta y
+se registra como solicitud.
+"""
+
+import re
+import json
+import time
+import threading
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+from http.client import responses
+
+# Un handler recibe (params, body) y devuelve (status, payload)
+RouteHandler = Callable[[Dict[str, str], Optional[object]], Tuple[int, object]]
+
+
+class StubServer:
+    """Servidor PostgREST falso con rutas configurables"""
+
+    def __init__(self, routes: Dict[Tuple[str, str], RouteHandler] = None,
+                 connect_delay: float = 0.0, latency: float = 0.0):
+        """
+        Args:
+            routes: Mapa (método, recurso) -> handler; el recurso es la ruta tras /rest/v1/
+            connect_delay: Segundos de espera al abrir cada conexión (simula TCP+TLS)
+            latency: Segundos de espera por solicitud (simula el trabajo del servidor)
+        """
+        self.routes = routes or {}
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.requests: List[Tuple[str, str, Dict[str, str]]] = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, method: str = None, resource: str = None) -> int:
+        """Contar solicitudes recibidas, opcionalmente filtradas"""
+        return sum(
+            1 for m, r, _ in self.requests
+            if (method is None or m == method) and (resource is None or r == resource)
+        )
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.connections = 0
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+                if stub.connect_delay:
+                    time.sleep(stub.connect_delay)
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                parts = urlsplit(self.path)
+                resource = parts.path.split('/rest/v1/', 1)[-1].lstrip('/')
+                params = dict(parse_qsl(parts.query, keep_blank_values=True))
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('multipart/mixed') and (self.command, resource) not in stub.routes:
+                    return self._batch(resource, params, content_type, raw)
+                if raw and content_type.startswith('application/x-www-form-urlencoded'):
+                    # Formularios como el del endpoint de tokens OAuth
+                    body = dict(parse_qsl(raw.decode()))
+                elif raw and content_type.startswith('multipart/'):
+                    body = raw
+                else:
+                    body = json.loads(raw) if raw else None
+
+                with stub._lock:
+                    stub.requests.append((self.command, resource, params))
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                status, payload = self._dispatch(self.command, resource, params, body)
+
+                headers = {'Content-Type': 'application/json'}
+                if isinstance(payload, bytes):
+                    status, data, headers = self._binary(status, payload)
+                else:
+                    data = b'' if payload is None else json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                if data:
+                    self.wfile.write(data)
+
+            def _dispatch(self, method, resource, params, body):
+                handler = stub.routes.get((method, resource))
+                if handler is None:
+                    return (200, []) if method == 'GET' else (201, [])
+                return handler(params, body)
+
+            def _batch(self, resource, params, content_type, raw):
+                """Responder un lote de Drive (multipart/mixed de solicitudes HTTP)"""
+                with stub._lock:
+                    stub.requests.append(('POST', resource, params))
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                message = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n{raw.decode()}")
+                boundary = 'stub_batch_boundary'
+                parts = []
+                for part in message.get_payload():
+                    request_line, _, rest = part.get_payload().partition('\n')
+                    method, target, _ = request_line.split(' ', 2)
+                    inner = Parser().parsestr(rest)
+                    inner_parts = urlsplit(target)
+                    inner_resource = inner_parts.path.lstrip('/')
+                    inner_params = dict(parse_qsl(inner_parts.query, keep_blank_values=True))
+                    inner_body = inner.get_payload()
+                    with stub._lock:
+                        stub.requests.append((method, inner_resource, inner_params))
+                    status, payload = self._dispatch(method, inner_resource, inner_params,
+                                                     json.loads(inner_body) if inner_body else None)
+                    data = '' if payload is None else json.dumps(payload)
+                    content_id = part['Content-ID']
+                    parts.append(
+                        f"--{boundary}\r\nContent-Type: application/http\r\n"
+                        f"Content-ID: <response-{content_id[1:]}\r\n\r\n"
+                        f"HTTP/1.1 {status} {responses.get(status, '')}\r\n"
+                        f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n{data}\r\n"
+                    )
+                data = (''.join(parts) + f"--{boundary}--\r\n").encode()
+
+                self.send_response(200)
+                self.send_header('Content-Type', f'multipart/mixed; boundary={boundary}')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _binary(self, status, payload):
+                headers = {'Content-Type': 'application/octet-stream'}
+                match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+                if status != 200 or match is None:
+                    return status, payload, headers
+
+                start = int(match.group(1))
+                if start >= len(payload):
+                    headers['Content-Range'] = f"bytes */{len(payload)}"
+                    return 416, b'', headers
+                end = min(int(match.group(2)) if match.group(2) else len(payload) - 1, len(payload) - 1)
+                headers['Content-Range'] = f"bytes {start}-{end}/{len(payload)}"
+                return 206, payload[start:end + 1], headers
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+        return Handler
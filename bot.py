@@ -4,7 +4,8 @@ from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 from database import UserDatabase
-import requests
+from async_database import AsyncUserDatabase
+import httpx
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters, ConversationHandler
 import json
@@ -32,11 +33,8 @@ LANDING_PAGE_URL = os.getenv('LANDING_PAGE_URL', 'http://localhost:5000/plans')
 # Inicializar la base de datos
 db = UserDatabase()
 
-# Obtener token del bot
-TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-
-# Inicializar la base de datos
-db = UserDatabase()
+# Capa asíncrona usada por los handlers (no bloquea el event loop)
+adb = AsyncUserDatabase(sync_db=db)
 
 
 # Estados para el flujo de conversación de login
@@ -66,7 +64,7 @@ async def password_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = update.effective_user.id
     
     # Intentar iniciar sesión
-    success, message = db.login_telegram_user(telegram_id, email, password)
+    success, message = await adb.login_telegram_user(telegram_id, email, password)
     
     if success:
         await update.message.reply_text(
@@ -105,7 +103,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         doc_id = query.data.replace("select_doc_", "")
         
         # Obtener información del documento
-        success, doc_info = db.get_document_info(doc_id)
+        success, doc_info = await adb.get_document_info(doc_id)
         
         if success:
             doc_name = doc_info.get('title', doc_info.get('filename', 'Documento'))
@@ -148,7 +146,7 @@ async def group_documents_command(update: Update, context: ContextTypes.DEFAULT_
     user_id = update.effective_user.id
     
     # Verificar plan del usuario
-    user_plan = check_user_plan(user_id)
+    user_plan = await adb.check_user_plan(user_id)
     if not user_plan['active']:
         keyboard = [[InlineKeyboardButton("🛒 Ver planes de almacenamiento", url=LANDING_PAGE_URL)]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -158,8 +156,14 @@ async def group_documents_command(update: Update, context: ContextTypes.DEFAULT_
         )
         return
 
-    # Obtener documentos del grupo usando get_group_contents
-    success, contents = db.get_group_contents(group_id, user_id)
+    # Obtener documentos del grupo personal usando get_group_contents
+    user_uuid = await adb.get_user_uuid(user_id)
+    group_id = await adb.get_or_create_personal_group(user_id)
+    if not user_uuid or not group_id:
+        await update.message.reply_text("Error al acceder a tu grupo personal. Por favor, intenta de nuevo.")
+        return
+
+    success, contents = await adb.get_group_contents(group_id, user_uuid)
     
     if not success or not contents:
         await update.message.reply_text(
@@ -218,9 +222,9 @@ async def handle_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL')
-        response = requests.post(n8n_webhook_url, json=payload)
+        response = await adb.post_webhook(n8n_webhook_url, payload)
         
-        if response.status_code != 200:
+        if response is None or response.status_code != 200:
             await update.message.reply_text(
                 "Hubo un problema al procesar tu pregunta. Por favor, intenta de nuevo."
             )
@@ -244,7 +248,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }
     
     # Guardar automáticamente al usuario que inicia el bot
-    db.add_user(user.id, user_data)
+    await adb.add_user(user.id, user_data)
     
     # Crear botones para la landing page y registro
     keyboard = [
@@ -268,7 +272,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     
     # Verificar si el usuario tiene un plan activo y espacio disponible
-    user_plan = check_user_plan(user_id)
+    user_plan = await adb.check_user_plan(user_id)
     if not user_plan['active']:
         keyboard = [
             [InlineKeyboardButton("🛒 Ver planes de almacenamiento", url=LANDING_PAGE_URL)]
@@ -299,7 +303,6 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Descargar el archivo temporalmente
     import tempfile
     import os
-    import requests
     from io import BytesIO
     
     # Crear un archivo temporal
@@ -321,30 +324,17 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 content_type = 'image'
             
             # Obtener o crear un grupo personal para el usuario
-            group_id = get_or_create_personal_group(user_id)
+            group_id = await adb.get_or_create_personal_group(user_id)
             if not group_id:
                 await update.message.reply_text("Error al crear grupo personal. Por favor, intenta de nuevo.")
                 return
             
             # Obtener el UUID del usuario desde la base de datos
-            headers = {
-                "apikey": SUPABASE_KEY,
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            user_uuid = await adb.get_user_uuid(user_id)
+            if not user_uuid:
                 await update.message.reply_text("Error al obtener información del usuario. Por favor, intenta de nuevo.")
                 return
             
-            user_uuid = user_response.json()[0]['id']
-            
             # Crear un objeto similar a un archivo de Flask para la función upload_and_vectorize_file
             from types import SimpleNamespace
             file_obj = SimpleNamespace()
@@ -353,7 +343,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             file_obj.seek = lambda x: f.seek(x)
             
             # Vectorizar el archivo usando el UUID del usuario
-            success, result = db.upload_and_vectorize_file(group_id, user_uuid, file_obj, content_type)
+            success, result = await adb.upload_and_vectorize_file(group_id, user_uuid, file_obj, content_type)
             
             if success:
                 # Notificar al usuario
@@ -370,7 +360,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 }
                 
                 n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL')
-                requests.post(n8n_webhook_url, json=payload)
+                await adb.post_webhook(n8n_webhook_url, payload)
             else:
                 await update.message.reply_text(f"Error al procesar el archivo: {result}")
     except Exception as e:
@@ -387,7 +377,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     
     # Verificar si el usuario tiene un plan activo y espacio disponible
-    user_plan = check_user_plan(user_id)
+    user_plan = await adb.check_user_plan(user_id)
     if not user_plan['active']:
         keyboard = [
             [InlineKeyboardButton("🛒 Ver planes de almacenamiento", url=LANDING_PAGE_URL)]
@@ -420,7 +410,6 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Descargar el archivo temporalmente
     import tempfile
     import os
-    import requests
     from io import BytesIO
     
     # Crear un archivo temporal
@@ -435,30 +424,17 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Abrir el archivo para procesarlo
         with open(temp_file_path, 'rb') as f:
             # Obtener o crear un grupo personal para el usuario
-            group_id = get_or_create_personal_group(user_id)
+            group_id = await adb.get_or_create_personal_group(user_id)
             if not group_id:
                 await update.message.reply_text("Error al crear grupo personal. Por favor, intenta de nuevo.")
                 return
             
             # Obtener el UUID del usuario desde la base de datos
-            headers = {
-                "apikey": SUPABASE_KEY,
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            user_uuid = await adb.get_user_uuid(user_id)
+            if not user_uuid:
                 await update.message.reply_text("Error al obtener información del usuario. Por favor, intenta de nuevo.")
                 return
             
-            user_uuid = user_response.json()[0]['id']
-            
             # Crear un objeto similar a un archivo de Flask para la función upload_and_vectorize_file
             from types import SimpleNamespace
             file_obj = SimpleNamespace()
@@ -467,7 +443,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             file_obj.seek = lambda x: f.seek(x)
             
             # Vectorizar el archivo usando el UUID del usuario
-            success, result = db.upload_and_vectorize_file(group_id, user_uuid, file_obj, 'image')
+            success, result = await adb.upload_and_vectorize_file(group_id, user_uuid, file_obj, 'image')
             
             if success:
                 # Notificar al usuario
@@ -484,7 +460,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 }
                 
                 n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL')
-                requests.post(n8n_webhook_url, json=payload)
+                await adb.post_webhook(n8n_webhook_url, payload)
             else:
                 await update.message.reply_text(f"Error al procesar la imagen: {result}")
     except Exception as e:
@@ -500,7 +476,7 @@ async def my_documents_command(update: Update, context: ContextTypes.DEFAULT_TYP
     user_id = update.effective_user.id
     
     # Verificar plan del usuario
-    user_plan = check_user_plan(user_id)
+    user_plan = await adb.check_user_plan(user_id)
     if not user_plan:
         keyboard = [[InlineKeyboardButton("Ver Planes", url="https://tu-dominio.com/plans")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -511,7 +487,7 @@ async def my_documents_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     
     # Obtener documentos del usuario
-    success, documents = db.get_user_documents(user_id)
+    success, documents = await adb.get_user_documents(user_id)
     
     if not success or not documents:
         await update.message.reply_text(
@@ -560,7 +536,7 @@ async def document_selection_callback(update: Update, context: ContextTypes.DEFA
         context.user_data['selected_document'] = doc_id
         
         # Obtener información del documento
-        success, doc_info = db.get_document_info(doc_id)
+        success, doc_info = await adb.get_document_info(doc_id)
         
         if success:
             doc_name = doc_info.get('title', doc_info.get('filename', 'Documento'))
@@ -587,7 +563,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Verificar plan del usuario
-    user_plan = check_user_plan(user_id)
+    user_plan = await adb.check_user_plan(user_id)
     if not user_plan:
         keyboard = [[InlineKeyboardButton("Ver Planes", url="https://tu-dominio.com/plans")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -598,7 +574,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Obtener o crear un grupo personal para el usuario
-    group_id = get_or_create_personal_group(user_id)
+    group_id = await adb.get_or_create_personal_group(user_id)
     if not group_id:
         await update.message.reply_text("Error al acceder a tu grupo personal. Por favor, intenta de nuevo.")
         return
@@ -609,7 +585,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if selected_doc_id:
         # Usar documento específico seleccionado
-        success, doc_info = db.get_document_info(selected_doc_id)
+        success, doc_info = await adb.get_document_info(selected_doc_id)
         if success:
             documents = [doc_info]
             doc_name = doc_info.get('title', 'Documento')
@@ -633,9 +609,9 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         }
         
         n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL_TEXT', os.getenv('N8N_WEBHOOK_URL'))
-        response = requests.post(n8n_webhook_url, json=payload)
+        response = await adb.post_webhook(n8n_webhook_url, payload)
         
-        if response.status_code == 200:
+        if response is not None and response.status_code == 200:
             if not selected_doc_id:  # Solo mostrar mensaje si no hay documento seleccionado
                 await update.message.reply_text(
                     "Procesando tu consulta..."
@@ -651,13 +627,10 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 def get_user_documents(self, user_id, limit=20):
     """Obtener todos los documentos del usuario"""
-    headers = self._get_supabase_headers()
-    
     try:
         # Obtener UUID del usuario
-        user_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers=headers,
+        user_response = self.client.get(
+            "users",
             params={"telegram_id": f"eq.{user_id}"}
         )
         
@@ -667,9 +640,8 @@ def get_user_documents(self, user_id, limit=20):
         user_uuid = user_response.json()[0]['id']
         
         # Buscar el grupo personal
-        group_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/groups",
-            headers=headers,
+        group_response = self.client.get(
+            "groups",
             params={"name": f"eq.Personal_{user_id}", "admin_id": f"eq.{user_uuid}"}
         )
         
@@ -679,9 +651,8 @@ def get_user_documents(self, user_id, limit=20):
         group_id = group_response.json()[0]['id']
         
         # Obtener documentos del grupo
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/group_documents",
-            headers=headers,
+        response = self.client.get(
+            "group_documents",
             params={
                 "group_id": f"eq.{group_id}",
                 "select": "*,documents(*)",
@@ -717,12 +688,9 @@ def get_user_documents(self, user_id, limit=20):
 
 def get_document_info(self, document_id):
     """Obtener información específica de un documento"""
-    headers = self._get_supabase_headers()
-    
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/documents",
-            headers=headers,
+        response = self.client.get(
+            "documents",
             params={"id": f"eq.{document_id}"}
         )
         
@@ -764,35 +732,19 @@ def get_user_documents_for_context(self, user_id, query_text, limit=3):
     return False, []        
 def get_or_create_personal_group(user_id):
     """Obtener o crear un grupo personal para el usuario"""
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json"
-    }
+    # Primero, obtener el UUID del usuario (caché de identidad)
+    user_uuid = db.resolve_user_uuid(user_id)
     
-    # Primero, obtener el UUID del usuario desde la tabla users
-    user_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/users",
-        headers=headers,
-        params={"telegram_id": f"eq.{user_id}"}
-    )
-    
-    if user_response.status_code != 200 or not user_response.json():
+    if not user_uuid:
         logging.error(f"Usuario con telegram_id {user_id} no encontrado en la base de datos")
         return None
     
-    user_uuid = user_response.json()[0]['id']
-    
     # Buscar si el usuario ya tiene un grupo personal
-    response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/groups",
-        headers=headers,
-        params={"name": f"eq.Personal_{user_id}", "admin_id": f"eq.{user_uuid}"}
-    )
+    group_id = db.resolve_personal_group_id(user_id, user_uuid)
     
-    if response.status_code == 200 and response.json():
+    if group_id:
         # El grupo ya existe
-        return response.json()[0]['id']
+        return group_id
     else:
         # Crear un nuevo grupo personal
         group_data = {
@@ -804,22 +756,21 @@ def get_or_create_personal_group(user_id):
             "shared_storage_bytes": 0
         }
         
-        create_response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/groups",
-            headers=headers,
+        create_response = db.client.post(
+            "groups",
             json=group_data
         )
         
         if create_response.status_code == 201:
             # Obtener el ID del grupo creado
-            get_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/groups",
-                headers=headers,
+            get_response = db.client.get(
+                "groups",
                 params={"name": f"eq.Personal_{user_id}", "admin_id": f"eq.{user_uuid}"}
             )
             
             if get_response.status_code == 200 and get_response.json():
                 group_id = get_response.json()[0]['id']
+                db.identity_cache.set(('personal_group', str(user_id)), group_id)
                 
                 # Añadir al usuario como miembro verificado del grupo
                 db.add_group_member(group_id, user_uuid, is_admin=True, status='verified')
@@ -831,22 +782,16 @@ def get_or_create_personal_group(user_id):
         return None
 def check_user_plan(user_id):
     """Verificar el plan del usuario y espacio disponible en Supabase"""
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     try:
         # Consultar usuario por telegram_id
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers=headers,
+        response = db.client.get(
+            "users",
             params={"telegram_id": f"eq.{user_id}"}
         )
         
         if response.status_code == 200 and response.json():
             user_data = response.json()[0]
+            db.identity_cache.set(('user', str(user_id)), user_data['id'])
             
             # Verificar si el plan está activo
             now = datetime.datetime.now().isoformat()
@@ -854,9 +799,8 @@ def check_user_plan(user_id):
             
             # Obtener información del plan
             plan_id = user_data.get('current_plan_id')
-            plan_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/plans",
-                headers=headers,
+            plan_response = db.client.get(
+                "plans",
                 params={"id": f"eq.{plan_id}"}
             )
             
@@ -910,7 +854,7 @@ async def add_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'status': 'active'
         }
         
-        db.add_user(user_id, user_data)
+        await adb.add_user(user_id, user_data)
         await update.message.reply_text(f"Usuario {user_id} añadido correctamente.")
     except ValueError:
         await update.message.reply_text("El ID de usuario debe ser un número.")
@@ -928,7 +872,7 @@ async def remove_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         user_id = int(context.args[0])
-        if db.remove_user(user_id):
+        if await adb.remove_user(user_id):
             await update.message.reply_text(f"Usuario {user_id} eliminado correctamente.")
         else:
             await update.message.reply_text(f"Usuario {user_id} no encontrado.")
@@ -939,7 +883,7 @@ async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Listar todos los usuarios en la base de datos"""
     # Aquí deberías verificar si el usuario que ejecuta el comando es administrador
     
-    users = db.get_all_users()
+    users = await adb.get_all_users()
     if not users:
         await update.message.reply_text("No hay usuarios registrados.")
         return
@@ -957,7 +901,7 @@ async def handle_document_with_name(update: Update, context: ContextTypes.DEFAUL
     document = update.message.document
     
     # Verificar plan del usuario
-    user_plan = check_user_plan(user_id)
+    user_plan = await adb.check_user_plan(user_id)
     if not user_plan['active']:
         keyboard = [
             [InlineKeyboardButton("🛒 Ver planes de almacenamiento", url=LANDING_PAGE_URL)]
@@ -1000,7 +944,7 @@ async def handle_photo_with_name(update: Update, context: ContextTypes.DEFAULT_T
     photo = update.message.photo[-1]  # Obtener la foto de mayor resolución
     
     # Verificar plan del usuario
-    user_plan = check_user_plan(user_id)
+    user_plan = await adb.check_user_plan(user_id)
     if not user_plan['active']:
         keyboard = [
             [InlineKeyboardButton("🛒 Ver planes de almacenamiento", url=LANDING_PAGE_URL)]
@@ -1094,7 +1038,6 @@ async def process_document_with_custom_name(update: Update, context: ContextType
     # Resto del código similar a handle_document pero usando custom_filename
     import tempfile
     import os
-    import requests
     import time
     import json
     
@@ -1112,30 +1055,17 @@ async def process_document_with_custom_name(update: Update, context: ContextType
             elif file_extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
                 content_type = 'image'
             
-            group_id = get_or_create_personal_group(user_id)
+            group_id = await adb.get_or_create_personal_group(user_id)
             if not group_id:
                 await update.message.reply_text("Error al crear grupo personal. Por favor, intenta de nuevo.")
                 return ConversationHandler.END
             
             # Obtener UUID del usuario
-            headers = {
-                "apikey": SUPABASE_KEY,
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            user_uuid = await adb.get_user_uuid(user_id)
+            if not user_uuid:
                 await update.message.reply_text("Error al obtener información del usuario.")
                 return ConversationHandler.END
             
-            user_uuid = user_response.json()[0]['id']
-            
             # Crear objeto archivo con nombre personalizado
             from types import SimpleNamespace
             file_obj = SimpleNamespace()
@@ -1143,33 +1073,19 @@ async def process_document_with_custom_name(update: Update, context: ContextType
             file_obj.read = lambda: f.read()
             file_obj.seek = lambda x: f.seek(x)
             
-            success, content_id = db.upload_and_vectorize_file(group_id, user_uuid, file_obj, content_type)
+            success, content_id = await adb.upload_and_vectorize_file(group_id, user_uuid, file_obj, content_type)
             
             if success:
                 # Obtener el document_id y file_path desde group_contents
                 document_id = None
                 file_path = None
                 
-                content_response = requests.get(
-                    f"{SUPABASE_URL}/rest/v1/group_contents",
-                    headers=headers,
-                    params={"id": f"eq.{content_id}"},
-                    timeout=10
-                )
-                
-                if content_response.status_code == 200 and content_response.json():
-                    content_data = content_response.json()[0].get('content_data')
-                    if isinstance(content_data, str):
-                        try:
-                            content_data = json.loads(content_data)
-                        except json.JSONDecodeError:
-                            pass
-                    
-                    if isinstance(content_data, dict):
-                        document_id = content_data.get('document_id')
-                        file_path = content_data.get('file_url')  # Obtener file_url directamente
-                        print(f"document_id obtenido: {document_id}")
-                        print(f"file_path obtenido: {file_path}")
+                content_data = await adb.get_group_content_data(content_id)
+                if content_data:
+                    document_id = content_data.get('document_id')
+                    file_path = content_data.get('file_url')  # Obtener file_url directamente
+                    print(f"document_id obtenido: {document_id}")
+                    print(f"file_path obtenido: {file_path}")
                 
                 if not document_id:
                     print("⚠️ No se pudo obtener document_id, usando content_id como fallback")
@@ -1262,7 +1178,7 @@ async def handle_document_question(update: Update, context: ContextTypes.DEFAULT
     if n8n_webhook_url:
         try:
             await update.message.reply_text("🤔 Analizando tu " + ("documento" if content_type == 'pdf' else "imagen") + " y procesando tu pregunta...")
-            n8n_response = requests.post(n8n_webhook_url, json=payload, timeout=30)
+            n8n_response = await adb.post_webhook(n8n_webhook_url, payload, timeout=30)
             
             if n8n_response.status_code == 200:
                 # Aquí deberías manejar la respuesta de n8n
@@ -1271,7 +1187,7 @@ async def handle_document_question(update: Update, context: ContextTypes.DEFAULT
             else:
                 await update.message.reply_text("❌ Error al procesar tu pregunta. Por favor, intenta de nuevo.")
                 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error enviando pregunta a n8n: {e}")
             await update.message.reply_text("❌ Error al procesar tu pregunta. Por favor, intenta de nuevo más tarde.")
     else:
@@ -1295,7 +1211,6 @@ async def process_photo_with_custom_name(update: Update, context: ContextTypes.D
     
     import tempfile
     import os
-    import requests
     import json
     
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
@@ -1306,63 +1221,36 @@ async def process_photo_with_custom_name(update: Update, context: ContextTypes.D
         await file.download_to_drive(temp_file_path)
         
         with open(temp_file_path, 'rb') as f:
-            group_id = get_or_create_personal_group(user_id)
+            group_id = await adb.get_or_create_personal_group(user_id)
             if not group_id:
                 await update.message.reply_text("Error al crear grupo personal.")
                 return ConversationHandler.END
             
             # Obtener UUID del usuario
-            headers = {
-                "apikey": SUPABASE_KEY,
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            user_uuid = await adb.get_user_uuid(user_id)
+            if not user_uuid:
                 await update.message.reply_text("Error al obtener información del usuario.")
                 return ConversationHandler.END
             
-            user_uuid = user_response.json()[0]['id']
-            
             from types import SimpleNamespace
             file_obj = SimpleNamespace()
             file_obj.filename = custom_filename
             file_obj.read = lambda: f.read()
             file_obj.seek = lambda x: f.seek(x)
             
-            success, result = db.upload_and_vectorize_file(group_id, user_uuid, file_obj, 'image')
+            success, result = await adb.upload_and_vectorize_file(group_id, user_uuid, file_obj, 'image')
             
             if success:
                 # Obtener el document_id y file_path desde group_contents (igual que en documentos)
                 document_id = None
                 file_path = None
                 
-                content_response = requests.get(
-                    f"{SUPABASE_URL}/rest/v1/group_contents",
-                    headers=headers,
-                    params={"id": f"eq.{result}"},
-                    timeout=10
-                )
-                
-                if content_response.status_code == 200 and content_response.json():
-                    content_data = content_response.json()[0].get('content_data')
-                    if isinstance(content_data, str):
-                        try:
-                            content_data = json.loads(content_data)
-                        except json.JSONDecodeError:
-                            pass
-                    
-                    if isinstance(content_data, dict):
-                        document_id = content_data.get('document_id')
-                        file_path = content_data.get('file_url')  # Obtener file_url directamente
-                        print(f"document_id obtenido: {document_id}")
-                        print(f"file_path obtenido: {file_path}")
+                content_data = await adb.get_group_content_data(result)
+                if content_data:
+                    document_id = content_data.get('document_id')
+                    file_path = content_data.get('file_url')  # Obtener file_url directamente
+                    print(f"document_id obtenido: {document_id}")
+                    print(f"file_path obtenido: {file_path}")
                 
                 if not document_id:
                     print("⚠️ No se pudo obtener document_id, usando result como fallback")
@@ -1403,7 +1291,7 @@ async def my_documents_command(update: Update, context: ContextTypes.DEFAULT_TYP
     """Mostrar documentos del usuario para seleccionar"""
     user_id = update.effective_user.id
     
-    success, documents = db.get_user_documents(user_id)
+    success, documents = await adb.get_user_documents(user_id)
     
     if not success or not documents:
         await update.message.reply_text(
@@ -1449,10 +1337,14 @@ async def my_documents_command(update: Update, context: ContextTypes.DEFAULT_TYP
         reply_markup=reply_markup,
         parse_mode='Markdown'
     )
+async def close_async_db(application: Application):
+    """Cerrar las conexiones de la capa asíncrona al detener el bot"""
+    await adb.close()
+
 def main():
     """Función principal para iniciar el bot"""
     # Crear la aplicación
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder().token(TOKEN).post_shutdown(close_async_db).build()
     
     # Registrar comandos básicos PRIMERO
     application.add_handler(CommandHandler("start", start))
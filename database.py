@@ -5,19 +5,29 @@ import uuid
 import hashlib
 import secrets
 import datetime
-import requests
+import itertools
+import numpy as np
 from dotenv import load_dotenv
 import logging
 import tempfile
 from google_drive_service import GoogleDriveService
+from supabase_client import get_supabase_client
+from ttl_cache import TTLCache
+from usage_buffer import get_token_usage_buffer
+from processing_pool import get_processing_pool
+from document_index import get_document_index
+from lexical_index import get_lexical_index, reciprocal_rank_fusion
+from pdf_extraction import page_for_offset
+from vector_search import to_pgvector
 
 # Importación opcional de EmbeddingsService
 try:
-    from embeddings_service import EmbeddingsService
+    from embeddings_service import EmbeddingsService, get_embeddings_service
     EMBEDDINGS_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: EmbeddingsService not available: {e}")
     EmbeddingsService = None
+    get_embeddings_service = None
     EMBEDDINGS_AVAILABLE = False
 
 load_dotenv()
@@ -32,6 +42,22 @@ logging.basicConfig(
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
+# Caché compartida del proceso: telegram_id -> UUID del usuario y grupo personal
+IDENTITY_CACHE = TTLCache(
+    maxsize=int(os.getenv('IDENTITY_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('IDENTITY_CACHE_TTL', 300))
+)
+
+# Caché compartida de resultados de búsqueda: (grupo, versión, consulta, umbral, límite) -> IDs
+SEARCH_RESULT_CACHE = TTLCache(
+    maxsize=int(os.getenv('SEARCH_CACHE_SIZE', 2048)),
+    ttl=float(os.getenv('SEARCH_CACHE_TTL', 300))
+)
+# Versión local de los documentos de cada grupo, solo si la base aún no tiene
+# groups.documents_version: los cambios de otros procesos se ven al expirar el TTL
+GROUP_VERSIONS = {}
+_group_version_counter = itertools.count(1)
+
 class UserDatabase:
     def __init__(self, db_file='users.json'):
         # Mantener compatibilidad con el archivo local para transición gradual
@@ -39,21 +65,44 @@ class UserDatabase:
         self.users = {}
         self.load_users()
         
+        # Cliente REST compartido (pool de conexiones keep-alive)
+        self.client = get_supabase_client(SUPABASE_URL, SUPABASE_KEY)
+        self.identity_cache = IDENTITY_CACHE
+        self.search_cache = SEARCH_RESULT_CACHE
+        
+        # Buffer de tokens compartido del proceso (None = envío inmediato)
+        self.token_buffer = get_token_usage_buffer(self._apply_token_deltas)
+        
         # Inicializar servicios de Google Drive y embeddings
         self.drive_service = GoogleDriveService(
             supabase_url=SUPABASE_URL,
             supabase_key=SUPABASE_KEY,
-            encryption_key=os.getenv('ENCRYPTION_KEY')
+            encryption_key=os.getenv('ENCRYPTION_KEY'),
+            supabase_client=self.client
         )
         
-        # Inicializar EmbeddingsService solo si está disponible
+        # EmbeddingsService compartido del proceso; el modelo se carga en el primer uso
         if EMBEDDINGS_AVAILABLE:
-            self.embeddings_service = EmbeddingsService(
-                model_name=os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'),
-                use_openai=os.getenv('USE_OPENAI_EMBEDDINGS', 'false').lower() == 'true'
-            )
+            self.embeddings_service = get_embeddings_service()
         else:
             self.embeddings_service = None
+        
+        # Pool de procesos para OCR/extracción/embeddings (None = procesar en línea)
+        self.processing_pool = get_processing_pool() if EMBEDDINGS_AVAILABLE else None
+        
+        # Se desactivan si la base aún no tiene las funciones RPC de búsqueda
+        self.similarity_rpc_available = True
+        self.chunk_search_available = True
+        self.documents_version_available = True
+        
+        # Tamaño y solapamiento de los pasajes indexados (caracteres)
+        self.chunk_size = int(os.getenv('CHUNK_SIZE', 1000))
+        self.chunk_overlap = int(os.getenv('CHUNK_OVERLAP', 200))
+        
+        # Índices vectoriales locales por grupo (None = desactivados)
+        self.document_index = get_document_index() if EMBEDDINGS_AVAILABLE else None
+        # Índices BM25 locales por grupo para la búsqueda híbrida (None = desactivados)
+        self.lexical_index = get_lexical_index()
     
     def load_users(self):
         """Cargar usuarios desde el archivo JSON (para compatibilidad)"""
@@ -74,24 +123,65 @@ class UserDatabase:
     
     def _get_supabase_headers(self):
         """Obtener headers para las solicitudes a Supabase"""
-        return {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json"
-        }
+        return self.client.get_headers()
+    
+    def resolve_user_uuid(self, telegram_id):
+        """Obtener el UUID de Supabase de un usuario de Telegram (con caché)"""
+        key = ('user', str(telegram_id))
+        user_uuid = self.identity_cache.get(key)
+        if user_uuid:
+            return user_uuid
+        
+        response = self.client.get(
+            "users",
+            params={"telegram_id": f"eq.{telegram_id}", "select": "id"}
+        )
+        if response.status_code != 200 or not response.json():
+            return None
+        
+        user_uuid = response.json()[0]['id']
+        self.identity_cache.set(key, user_uuid)
+        return user_uuid
+    
+    def resolve_personal_group_id(self, telegram_id, user_uuid=None):
+        """Obtener el ID del grupo personal de un usuario de Telegram (con caché)"""
+        key = ('personal_group', str(telegram_id))
+        group_id = self.identity_cache.get(key)
+        if group_id:
+            return group_id
+        
+        if user_uuid is None:
+            user_uuid = self.resolve_user_uuid(telegram_id)
+            if not user_uuid:
+                return None
+        
+        response = self.client.get(
+            "groups",
+            params={
+                "name": f"eq.Personal_{telegram_id}",
+                "admin_id": f"eq.{user_uuid}",
+                "select": "id"
+            }
+        )
+        if response.status_code != 200 or not response.json():
+            return None
+        
+        group_id = response.json()[0]['id']
+        self.identity_cache.set(key, group_id)
+        return group_id
+    
+    def invalidate_identity(self, telegram_id):
+        """Descartar de la caché la identidad de un usuario de Telegram"""
+        self.identity_cache.invalidate(('user', str(telegram_id)))
+        self.identity_cache.invalidate(('personal_group', str(telegram_id)))
     
     def add_user(self, telegram_id, user_data=None):
         """Añadir un usuario a Supabase"""
         if user_data is None:
             user_data = {}
         
-        headers = self._get_supabase_headers()
-        
         # Verificar si el usuario ya existe en Supabase
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?telegram_id=eq.{telegram_id}",
-            headers=headers
-        )
+        response = self.client.get(f"users?telegram_id=eq.{telegram_id}")
         
         if response.status_code == 200 and response.json():
             # El usuario ya existe, actualizar datos si es necesario
@@ -105,9 +195,8 @@ class UserDatabase:
                 update_data['is_active'] = user_data['is_active']
             
             if update_data:
-                update_response = requests.patch(
-                    f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-                    headers=headers,
+                update_response = self.client.patch(
+                    f"users?id=eq.{user_id}",
                     json=update_data
                 )
                 return update_response.status_code == 204
@@ -134,9 +223,8 @@ class UserDatabase:
                     expiration = datetime.datetime.now() + datetime.timedelta(days=user_data['plan_duration_days'])
                     new_user['plan_expiration'] = expiration.isoformat()
             
-            response = requests.post(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
+            response = self.client.post(
+                "users",
                 json=new_user
             )
             
@@ -148,22 +236,15 @@ class UserDatabase:
     
     def remove_user(self, telegram_id):
         """Eliminar un usuario de Supabase"""
-        headers = self._get_supabase_headers()
-        
         # Primero obtener el UUID del usuario
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?telegram_id=eq.{telegram_id}",
-            headers=headers
-        )
+        response = self.client.get(f"users?telegram_id=eq.{telegram_id}")
         
         if response.status_code == 200 and response.json():
             user_id = response.json()[0]['id']
             
             # Eliminar el usuario por su UUID
-            delete_response = requests.delete(
-                f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-                headers=headers
-            )
+            delete_response = self.client.delete(f"users?id=eq.{user_id}")
+            self.invalidate_identity(telegram_id)
             
             # También eliminar del archivo local para compatibilidad
             if str(telegram_id) in self.users:
@@ -175,12 +256,7 @@ class UserDatabase:
         return False
     def get_user_by_id(self, user_id):
         """Obtener información de un usuario de Supabase por su UUID"""
-        headers = self._get_supabase_headers()
-        
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers=headers
-        )
+        response = self.client.get(f"users?id=eq.{user_id}")
         
         if response.status_code == 200 and response.json():
             return response.json()[0]
@@ -189,12 +265,7 @@ class UserDatabase:
         return None
     def get_user(self, telegram_id):
         """Obtener información de un usuario de Supabase"""
-        headers = self._get_supabase_headers()
-        
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?telegram_id=eq.{telegram_id}",
-            headers=headers
-        )
+        response = self.client.get(f"users?telegram_id=eq.{telegram_id}")
         
         if response.status_code == 200 and response.json():
             return response.json()[0]
@@ -204,12 +275,7 @@ class UserDatabase:
     
     def get_all_users(self):
         """Obtener todos los usuarios de Supabase"""
-        headers = self._get_supabase_headers()
-        
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers=headers
-        )
+        response = self.client.get("users")
         
         if response.status_code == 200:
             # Convertir la lista a un diccionario con telegram_id como clave
@@ -224,14 +290,12 @@ class UserDatabase:
     
     def register_web_user(self, email, password, telegram_id=None):
         """Registrar un nuevo usuario web en Supabase"""
-        headers = self._get_supabase_headers()
         # Convertir email a minúsculas
         email = email.lower()
         logging.info(f"Intentando registrar usuario con email: {email}")
         # Verificar si el email ya existe
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers=headers,
+        response = self.client.get(
+            "users",
             params={"email": f"eq.{email}"}
         )
         
@@ -267,17 +331,15 @@ class UserDatabase:
             user_data["telegram_id"] = int(telegram_id) if telegram_id.isdigit() else None
         
         # Crear usuario en Supabase
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers=headers,
+        response = self.client.post(
+            "users",
             json=user_data
         )
         
         if response.status_code == 201:
             # Obtener el UUID generado
-            get_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
+            get_response = self.client.get(
+                "users",
                 params={"email": f"eq.{email}"}
             )
             
@@ -300,19 +362,19 @@ class UserDatabase:
         
         if success:
             user_id = message  # El ID del usuario en Supabase
-            headers = self._get_supabase_headers()
-            
             # Actualizar el telegram_id en la cuenta del usuario
             update_data = {"telegram_id": telegram_id}
             
             # Actualizar en Supabase
-            response = requests.patch(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
+            response = self.client.patch(
+                "users",
                 params={"id": f"eq.{user_id}"},
                 json=update_data
             )
             
+            # El telegram_id ahora apunta a otra cuenta
+            self.invalidate_identity(telegram_id)
+            
             if response.status_code == 204:  # Supabase devuelve 204 en actualizaciones exitosas
                 return True, "Inicio de sesión exitoso y cuenta vinculada"
             else:
@@ -321,15 +383,13 @@ class UserDatabase:
         return False, message
     def login_web_user(self, email, password):
         """Iniciar sesión de usuario web en Supabase"""
-        headers = self._get_supabase_headers()
         # Convertir email a minúsculas
         email = email.lower()
         logging.info(f"Intentando iniciar sesión con email: {email}")
         
         # Buscar usuario por email
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers=headers,
+        response = self.client.get(
+            "users",
             params={"email": f"eq.{email}"}
         )
         
@@ -418,8 +478,6 @@ class UserDatabase:
     
     def update_user_plan(self, user_id, plan_id, expiration_days=30):
         """Actualizar el plan de un usuario en Supabase"""
-        headers = self._get_supabase_headers()
-    
         # Calcular fecha de expiración
         expiration_date = (datetime.datetime.now() + 
                         datetime.timedelta(days=expiration_days)).isoformat()
@@ -432,9 +490,8 @@ class UserDatabase:
         }
         
         # Actualizar en Supabase
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers=headers,
+        response = self.client.patch(
+            "users",
             params={"id": f"eq.{user_id}"},
             json=update_data
         )
@@ -445,12 +502,9 @@ class UserDatabase:
     
     def add_order(self, user_id, plan_id, amount):
         """Registrar una nueva orden en Supabase"""
-        headers = self._get_supabase_headers()
-        
         # Buscar el UUID del plan basado en el plan_code
-        plan_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/plans",
-            headers=headers,
+        plan_response = self.client.get(
+            "plans",
             params={"plan_code": f"eq.{plan_id}"}
         )
         
@@ -475,9 +529,8 @@ class UserDatabase:
         }
         
         # Insertar en Supabase
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/payments",
-            headers=headers,
+        response = self.client.post(
+            "payments",
             json=order
         )
         
@@ -508,8 +561,6 @@ class UserDatabase:
 
     def create_group(self, admin_id, group_name, verification_type='phone'):
         """Crear un nuevo grupo con el usuario como administrador"""
-        headers = self._get_supabase_headers()
-        
         group_id = str(uuid.uuid4())
         group = {
             "id": group_id,
@@ -522,9 +573,8 @@ class UserDatabase:
         }
         
         # Insertar en Supabase
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/groups",
-            headers=headers,
+        response = self.client.post(
+            "groups",
             json=group
         )
         
@@ -537,8 +587,6 @@ class UserDatabase:
 
     def add_group_member(self, group_id, user_id, is_admin=False, status='pending'):
         """Añadir un miembro a un grupo"""
-        headers = self._get_supabase_headers()
-        
         member = {
             "group_id": group_id,
             "user_id": user_id,
@@ -548,25 +596,67 @@ class UserDatabase:
         }
         
         # Insertar en Supabase
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/group_members",
-            headers=headers,
+        response = self.client.post(
+            "group_members",
             json=member
         )
         
         return response.status_code == 201
 
+    def get_group_members_with_users(self, group_id, page_size=500, limit=None):
+        """
+        Obtener miembros de un grupo junto con el email del usuario
+        
+        Usa el recurso embebido users(email) de PostgREST, por lo que el coste es
+        una consulta por página (page_size miembros) y no una por miembro.
+        """
+        members = []
+        offset = 0
+        
+        while limit is None or len(members) < limit:
+            batch = page_size if limit is None else min(page_size, limit - len(members))
+            response = self.client.get(
+                "group_members",
+                params={
+                    "group_id": f"eq.{group_id}",
+                    "select": "user_id,is_admin,status,joined_at,users(email)",
+                    "order": "joined_at.asc,user_id.asc",
+                    "limit": batch,
+                    "offset": offset
+                }
+            )
+            
+            if response.status_code != 200:
+                logging.error(f"Error al obtener miembros del grupo {group_id}: {response.status_code} - {response.text}")
+                break
+            
+            rows = response.json()
+            for member in rows:
+                user = member.get('users')
+                if not user:
+                    continue
+                members.append({
+                    'user_id': member['user_id'],
+                    'email': user.get('email') or 'Sin email',
+                    'is_admin': member['is_admin'],
+                    'status': member['status'],
+                    'joined_at': member['joined_at']
+                })
+            
+            if len(rows) < batch:
+                break
+            offset += len(rows)
+        
+        return members
+
     def verify_group_member(self, group_id, user_id):
         """Verificar un miembro de grupo"""
-        headers = self._get_supabase_headers()
-        
         # Actualizar estado del miembro
         update_data = {"status": "verified"}
         
         # Actualizar en Supabase
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/group_members",
-            headers=headers,
+        response = self.client.patch(
+            "group_members",
             params={"group_id": f"eq.{group_id}", "user_id": f"eq.{user_id}"},
             json=update_data
         )
@@ -575,97 +665,63 @@ class UserDatabase:
 
     def get_user_groups(self, user_id):
         """Obtener grupos a los que pertenece un usuario"""
-        headers = self._get_supabase_headers()
-        
-        print(f"Buscando grupos para el usuario: {user_id}")
-        
-        # Obtener membresías del usuario
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/group_members",
-            headers=headers,
-            params={"user_id": f"eq.{user_id}"}
-        )
-        
-        # Depurar la respuesta
-        print(f"Status code memberships: {response.status_code}")
-        print(f"Response memberships: {response.text}")
-        
         groups = []
+        seen_ids = set()
+        
+        # Membresías del usuario con su grupo embebido (una sola consulta)
+        response = self.client.get(
+            "group_members",
+            params={
+                "user_id": f"eq.{user_id}",
+                "select": "group_id,is_admin,status,groups(*)"
+            }
+        )
         
         if response.status_code == 200:
-            memberships = response.json()
-            
-            for membership in memberships:
-                group_response = requests.get(
-                    f"{SUPABASE_URL}/rest/v1/groups",
-                    headers=headers,
-                    params={"id": f"eq.{membership['group_id']}"}
-                )
+            for membership in response.json():
+                group_data = membership.get('groups')
+                if not group_data or group_data['id'] in seen_ids:
+                    continue
                 
-                # Depurar la respuesta
-                print(f"Status code group: {group_response.status_code}")
-                print(f"Response group: {group_response.text}")
-                
-                if group_response.status_code == 200 and group_response.json():
-                    group = group_response.json()[0]
-                    group['is_admin'] = membership['is_admin']
-                    group['status'] = membership['status']
-                    groups.append(group)
+                group = dict(group_data)
+                group['is_admin'] = membership['is_admin']
+                group['status'] = membership['status']
+                groups.append(group)
+                seen_ids.add(group['id'])
+        else:
+            logging.error(f"Error al obtener membresías de {user_id}: {response.status_code} - {response.text}")
         
         # Siempre buscar grupos donde el usuario es administrador, independientemente de si ya encontramos grupos
-        print(f"Buscando grupos donde el usuario es administrador")
-        admin_groups_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/groups",
-            headers=headers,
+        admin_groups_response = self.client.get(
+            "groups",
             params={"admin_id": f"eq.{user_id}"}
         )
         
-        # Depurar la respuesta
-        print(f"Status code admin groups: {admin_groups_response.status_code}")
-        print(f"Response admin groups: {admin_groups_response.text}")
-        
-        if admin_groups_response.status_code == 200 and admin_groups_response.json():
+        if admin_groups_response.status_code == 200:
             for admin_group in admin_groups_response.json():
-                # Verificar si este grupo ya está en la lista
-                group_already_added = False
-                for existing_group in groups:
-                    if existing_group['id'] == admin_group['id']:
-                        group_already_added = True
-                        break
+                if admin_group['id'] in seen_ids:
+                    continue
                 
-                if not group_already_added:
-                    # Verificar si ya existe una membresía para este grupo
-                    member_check = requests.get(
-                        f"{SUPABASE_URL}/rest/v1/group_members",
-                        headers=headers,
-                        params={"group_id": f"eq.{admin_group['id']}", "user_id": f"eq.{user_id}"}
-                    )
-                    
-                    print(f"Verificando membresía para grupo {admin_group['id']}")
-                    print(f"Status code member check: {member_check.status_code}")
-                    print(f"Response member check: {member_check.text}")
-                    
-                    if member_check.status_code != 200 or not member_check.json():
-                        # Si no existe, añadir al usuario como miembro verificado
-                        print(f"Añadiendo al usuario como miembro verificado del grupo {admin_group['id']}")
-                        self.add_group_member(admin_group['id'], user_id, is_admin=True, status='verified')
-                    
-                    # Añadir el grupo a la lista con los atributos necesarios
-                    admin_group['is_admin'] = True
-                    admin_group['status'] = 'verified'
-                    groups.append(admin_group)
+                # La consulta anterior trae todas las membresías del usuario, así que
+                # un grupo administrado que no aparece en ella no tiene membresía
+                if response.status_code == 200:
+                    logging.info(f"Añadiendo al usuario como miembro verificado del grupo {admin_group['id']}")
+                    self.add_group_member(admin_group['id'], user_id, is_admin=True, status='verified')
+                
+                # Añadir el grupo a la lista con los atributos necesarios
+                admin_group['is_admin'] = True
+                admin_group['status'] = 'verified'
+                groups.append(admin_group)
+                seen_ids.add(admin_group['id'])
         
-        print(f"Total de grupos encontrados: {len(groups)}")
+        logging.debug(f"Grupos encontrados para {user_id}: {len(groups)}")
         return groups
 
     def add_group_content(self, group_id, admin_id, content_type, content_data, file_size=0):
         """Añadir contenido compartido a un grupo"""
-        headers = self._get_supabase_headers()
-        
         # Verificar que el usuario es administrador del grupo
-        admin_check = requests.get(
-            f"{SUPABASE_URL}/rest/v1/group_members",
-            headers=headers,
+        admin_check = self.client.get(
+            "group_members",
             params={"group_id": f"eq.{group_id}", "user_id": f"eq.{admin_id}", "is_admin": "is.true"}
         )
         
@@ -692,9 +748,8 @@ class UserDatabase:
         print(content)
         
         # Insertar en Supabase
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/group_contents",
-            headers=headers,
+        response = self.client.post(
+            "group_contents",
             json=content
         )
         
@@ -710,28 +765,38 @@ class UserDatabase:
         return False, "Error al añadir contenido"
 
     def update_group_storage(self, group_id, added_bytes):
-        """Actualizar el almacenamiento usado por un grupo"""
-        headers = self._get_supabase_headers()
+        """Actualizar el almacenamiento usado por un grupo (incremento atómico)"""
+        response = self.client.rpc(
+            "increment_group_storage",
+            {"p_group_id": group_id, "p_delta": added_bytes}
+        )
         
-        # Obtener almacenamiento actual
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/groups",
-            headers=headers,
-            params={"id": f"eq.{group_id}"}
+        if response.status_code == 404:
+            # La función aún no existe: ejecutar migrate_database.py
+            logging.warning("RPC increment_group_storage no disponible, usando lectura y escritura")
+            return self._increment_column_legacy("groups", group_id, "shared_storage_bytes", added_bytes)
+        
+        return response.status_code == 200
+    
+    def _generate_embedding_from_file(self, file_path, content_type):
+        """Extraer texto y generar embedding, en el pool de procesos si está configurado"""
+        if self.processing_pool is not None:
+            return self.processing_pool.generate_embedding_from_file(file_path, content_type)
+        return self.embeddings_service.generate_embedding_from_file(file_path, content_type)
+    
+    def _increment_column_legacy(self, table, row_id, column, delta):
+        """Incremento no atómico (lectura + escritura) para bases sin migrar"""
+        response = self.client.get(
+            table,
+            params={"id": f"eq.{row_id}", "select": column}
         )
         
         if response.status_code == 200 and response.json():
-            group = response.json()[0]
-            current_storage = group.get('shared_storage_bytes', 0)
-            new_storage = current_storage + added_bytes
-            
-            # Actualizar almacenamiento
-            update_data = {"shared_storage_bytes": new_storage}
-            update_response = requests.patch(
-                f"{SUPABASE_URL}/rest/v1/groups",
-                headers=headers,
-                params={"id": f"eq.{group_id}"},
-                json=update_data
+            current_value = response.json()[0].get(column) or 0
+            update_response = self.client.patch(
+                table,
+                params={"id": f"eq.{row_id}"},
+                json={column: current_value + delta}
             )
             
             return update_response.status_code == 204
@@ -739,12 +804,9 @@ class UserDatabase:
         return False
     def upload_and_vectorize_file(self, group_id, user_id, file, content_type):
         """Subir archivo a Google Drive, procesarlo y vectorizarlo para IA"""
-        headers = self._get_supabase_headers()
-        
         # Verificar que el usuario es administrador del grupo
-        admin_check = requests.get(
-            f"{SUPABASE_URL}/rest/v1/group_members",
-            headers=headers,
+        admin_check = self.client.get(
+            "group_members",
             params={"group_id": f"eq.{group_id}", "user_id": f"eq.{user_id}", "is_admin": "is.true"}
         )
         
@@ -785,7 +847,7 @@ class UserDatabase:
             logging.info(f"Procesando contenido del archivo {file_name}...")
             
             if self.embeddings_service:
-                embedding_result = self.embeddings_service.generate_embedding_from_file(
+                embedding_result = self._generate_embedding_from_file(
                     temp_file_path, content_type
                 )
                 
@@ -828,7 +890,7 @@ class UserDatabase:
                 "file_path": "",  # Ya no usamos Supabase Storage
                 "file_size": file_size,
                 "metadata": metadata,
-                "embedding": embedding,
+                "embedding": to_pgvector(embedding),
                 "google_drive_file_id": google_file_id,
                 "original_file_name": file_name,
                 "mime_type": self._get_mime_type(file_name),
@@ -837,9 +899,8 @@ class UserDatabase:
             }
             
             # Insertar en Supabase
-            document_response = requests.post(
-                f"{SUPABASE_URL}/rest/v1/documents",
-                headers=headers,
+            document_response = self.client.post(
+                "documents",
                 json=document
             )
             
@@ -861,9 +922,8 @@ class UserDatabase:
                     document_id = response_data.get('id')
             except:
                 # Si no se puede obtener de la respuesta, buscar por google_drive_file_id
-                get_doc_response = requests.get(
-                    f"{SUPABASE_URL}/rest/v1/documents",
-                    headers=headers,
+                get_doc_response = self.client.get(
+                    "documents",
                     params={"google_drive_file_id": f"eq.{google_file_id}"}
                 )
                 
@@ -879,15 +939,18 @@ class UserDatabase:
                 "added_by": user_id
             }
             
-            group_doc_response = requests.post(
-                f"{SUPABASE_URL}/rest/v1/group_documents",
-                headers=headers,
+            group_doc_response = self.client.post(
+                "group_documents",
                 json=group_document
             )
             
             if group_doc_response.status_code != 201:
                 return False, "Error al relacionar documento con grupo"
             
+            self.bump_group_version(group_id)
+            self._index_document(group_id, document_id, embedding, f"{file_name}\n{text_content}")
+            self._store_document_chunks(document_id, text_content, processing_metadata.get('pages'))
+            
             # 6. Registrar el contenido en group_contents para compatibilidad
             content_data = {
                 "filename": file_name,
@@ -901,12 +964,10 @@ class UserDatabase:
             
             success, content_id = self.add_group_content(group_id, user_id, content_type, content_data, file_size)
             
+            # add_group_content ya actualiza el almacenamiento usado por el grupo
             if not success:
                 return False, "Error al registrar contenido en el grupo"
             
-            # 7. Actualizar almacenamiento usado por el grupo
-            self.update_group_storage(group_id, file_size)
-            
             logging.info(f"Archivo {file_name} procesado exitosamente. Document ID: {document_id}")
             return True, document_id
             
@@ -919,13 +980,11 @@ class UserDatabase:
                 os.unlink(temp_file_path)
     def get_group_contents(self, group_id, user_id):
         """Obtener contenidos de un grupo (solo para miembros verificados)"""
-        headers = self._get_supabase_headers()
         import json
         
         # Verificar que el usuario es miembro verificado del grupo
-        member_check = requests.get(
-            f"{SUPABASE_URL}/rest/v1/group_members",
-            headers=headers,
+        member_check = self.client.get(
+            "group_members",
             params={"group_id": f"eq.{group_id}", "user_id": f"eq.{user_id}", "status": "eq.verified"}
         )
         
@@ -933,9 +992,8 @@ class UserDatabase:
             return False, "Solo los miembros verificados pueden ver el contenido"
         
         # Obtener contenidos
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/group_contents",
-            headers=headers,
+        response = self.client.get(
+            "group_contents",
             params={"group_id": f"eq.{group_id}"}
         )
         
@@ -957,12 +1015,9 @@ class UserDatabase:
 
     def invite_to_group(self, group_id, admin_id, email=None, phone=None):
         """Invitar a un usuario a un grupo mediante email o teléfono"""
-        headers = self._get_supabase_headers()
-        
         # Verificar que el administrador tiene permisos
-        admin_check = requests.get(
-            f"{SUPABASE_URL}/rest/v1/group_members",
-            headers=headers,
+        admin_check = self.client.get(
+            "group_members",
             params={"group_id": f"eq.{group_id}", "user_id": f"eq.{admin_id}", "is_admin": "is.true"}
         )
         
@@ -970,9 +1025,8 @@ class UserDatabase:
             return False, "Solo los administradores pueden invitar miembros"
         
         # Obtener información del grupo
-        group_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/groups",
-            headers=headers,
+        group_response = self.client.get(
+            "groups",
             params={"id": f"eq.{group_id}"}
         )
         
@@ -985,18 +1039,16 @@ class UserDatabase:
         # Buscar si el usuario ya existe
         user_id = None
         if email:
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
+            user_response = self.client.get(
+                "users",
                 params={"email": f"eq.{email.lower()}"}
             )
             if user_response.status_code == 200 and user_response.json():
                 user_id = user_response.json()[0]['id']
         
         if not user_id and phone:
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
+            user_response = self.client.get(
+                "users",
                 params={"phone": f"eq.{phone}"}
             )
             if user_response.status_code == 200 and user_response.json():
@@ -1032,9 +1084,8 @@ class UserDatabase:
             invitation["phone"] = phone
         
         # Insertar en Supabase
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/group_invitations",
-            headers=headers,
+        response = self.client.post(
+            "group_invitations",
             json=invitation
         )
         
@@ -1095,63 +1146,94 @@ class UserDatabase:
         return True    
 
     def update_user_tokens(self, user_id, tokens_used):
-        """Actualizar los tokens usados por un usuario"""
-        headers = self._get_supabase_headers()
-        
-        # Obtener datos actuales del usuario
-        user = self.get_user_by_id(user_id)  # Cambiar get_user por get_user_by_id
-        if not user:
-            return False
-        
-        current_tokens_used = user.get("tokens_used", 0)
+        """Actualizar los tokens usados por un usuario (incremento atómico)"""
+        if self.token_buffer is not None:
+            # Se aplicará en el próximo envío del buffer
+            self.token_buffer.add(user_id, tokens_used)
+            return True
+        
+        response = self.client.rpc(
+            "increment_user_tokens",
+            {"p_user_id": user_id, "p_delta": tokens_used}
+        )
         
-        # Actualizar tokens
-        update_data = {
-            "tokens_used": current_tokens_used + tokens_used
-        }
+        if response.status_code == 404:
+            logging.warning("RPC increment_user_tokens no disponible, usando lectura y escritura")
+            return self._increment_column_legacy("users", user_id, "tokens_used", tokens_used)
         
-        # Actualizar en Supabase
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers=headers,
-            params={"id": f"eq.{user_id}"},
-            json=update_data
-        )
+        return response.status_code == 200
+    
+    def _apply_token_deltas(self, deltas):
+        """Aplicar en una sola llamada los deltas de tokens acumulados {user_id: delta}"""
+        response = self.client.rpc("increment_user_tokens_batch", {"p_deltas": deltas})
+        
+        if response.status_code == 404:
+            logging.warning("RPC increment_user_tokens_batch no disponible, aplicando deltas uno a uno")
+            for user_id, delta in deltas.items():
+                if not self._increment_column_legacy("users", user_id, "tokens_used", delta):
+                    # Devolver al buffer solo los deltas que no se aplicaron
+                    self.token_buffer.add(user_id, delta)
+            return True
+        
+        if response.status_code != 200:
+            logging.error(f"Error al aplicar tokens acumulados: {response.status_code} - {response.text}")
+            return False
         
-        return response.status_code == 204
+        return True
+    
+    @staticmethod
+    def _format_group_documents(group_docs):
+        """Convertir filas de group_documents con documents embebidos al formato del bot"""
+        documents = []
+        
+        for group_doc in group_docs:
+            # Verificar que documents existe y no es None
+            if group_doc.get('documents') and isinstance(group_doc['documents'], dict):
+                doc = group_doc['documents']
+                # Verificar que el documento tiene los campos requeridos
+                if doc.get('id'):
+                    # Extraer información del metadata si existe
+                    metadata = doc.get('metadata', {})
+                    if isinstance(metadata, dict):
+                        filename = metadata.get('filename', doc.get('title', 'Sin nombre'))
+                        file_type = metadata.get('content_type', doc.get('file_type', 'unknown'))
+                        file_url = metadata.get('file_url', '')
+                        file_size = metadata.get('file_size', doc.get('file_size', 0))
+                    else:
+                        filename = doc.get('title', 'Sin nombre')
+                        file_type = doc.get('file_type', 'unknown')
+                        file_url = doc.get('file_path', '')
+                        file_size = doc.get('file_size', 0)
+                    
+                    documents.append({
+                        'id': doc['id'],
+                        'title': doc.get('title', filename),
+                        'filename': filename,
+                        'content': doc.get('content', ''),
+                        'file_type': file_type,
+                        'file_path': file_url,
+                        'created_at': doc.get('created_at', ''),
+                        'file_size': file_size
+                    })
+        
+        return documents
+    
     def get_user_documents(self, user_id, limit=20):
         """Obtener todos los documentos del usuario"""
-        headers = self._get_supabase_headers()
-        
         try:
-            # Obtener UUID del usuario
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            # Obtener UUID del usuario (caché de identidad)
+            user_uuid = self.resolve_user_uuid(user_id)
+            if not user_uuid:
                 return False, []
             
-            user_uuid = user_response.json()[0]['id']
-            
             # Buscar el grupo personal
-            group_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/groups",
-                headers=headers,
-                params={"name": f"eq.Personal_{user_id}", "admin_id": f"eq.{user_uuid}"}
-            )
-            
-            if group_response.status_code != 200 or not group_response.json():
+            group_id = self.resolve_personal_group_id(user_id, user_uuid)
+            if not group_id:
                 return False, []
             
-            group_id = group_response.json()[0]['id']
-            
             # Obtener documentos del grupo usando la tabla group_documents con select específico
-            response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/group_documents",
-                headers=headers,
+            response = self.client.get(
+                "group_documents",
                 params={
                     "group_id": f"eq.{group_id}",
                     "select": "id,created_at,documents(id,title,content,file_type,file_path,file_size,metadata,created_at)",
@@ -1164,40 +1246,7 @@ class UserDatabase:
             print(f"Debug - Response: {response.text}")
             
             if response.status_code == 200:
-                group_docs = response.json()
-                documents = []
-                
-                for group_doc in group_docs:
-                    # Verificar que documents existe y no es None
-                    if group_doc.get('documents') and isinstance(group_doc['documents'], dict):
-                        doc = group_doc['documents']
-                        # Verificar que el documento tiene los campos requeridos
-                        if doc.get('id'):
-                            # Extraer información del metadata si existe
-                            metadata = doc.get('metadata', {})
-                            if isinstance(metadata, dict):
-                                filename = metadata.get('filename', doc.get('title', 'Sin nombre'))
-                                file_type = metadata.get('content_type', doc.get('file_type', 'unknown'))
-                                file_url = metadata.get('file_url', '')
-                                file_size = metadata.get('file_size', doc.get('file_size', 0))
-                            else:
-                                filename = doc.get('title', 'Sin nombre')
-                                file_type = doc.get('file_type', 'unknown')
-                                file_url = doc.get('file_path', '')
-                                file_size = doc.get('file_size', 0)
-                            
-                            documents.append({
-                                'id': doc['id'],
-                                'title': doc.get('title', filename),
-                                'filename': filename,
-                                'content': doc.get('content', ''),
-                                'file_type': file_type,
-                                'file_path': file_url,
-                                'created_at': doc.get('created_at', ''),
-                                'file_size': file_size
-                            })
-                
-                return True, documents
+                return True, self._format_group_documents(response.json())
             
             return False, []
             
@@ -1212,95 +1261,647 @@ class UserDatabase:
         if not self.embeddings_service:
             return self.get_user_documents(user_id, limit)
             
-        headers = self._get_supabase_headers()
-        
         try:
-            # Obtener UUID del usuario
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            # Obtener UUID del usuario (caché de identidad)
+            user_uuid = self.resolve_user_uuid(user_id)
+            if not user_uuid:
                 return False, []
             
-            user_uuid = user_response.json()[0]['id']
-            
             # Generar embedding de la consulta
             query_embedding = self.embeddings_service.generate_query_embedding(query_text)
             
             # Buscar el grupo personal del usuario
-            group_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/groups",
-                headers=headers,
-                params={"name": f"eq.Personal_{user_id}", "admin_id": f"eq.{user_uuid}"}
-            )
+            group_id = self.resolve_personal_group_id(user_id, user_uuid)
+            if not group_id:
+                return False, []
             
-            if group_response.status_code != 200 or not group_response.json():
+            # Resultados recientes de la misma consulta en el grupo (sin cambios desde entonces)
+            cache_key = self._search_cache_key(group_id, query_embedding, threshold, limit)
+            start = time.perf_counter()
+            ranking = self.search_cache.get(cache_key) if cache_key is not None else None
+            if ranking is not None:
+                cached_results = self._documents_from_ranking(ranking)
+                if cached_results is not None:
+                    self.search_cache.record_hit_cost(time.perf_counter() - start)
+                    return True, cached_results
+            
+            results = self._search_group_documents(group_id, query_embedding, threshold, limit)
+            if results is None:
                 return False, []
             
-            group_id = group_response.json()[0]['id']
+            if cache_key is not None:
+                self.search_cache.set(cache_key, [(doc['id'], doc.get('similarity')) for doc in results])
+                self.search_cache.record_miss_cost(time.perf_counter() - start)
+            return True, results
+        
+        except Exception as e:
+            logging.error(f"Error en búsqueda por similaridad: {e}")
+            return False, []
+    
+    def _search_group_documents(self, group_id, query_embedding, threshold, limit):
+        """
+        Buscar documentos similares de un grupo: RPC, índice local o cálculo en cliente
+        
+        Returns:
+            Lista de documentos con su similaridad, o None si la búsqueda falló
+        """
+        # Búsqueda en el servidor (pgvector): resultados ya ordenados y sin embeddings
+        rpc_results = self._search_documents_rpc(group_id, query_embedding, threshold, limit)
+        if rpc_results is not None and len(rpc_results) >= limit:
+            return rpc_results
+        
+        # Con menos de limit filas el índice del servidor pudo dejar fuera documentos
+        # del grupo (filtra por grupo después de elegir los vecinos): completar aquí
+        results = self._search_group_documents_locally(group_id, query_embedding, threshold, limit)
+        if results is None or (rpc_results is not None and len(results) < len(rpc_results)):
+            return rpc_results
+        return results
+    
+    def _search_group_documents_locally(self, group_id, query_embedding, threshold, limit):
+        """
+        Buscar documentos similares de un grupo con el índice local o calculando en cliente
+        
+        Returns:
+            Lista de documentos con su similaridad, o None si la búsqueda falló
+        """
+        # Buscar en el índice local del grupo: solo se descargan los documentos encontrados
+        if self.document_index is not None:
+            indexed_results = self._search_group_index(group_id, query_embedding, threshold, limit)
+            if indexed_results is not None:
+                return indexed_results
+        
+        # Obtener documentos del grupo con sus embeddings
+        documents_response = self.client.get(
+            "group_documents",
+            params={
+                "group_id": f"eq.{group_id}",
+                "select": "id,created_at,documents(id,title,text_content,file_type,google_drive_file_id,file_size,metadata,embedding,created_at)",
+                "limit": "100"  # Obtener más documentos para filtrar por similaridad
+            }
+        )
+        
+        if documents_response.status_code != 200:
+            return None
+        
+        group_docs = documents_response.json()
+        document_embeddings = []
+        
+        for group_doc in group_docs:
+            if group_doc.get('documents') and isinstance(group_doc['documents'], dict):
+                doc = group_doc['documents']
+                if doc.get('embedding') and doc.get('id'):
+                    document_embeddings.append({
+                        'id': doc['id'],
+                        'title': doc.get('title', ''),
+                        'text_content': doc.get('text_content', ''),
+                        'file_type': doc.get('file_type', ''),
+                        'google_drive_file_id': doc.get('google_drive_file_id', ''),
+                        'file_size': doc.get('file_size', 0),
+                        'metadata': doc.get('metadata', {}),
+                        'embedding': doc['embedding'],
+                        'created_at': doc.get('created_at', '')
+                    })
+        
+        # Usar el servicio de embeddings para encontrar documentos similares
+        return self.embeddings_service.find_similar_documents(
+            query_embedding=query_embedding,
+            document_embeddings=document_embeddings,
+            threshold=threshold,
+            limit=limit
+        )
+    
+    def group_version(self, group_id):
+        """
+        Versión actual de los documentos de un grupo (para invalidar cachés de búsqueda)
+        
+        Se lee de groups.documents_version, que un trigger de group_documents
+        incrementa con cada cambio hecho desde cualquier proceso. Si la
+        columna no existe se usa la versión local del proceso.
+        
+        Returns:
+            Versión del grupo, o None si no se pudo leer (no usar la caché)
+        """
+        if self.documents_version_available:
+            response = self.client.get(
+                "groups",
+                params={"id": f"eq.{group_id}", "select": "documents_version"}
+            )
+            if response.status_code == 200:
+                rows = response.json()
+                return ('db', rows[0]['documents_version']) if rows else None
+            if response.status_code != 400:
+                logging.error(f"Error leyendo versión del grupo: {response.status_code} - {response.text}")
+                return None
+            # Columna no migrada: versión local durante el resto del proceso
+            logging.warning("Columna groups.documents_version no disponible, usando versión local")
+            self.documents_version_available = False
+        return ('local', GROUP_VERSIONS.get(str(group_id), 0))
+    
+    def bump_group_version(self, group_id):
+        """Marcar que los documentos del grupo cambiaron (versión local, sin groups.documents_version)"""
+        # next() sobre itertools.count es atómico: dos altas simultáneas dan versiones distintas
+        GROUP_VERSIONS[str(group_id)] = next(_group_version_counter)
+    
+    def _search_cache_key(self, group_id, query_embedding, threshold, limit):
+        """
+        Clave de la caché de resultados: grupo, versión, huella del embedding, umbral y límite
+        
+        Returns:
+            La clave, o None si no se conoce la versión del grupo
+        """
+        version = self.group_version(group_id)
+        if version is None:
+            return None
+        fingerprint = hashlib.sha1(np.asarray(query_embedding, dtype=np.float32).tobytes()).hexdigest()
+        return (str(group_id), version, fingerprint, threshold, limit)
+    
+    def _documents_from_ranking(self, ranking):
+        """
+        Recuperar los documentos de un ranking guardado en caché, en el mismo orden
+        
+        Returns:
+            Lista de documentos con su similaridad, o None si la consulta falló
+        """
+        if not ranking:
+            return []
+        
+        documents = self._fetch_documents_by_ids([doc_id for doc_id, _ in ranking])
+        if documents is None:
+            return None
+        
+        results = []
+        for doc_id, similarity in ranking:
+            doc = documents.get(doc_id)
+            if doc is not None:
+                doc['similarity'] = similarity
+                results.append(doc)
+        return results
+    
+    def search_cache_stats(self):
+        """Aciertos y tiempo ahorrado por las cachés de embeddings de consulta y de resultados"""
+        query_cache = getattr(self.embeddings_service, 'query_cache', None)
+        return {
+            'query_embeddings': query_cache.stats() if query_cache is not None else None,
+            'search_results': self.search_cache.stats()
+        }
+
+    def _search_documents_rpc(self, group_id, query_embedding, threshold, limit):
+        """
+        Buscar documentos similares de un grupo con la función search_documents_by_similarity
+        
+        Returns:
+            Lista de documentos con su similaridad, o None si la RPC no está disponible
+        """
+        if not self.similarity_rpc_available:
+            return None
+        
+        response = self.client.rpc(
+            "search_documents_by_similarity",
+            {
+                "query_embedding": to_pgvector(query_embedding),
+                "match_group_id": group_id,
+                "similarity_threshold": threshold,
+                "result_limit": limit,
+                "ef_search": int(os.getenv('VECTOR_SEARCH_EF', 40))
+            }
+        )
+        
+        if response.status_code == 404:
+            # Función no migrada: usar la búsqueda local durante el resto del proceso
+            logging.warning("RPC search_documents_by_similarity no disponible, usando búsqueda local")
+            self.similarity_rpc_available = False
+            return None
+        
+        if response.status_code != 200:
+            logging.error(f"Error en RPC de búsqueda: {response.status_code} - {response.text}")
+            return None
+        
+        return response.json()
+    
+    def _store_document_chunks(self, document_id, text_content, pages=None, batch_size=500):
+        """
+        Dividir el texto de un documento en pasajes y guardarlos con sus embeddings
+        
+        Los errores se registran pero no hacen fallar la subida: el documento
+        sigue siendo buscable por su embedding completo. Con pages (rangos de
+        caracteres de cada página de un PDF) cada chunk guarda su página.
+        
+        Returns:
+            Número de chunks guardados
+        """
+        if not self.embeddings_service or not document_id or not text_content or not text_content.strip():
+            return 0
+        
+        try:
+            if self.processing_pool is not None:
+                chunks = self.processing_pool.generate_chunk_embeddings(
+                    text_content, self.chunk_size, self.chunk_overlap
+                )
+            else:
+                chunks = self.embeddings_service.generate_chunk_embeddings(
+                    text_content, self.chunk_size, self.chunk_overlap
+                )
+            
+            rows = [
+                {
+                    "document_id": document_id,
+                    "chunk_index": chunk['chunk_id'],
+                    "start_char": chunk['start_char'],
+                    "page": page_for_offset(pages, chunk['start_char']),
+                    "content": chunk['text'],
+                    "embedding": to_pgvector(chunk['embedding'])
+                }
+                for chunk in chunks
+            ]
+            
+            # Inserción en bloque: una solicitud por cada batch_size chunks
+            for start in range(0, len(rows), batch_size):
+                response = self.client.post("document_chunks", json=rows[start:start + batch_size])
+                if response.status_code != 201:
+                    logging.error(f"Error al guardar chunks de {document_id}: {response.status_code} - {response.text}")
+                    return start
+            
+            logging.info(f"Documento {document_id}: {len(rows)} chunks guardados")
+            return len(rows)
+        
+        except Exception as e:
+            logging.error(f"Error generando chunks de {document_id}: {e}")
+            return 0
+    
+    def search_document_passages(self, group_id, query_text, limit=3, chunks_per_document=1,
+                                 threshold=0.3, max_chars=1000):
+        """
+        Buscar los pasajes más relevantes de los documentos de un grupo
+        
+        Returns:
+            Lista de documentos (mejor primero) cuyo 'content' son sus pasajes más
+            relevantes, o None si la búsqueda por chunks no está disponible
+        """
+        if not self.embeddings_service or not self.chunk_search_available:
+            return None
+        
+        query_embedding = self.embeddings_service.generate_query_embedding(query_text)
+        response = self.client.rpc(
+            "search_document_chunks",
+            {
+                "query_embedding": to_pgvector(query_embedding),
+                "match_group_id": group_id,
+                "similarity_threshold": threshold,
+                "result_limit": limit,
+                "chunks_per_document": chunks_per_document
+            }
+        )
+        
+        if response.status_code == 404:
+            logging.warning("RPC search_document_chunks no disponible, usando documentos completos")
+            self.chunk_search_available = False
+            return None
+        
+        if response.status_code != 200:
+            logging.error(f"Error en búsqueda por chunks: {response.status_code} - {response.text}")
+            return None
+        
+        # Agrupar pasajes por documento manteniendo el orden del ranking
+        documents = {}
+        for row in response.json():
+            passage = row['content']
+            if len(passage) > max_chars:
+                passage = passage[:max_chars] + "..."
+            
+            doc = documents.get(row['document_id'])
+            if doc is None:
+                documents[row['document_id']] = {
+                    'id': row['document_id'],
+                    'title': row['title'],
+                    'content': passage,
+                    'file_type': row['file_type'],
+                    'file_path': row.get('file_path'),
+                    'created_at': row['created_at'],
+                    'similarity': row['similarity'],
+                    'passages': [{'chunk_index': row['chunk_index'], 'start_char': row['start_char'],
+                                  'page': row.get('page'), 'similarity': row['similarity']}]
+                }
+            else:
+                doc['content'] += "\n[...]\n" + passage
+                doc['passages'].append({'chunk_index': row['chunk_index'], 'start_char': row['start_char'],
+                                        'page': row.get('page'), 'similarity': row['similarity']})
+        
+        return list(documents.values())
+    
+    def backfill_document_chunks(self, page_size=100):
+        """
+        Guardar los pasajes de los documentos subidos antes de que existiera document_chunks
+        
+        Se puede repetir sin duplicar: solo procesa los documentos que no tienen
+        ningún chunk.
+        
+        Returns:
+            Número de documentos completados, o None si no se pudo consultar
+        """
+        if not self.embeddings_service:
+            return None
+        
+        backfilled = 0
+        offset = 0
+        while True:
+            response = self.client.get(
+                "documents",
+                params={
+                    "select": "id,text_content,metadata",
+                    "order": "id",
+                    "limit": str(page_size),
+                    "offset": str(offset)
+                }
+            )
+            if response.status_code != 200:
+                logging.error(f"Error al listar documentos para chunks: {response.status_code} - {response.text}")
+                return None
+            
+            documents = response.json()
+            if not documents:
+                break
+            offset += len(documents)
+            
+            # El chunk 0 existe en todo documento ya dividido
+            chunked = self.client.get(
+                "document_chunks",
+                params={
+                    "select": "document_id",
+                    "document_id": f"in.({','.join(doc['id'] for doc in documents)})",
+                    "chunk_index": "eq.0"
+                }
+            )
+            if chunked.status_code != 200:
+                logging.error(f"Error al consultar chunks existentes: {chunked.status_code} - {chunked.text}")
+                return None
+            has_chunks = {row['document_id'] for row in chunked.json()}
+            
+            for doc in documents:
+                if doc['id'] in has_chunks or not (doc.get('text_content') or '').strip():
+                    continue
+                metadata = doc.get('metadata') if isinstance(doc.get('metadata'), dict) else {}
+                pages = (metadata.get('processing_metadata') or {}).get('pages')
+                if self._store_document_chunks(doc['id'], doc['text_content'], pages):
+                    backfilled += 1
+            
+            if len(documents) < page_size:
+                break
+        
+        logging.info(f"Chunks generados para {backfilled} documentos anteriores")
+        return backfilled
+    
+    def _index_document(self, group_id, document_id, embedding, text=None):
+        """Añadir un documento recién insertado a los índices locales del grupo (si existen)"""
+        if not document_id:
+            return
+        try:
+            if self.document_index is not None and embedding:
+                self.document_index.add(group_id, document_id, embedding)
+            if self.lexical_index is not None and text:
+                self.lexical_index.add(group_id, document_id, text)
+        except Exception as e:
+            logging.warning(f"No se pudo actualizar el índice del grupo {group_id}: {e}")
+    
+    def _build_group_index(self, group_id, dimension, page_size=1000):
+        """Construir el índice local de un grupo descargando solo IDs y embeddings"""
+        ids = []
+        embeddings = []
+        offset = 0
+        
+        while True:
+            response = self.client.get(
+                "group_documents",
+                params={
+                    "group_id": f"eq.{group_id}",
+                    "select": "document_id,documents(id,embedding)",
+                    "order": "document_id.asc",
+                    "limit": page_size,
+                    "offset": offset
+                }
+            )
+            
+            if response.status_code != 200:
+                logging.error(f"Error al construir índice del grupo {group_id}: {response.status_code}")
+                return None
             
-            # Obtener documentos del grupo con sus embeddings
-            documents_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/group_documents",
-                headers=headers,
+            rows = response.json()
+            for row in rows:
+                doc = row.get('documents')
+                if doc and doc.get('id') and doc.get('embedding'):
+                    ids.append(doc['id'])
+                    embeddings.append(doc['embedding'])
+            
+            if len(rows) < page_size:
+                break
+            offset += len(rows)
+        
+        return self.document_index.build(group_id, ids, embeddings, dimension)
+    
+    def _search_group_index(self, group_id, query_embedding, threshold, limit):
+        """
+        Buscar documentos similares con el índice local del grupo
+        
+        Returns:
+            Lista de documentos con su similaridad, o None si no se pudo usar el índice
+        """
+        try:
+            matches = self.document_index.search(group_id, query_embedding, threshold, limit)
+            if matches is None:
+                if self._build_group_index(group_id, len(query_embedding)) is None:
+                    return None
+                matches = self.document_index.search(group_id, query_embedding, threshold, limit)
+        except Exception as e:
+            logging.warning(f"Índice local no disponible para el grupo {group_id}: {e}")
+            return None
+        
+        if not matches:
+            return []
+        
+        documents = self._fetch_documents_by_ids([doc_id for doc_id, _ in matches])
+        if documents is None:
+            return None
+        
+        results = []
+        for doc_id, similarity in matches:
+            doc = documents.get(doc_id)
+            if doc is None:
+                # Documento eliminado desde que se construyó el índice
+                self.document_index.remove(group_id, doc_id)
+                continue
+            doc['similarity'] = similarity
+            results.append(doc)
+        
+        return results
+    
+    def _fetch_documents_by_ids(self, document_ids):
+        """
+        Descargar los documentos indicados (sin embeddings) en una sola consulta
+        
+        Returns:
+            Diccionario id -> documento, o None si la consulta falló
+        """
+        response = self.client.get(
+            "documents",
+            params={
+                "id": f"in.({','.join(str(doc_id) for doc_id in document_ids)})",
+                "select": "id,title,text_content,file_type,google_drive_file_id,file_size,metadata,created_at"
+            }
+        )
+        
+        if response.status_code != 200:
+            return None
+        
+        return {
+            doc['id']: {
+                'id': doc['id'],
+                'title': doc.get('title', ''),
+                'text_content': doc.get('text_content', ''),
+                'file_type': doc.get('file_type', ''),
+                'google_drive_file_id': doc.get('google_drive_file_id', ''),
+                'file_size': doc.get('file_size', 0),
+                'metadata': doc.get('metadata', {}),
+                'created_at': doc.get('created_at', '')
+            }
+            for doc in response.json()
+        }
+    
+    def _build_group_lexical_index(self, group_id, page_size=500):
+        """Construir el índice BM25 local de un grupo descargando título y texto"""
+        ids = []
+        texts = []
+        offset = 0
+        
+        while True:
+            response = self.client.get(
+                "group_documents",
                 params={
                     "group_id": f"eq.{group_id}",
-                    "select": "id,created_at,documents(id,title,text_content,file_type,google_drive_file_id,file_size,metadata,embedding,created_at)",
-                    "limit": "100"  # Obtener más documentos para filtrar por similaridad
+                    "select": "document_id,documents(id,title,text_content)",
+                    "order": "document_id.asc",
+                    "limit": page_size,
+                    "offset": offset
                 }
             )
             
-            if documents_response.status_code != 200:
+            if response.status_code != 200:
+                logging.error(f"Error al construir índice léxico del grupo {group_id}: {response.status_code}")
+                return None
+            
+            rows = response.json()
+            for row in rows:
+                doc = row.get('documents')
+                if doc and doc.get('id'):
+                    ids.append(doc['id'])
+                    texts.append(f"{doc.get('title') or ''}\n{doc.get('text_content') or ''}")
+            
+            if len(rows) < page_size:
+                break
+            offset += len(rows)
+        
+        return self.lexical_index.build(group_id, ids, texts)
+    
+    def _search_group_lexical(self, group_id, query_text, limit):
+        """
+        Buscar documentos del grupo por términos con el índice BM25 local
+        
+        Returns:
+            Lista de (document_id, puntuación), o None si no se pudo usar el índice
+        """
+        try:
+            matches = self.lexical_index.search(group_id, query_text, 0.0, limit)
+            if matches is None:
+                if self._build_group_lexical_index(group_id) is None:
+                    return None
+                matches = self.lexical_index.search(group_id, query_text, 0.0, limit)
+        except Exception as e:
+            logging.warning(f"Índice léxico no disponible para el grupo {group_id}: {e}")
+            return None
+        return matches
+    
+    def hybrid_search_documents(self, user_id, query_text, limit=5, candidate_limit=50,
+                                threshold=0.0, rrf_k=60):
+        """
+        Buscar documentos combinando BM25 (términos exactos) y similaridad vectorial
+        
+        Cada búsqueda devuelve hasta candidate_limit candidatos y se fusionan
+        con reciprocal rank fusion, de modo que un número de factura o un nombre
+        aparece aunque su embedding no sea el más cercano a la consulta.
+        
+        Returns:
+            (éxito, documentos) con 'similarity', 'bm25_score' y 'rrf_score'
+        """
+        try:
+            user_uuid = self.resolve_user_uuid(user_id)
+            if not user_uuid:
+                return False, []
+            
+            group_id = self.resolve_personal_group_id(user_id, user_uuid)
+            if not group_id:
                 return False, []
             
-            group_docs = documents_response.json()
-            document_embeddings = []
-            
-            for group_doc in group_docs:
-                if group_doc.get('documents') and isinstance(group_doc['documents'], dict):
-                    doc = group_doc['documents']
-                    if doc.get('embedding') and doc.get('id'):
-                        document_embeddings.append({
-                            'id': doc['id'],
-                            'title': doc.get('title', ''),
-                            'text_content': doc.get('text_content', ''),
-                            'file_type': doc.get('file_type', ''),
-                            'google_drive_file_id': doc.get('google_drive_file_id', ''),
-                            'file_size': doc.get('file_size', 0),
-                            'metadata': doc.get('metadata', {}),
-                            'embedding': doc['embedding'],
-                            'created_at': doc.get('created_at', '')
-                        })
-            
-            # Usar el servicio de embeddings para encontrar documentos similares
+            lexical_matches = []
+            if self.lexical_index is not None:
+                lexical_matches = self._search_group_lexical(group_id, query_text, candidate_limit) or []
+            
+            vector_docs = []
             if self.embeddings_service:
-                similar_docs = self.embeddings_service.find_similar_documents(
-                    query_embedding=query_embedding,
-                    document_embeddings=document_embeddings,
-                    threshold=threshold,
-                    limit=limit
-                )
-                return True, similar_docs
-            else:
-                # Si no hay servicio de embeddings, retornar todos los documentos
-                return True, [doc for doc in document_embeddings[:limit]]
+                query_embedding = self.embeddings_service.generate_query_embedding(query_text)
+                vector_docs = self._search_documents_rpc(group_id, query_embedding, threshold, candidate_limit)
+                if vector_docs is None and self.document_index is not None:
+                    vector_docs = self._search_group_index(group_id, query_embedding, threshold, candidate_limit)
+                vector_docs = vector_docs or []
+            
+            if not lexical_matches and not vector_docs:
+                # Sin índices disponibles: mantener el comportamiento anterior
+                if self.lexical_index is None and not self.embeddings_service:
+                    return self.get_user_documents(user_id, limit)
+                return True, []
+            
+            fused = reciprocal_rank_fusion(
+                [[doc['id'] for doc in vector_docs], [doc_id for doc_id, _ in lexical_matches]],
+                k=rrf_k
+            )[:limit]
+            
+            documents = {doc['id']: doc for doc in vector_docs}
+            missing = [doc_id for doc_id, _ in fused if doc_id not in documents]
+            if missing:
+                fetched = self._fetch_documents_by_ids(missing)
+                if fetched is None:
+                    return False, []
+                documents.update(fetched)
+            
+            bm25_scores = dict(lexical_matches)
+            results = []
+            for doc_id, rrf_score in fused:
+                doc = documents.get(doc_id)
+                if doc is None:
+                    # Documento eliminado desde que se construyó el índice léxico
+                    self.lexical_index.remove(group_id, doc_id)
+                    continue
+                doc = dict(doc)
+                doc.setdefault('similarity', None)
+                doc['bm25_score'] = bm25_scores.get(doc_id)
+                doc['rrf_score'] = rrf_score
+                results.append(doc)
+            
+            return True, results
             
         except Exception as e:
-            logging.error(f"Error en búsqueda por similaridad: {e}")
+            logging.error(f"Error en búsqueda híbrida: {e}")
             return False, []
     
-    def get_document_content_from_drive(self, user_id, document_id):
-        """Obtener contenido completo de documento desde Google Drive"""
-        headers = self._get_supabase_headers()
-        
+    def get_document_content_from_drive(self, user_id, document_id, destination=None):
+        """
+        Obtener contenido completo de documento desde Google Drive
+        
+        Con destination (ruta u objeto de archivo binario) el contenido se
+        escribe ahí por bloques y no se carga en memoria: el resultado trae
+        'file_path' (si era una ruta) y 'file_size' en lugar de 'file_content'.
+        """
         try:
             # Obtener información del documento
-            doc_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/documents",
-                headers=headers,
+            doc_response = self.client.get(
+                "documents",
                 params={"id": f"eq.{document_id}"}
             )
             
@@ -1313,28 +1914,32 @@ class UserDatabase:
             if not google_file_id:
                 return False, "Documento no tiene archivo en Google Drive"
             
-            # Obtener UUID del usuario
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            # Obtener UUID del usuario (caché de identidad)
+            user_uuid = self.resolve_user_uuid(user_id)
+            if not user_uuid:
                 return False, "Usuario no encontrado"
             
-            user_uuid = user_response.json()[0]['id']
+            result = {
+                'document_info': document,
+                'filename': document.get('original_file_name', document.get('title', '')),
+                'mime_type': document.get('mime_type', 'application/octet-stream')
+            }
             
             # Descargar archivo de Google Drive
+            if destination is not None:
+                file_size = self.drive_service.download_to(user_uuid, google_file_id, destination)
+                if file_size is None:
+                    return False, "Error al descargar archivo de Google Drive"
+                result['file_size'] = file_size
+                if isinstance(destination, (str, os.PathLike)):
+                    result['file_path'] = os.fspath(destination)
+                return True, result
+            
             file_content = self.drive_service.download_file(user_uuid, google_file_id)
             
             if file_content:
-                return True, {
-                    'document_info': document,
-                    'file_content': file_content,
-                    'filename': document.get('original_file_name', document.get('title', '')),
-                    'mime_type': document.get('mime_type', 'application/octet-stream')
-                }
+                result['file_content'] = file_content
+                return True, result
             else:
                 return False, "Error al descargar archivo de Google Drive"
                 
@@ -1344,40 +1949,28 @@ class UserDatabase:
     
     def create_document_from_drive_file(self, user_id, drive_file_id, group_id=None):
         """Crear documento en base de datos desde archivo existente en Google Drive"""
-        headers = self._get_supabase_headers()
-        
         try:
-            # Obtener UUID del usuario
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            # Obtener UUID del usuario (caché de identidad)
+            user_uuid = self.resolve_user_uuid(user_id)
+            if not user_uuid:
                 return False, "Usuario no encontrado"
             
-            user_uuid = user_response.json()[0]['id']
-            
             # Obtener información del archivo de Google Drive
             file_info = self.drive_service.get_file_info(user_uuid, drive_file_id)
             
             if not file_info:
                 return False, "Archivo no encontrado en Google Drive"
             
-            # Descargar archivo temporalmente para procesamiento
-            file_content = self.drive_service.download_file(user_uuid, drive_file_id)
-            
-            if not file_content:
-                return False, "Error al descargar archivo para procesamiento"
-            
             # Crear archivo temporal para procesamiento
             temp_file = tempfile.NamedTemporaryFile(delete=False)
             temp_file_path = temp_file.name
+            temp_file.close()
             
             try:
-                temp_file.write(file_content)
-                temp_file.close()
+                # Descargar por bloques directamente al archivo temporal (0 bytes es válido)
+                if self.drive_service.download_to(user_uuid, drive_file_id, temp_file_path,
+                                                  file_info=file_info) is None:
+                    return False, "Error al descargar archivo para procesamiento"
                 
                 # Determinar tipo de contenido
                 file_name = file_info['name']
@@ -1386,7 +1979,7 @@ class UserDatabase:
                 
                 # Procesar y extraer texto del archivo
                 if self.embeddings_service:
-                    embedding_result = self.embeddings_service.generate_embedding_from_file(
+                    embedding_result = self._generate_embedding_from_file(
                         temp_file_path, content_type
                     )
                     
@@ -1425,7 +2018,7 @@ class UserDatabase:
                     "file_path": "",
                     "file_size": int(file_info.get('size', 0)),
                     "metadata": metadata,
-                    "embedding": embedding,
+                    "embedding": to_pgvector(embedding),
                     "google_drive_file_id": drive_file_id,
                     "original_file_name": file_name,
                     "mime_type": mime_type,
@@ -1434,9 +2027,8 @@ class UserDatabase:
                 }
                 
                 # Insertar en Supabase
-                document_response = requests.post(
-                    f"{SUPABASE_URL}/rest/v1/documents",
-                    headers=headers,
+                document_response = self.client.post(
+                    "documents",
                     json=document
                 )
                 
@@ -1452,15 +2044,8 @@ class UserDatabase:
                 
                 # Si no se especifica grupo, usar grupo personal
                 if not group_id:
-                    personal_group_response = requests.get(
-                        f"{SUPABASE_URL}/rest/v1/groups",
-                        headers=headers,
-                        params={"name": f"eq.Personal_{user_id}", "admin_id": f"eq.{user_uuid}"}
-                    )
-                    
-                    if personal_group_response.status_code == 200 and personal_group_response.json():
-                        group_id = personal_group_response.json()[0]['id']
-                    else:
+                    group_id = self.resolve_personal_group_id(user_id, user_uuid)
+                    if not group_id:
                         return False, "No se pudo encontrar grupo personal"
                 
                 # Relacionar documento con grupo
@@ -1470,15 +2055,18 @@ class UserDatabase:
                     "added_by": user_uuid
                 }
                 
-                group_doc_response = requests.post(
-                    f"{SUPABASE_URL}/rest/v1/group_documents",
-                    headers=headers,
+                group_doc_response = self.client.post(
+                    "group_documents",
                     json=group_document
                 )
                 
                 if group_doc_response.status_code != 201:
                     return False, "Error al relacionar documento con grupo"
                 
+                self.bump_group_version(group_id)
+                self._index_document(group_id, document_id, embedding, f"{file_name}\n{text_content}")
+                self._store_document_chunks(document_id, text_content, processing_metadata.get('pages'))
+                
                 return True, document_id
                 
             finally:
@@ -1506,37 +2094,20 @@ class UserDatabase:
             return 'text'  # Default fallback
     def get_personal_group_contents(self, user_id, limit=20):
         """Obtener contenidos del grupo personal del usuario"""
-        headers = self._get_supabase_headers()
-        
         try:
-            # Obtener UUID del usuario
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            # Obtener UUID del usuario (caché de identidad)
+            user_uuid = self.resolve_user_uuid(user_id)
+            if not user_uuid:
                 return False, []
             
-            user_uuid = user_response.json()[0]['id']
-            
             # Buscar el grupo personal
-            group_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/groups",
-                headers=headers,
-                params={"name": f"eq.Personal_{user_id}", "admin_id": f"eq.{user_uuid}"}
-            )
-            
-            if group_response.status_code != 200 or not group_response.json():
+            group_id = self.resolve_personal_group_id(user_id, user_uuid)
+            if not group_id:
                 return False, []
             
-            group_id = group_response.json()[0]['id']
-            
             # Obtener documentos del grupo usando la tabla group_documents con select específico
-            response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/group_documents",
-                headers=headers,
+            response = self.client.get(
+                "group_documents",
                 params={
                     "group_id": f"eq.{group_id}",
                     "select": "id,created_at,documents(id,title,content,file_type,file_path,file_size,metadata,created_at)",
@@ -1590,10 +2161,8 @@ class UserDatabase:
             return False, []
 
     def create_invitation(self, invitation_data):
-        headers = self._get_supabase_headers()
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/invitations",
-            headers=headers,
+        response = self.client.post(
+            "invitations",
             json=invitation_data
         )
         if response.status_code == 201:
@@ -1601,20 +2170,14 @@ class UserDatabase:
         return False, None
 
     def update_invitation_status(self, invitation_id, status):
-        headers = self._get_supabase_headers()
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/invitations?id=eq.{invitation_id}",
-            headers=headers,
+        response = self.client.patch(
+            f"invitations?id=eq.{invitation_id}",
             json={'status': status}
         )
         return response.status_code == 200
 
     def get_group_name(self, group_id):
-        headers = self._get_supabase_headers()
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/groups?id=eq.{group_id}",
-            headers=headers
-        )
+        response = self.client.get(f"groups?id=eq.{group_id}")
         if response.status_code == 200 and response.json():
             return response.json()[0].get('name')
         return None
@@ -1622,12 +2185,9 @@ class UserDatabase:
 
     def get_document_info(self, document_id):
         """Obtener información específica de un documento"""
-        headers = self._get_supabase_headers()
-        
         try:
-            response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/documents",
-                headers=headers,
+            response = self.client.get(
+                "documents",
                 params={"id": f"eq.{document_id}"}
             )
             
@@ -1650,37 +2210,42 @@ class UserDatabase:
 
     def get_user_documents_for_context(self, user_id, query_text, limit=3):
         """Obtener documentos del usuario para usar como contexto automático usando búsqueda vectorial"""
-        headers = self._get_supabase_headers()
-        
         try:
-            # Obtener UUID del usuario
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"telegram_id": f"eq.{user_id}"}
-            )
-            
-            if user_response.status_code != 200 or not user_response.json():
+            # Obtener UUID del usuario (caché de identidad)
+            user_uuid = self.resolve_user_uuid(user_id)
+            if not user_uuid:
                 return False, []
             
-            user_uuid = user_response.json()[0]['id']
-            
             # Buscar el grupo personal
-            group_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/groups",
-                headers=headers,
-                params={"name": f"eq.Personal_{user_id}", "admin_id": f"eq.{user_uuid}"}
-            )
+            group_id = self.resolve_personal_group_id(user_id, user_uuid)
+            if not group_id:
+                return False, []
+            
+            # Pasajes más relevantes de cada documento (en lugar de sus primeros caracteres)
+            passages = self.search_document_passages(group_id, query_text, limit) or []
+            if len(passages) >= limit:
+                return True, passages
             
-            if group_response.status_code != 200 or not group_response.json():
+            # Los documentos sin chunks (subidos antes de guardarlos por pasajes y aún
+            # sin backfill_document_chunks) solo aparecen en la búsqueda por documento
+            success, documents = self._get_document_context(user_id, group_id, query_text, limit)
+            if not success and not passages:
                 return False, []
             
-            group_id = group_response.json()[0]['id']
+            seen = {doc['id'] for doc in passages}
+            return True, passages + [doc for doc in documents if doc['id'] not in seen][:limit - len(passages)]
             
+        except Exception as e:
+            logging.error(f"Error en búsqueda vectorial: {e}")
+            # Intentar método de respaldo
+            return self.get_user_documents(user_id, limit)
+    
+    def _get_document_context(self, user_id, group_id, query_text, limit):
+        """Documentos completos (recortados) para el contexto: búsqueda por documento o recientes"""
+        try:
             # Realizar búsqueda vectorial usando la función pgvector de Supabase
-            search_response = requests.post(
-                f"{SUPABASE_URL}/rest/v1/rpc/search_documents",
-                headers=headers,
+            search_response = self.client.post(
+                "rpc/search_documents",
                 json={
                     "query_text": query_text,
                     "group_id": group_id,
@@ -0,0 +1,431 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_search import as_vector, build_embedding_matrix, normalize_rows, top_k_similar
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(tempfile.gettempdir(), 'telegramapi_index')
+# Por debajo de este tamaño la búsqueda exacta es más barata que el IVF
+MIN_IVF_SIZE = 2048
+KMEANS_ITERATIONS = 10
+# Cambios en el registro incremental antes de reescribir el archivo completo
+COMPACT_MIN_ENTRIES = 256
+
+
+class GroupVectorIndex:
+    """
+    Índice IVF-flat en NumPy de los embeddings de un grupo
+
+    Los vectores (normalizados, float32) se reparten entre nlist centroides
+    obtenidos con k-means. Una consulta compara la query con los centroides
+    y puntúa solo los vectores de las nprobe listas más cercanas. Los grupos
+    pequeños se buscan de forma exacta sobre la matriz completa.
+
+    La matriz y las asignaciones reservan capacidad de sobra (como una
+    lista de Python), así que añadir un documento no copia todo el grupo.
+    """
+
+    def __init__(self, dimension: int, nprobe: int = 8):
+        self.dimension = dimension
+        self.nprobe = nprobe
+        self.ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self.built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:len(self.ids)]
+
+    @matrix.setter
+    def matrix(self, value: np.ndarray):
+        self._matrix = value
+
+    @property
+    def assignments(self) -> np.ndarray:
+        return self._assignments[:len(self.ids)]
+
+    @assignments.setter
+    def assignments(self, value: np.ndarray):
+        self._assignments = value
+
+    def _set_ids(self, ids: List[str]):
+        self.ids = ids
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+
+    @classmethod
+    def build(cls, ids: Sequence[str], embeddings: Sequence[Any], dimension: int,
+              nprobe: int = 8) -> 'GroupVectorIndex':
+        """Construir el índice completo a partir de los embeddings del grupo"""
+        index = cls(dimension, nprobe)
+        matrix, positions = build_embedding_matrix(embeddings, dimension)
+        index._set_ids([str(ids[p]) for p in positions])
+        index.matrix = matrix
+        index._train()
+        return index
+
+    def _train(self):
+        """Calcular centroides con k-means (solo si el grupo es grande)"""
+        size = len(self.ids)
+        self.trained_size = size
+        if size < MIN_IVF_SIZE:
+            self.centroids = None
+            # Misma capacidad que la matriz
+            self._assignments = np.zeros(len(self._matrix), dtype=np.int32)
+            return
+
+        nlist = int(np.sqrt(size))
+        rng = np.random.default_rng(0)
+        centroids = self.matrix[rng.choice(size, nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(self.matrix @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = self.matrix[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = normalize_rows(centroids)
+
+        self.centroids = centroids
+        self._assignments = np.zeros(len(self._matrix), dtype=np.int32)
+        self._assignments[:size] = np.argmax(self.matrix @ centroids.T, axis=1)
+
+    def log_payload(self, embedding: Any) -> Optional[List[float]]:
+        """Vector normalizado para el registro incremental (None si no es válido)"""
+        vector = as_vector(embedding, self.dimension)
+        if vector is None:
+            return None
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        return vector.astype(np.float32).tolist()
+
+    def add(self, doc_id: str, embedding: Any) -> bool:
+        """Añadir o reemplazar un documento sin reconstruir el índice"""
+        payload = self.log_payload(embedding)
+        if payload is None:
+            return False
+        self.apply_add(doc_id, payload)
+        return True
+
+    def apply_add(self, doc_id: str, payload: List[float]):
+        """Añadir un vector ya normalizado (de add o del registro incremental)"""
+        vector = np.asarray(payload, dtype=np.float32)
+        doc_id = str(doc_id)
+        self.remove(doc_id)
+
+        size = len(self.ids)
+        if size == len(self._matrix):
+            # Sin hueco libre: duplicar la capacidad (coste amortizado constante)
+            capacity = max(16, 2 * size)
+            matrix = np.empty((capacity, self.dimension), dtype=np.float32)
+            matrix[:size] = self._matrix[:size]
+            assignments = np.zeros(capacity, dtype=np.int32)
+            assignments[:size] = self._assignments[:size]
+            self._matrix, self._assignments = matrix, assignments
+
+        self._matrix[size] = vector
+        self._assignments[size] = int(np.argmax(self.centroids @ vector)) if self.centroids is not None else 0
+        self._rows[doc_id] = size
+        self.ids.append(doc_id)
+
+        # Reentrenar cuando el grupo se ha duplicado desde el último k-means
+        if len(self.ids) >= max(MIN_IVF_SIZE, 2 * self.trained_size):
+            self._train()
+
+    def remove(self, doc_id: str) -> bool:
+        """Eliminar un documento del índice (su fila pasa a ocuparla la última)"""
+        row = self._rows.pop(str(doc_id), None)
+        if row is None:
+            return False
+        last = len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self._rows[moved] = row
+            self._matrix[row] = self._matrix[last]
+            self._assignments[row] = self._assignments[last]
+        self.ids.pop()
+        return True
+
+    def search(self, query: Any, threshold: float = 0.0, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        Buscar los documentos más similares
+
+        Returns:
+            Lista de (document_id, similaridad) ordenada de mayor a menor
+        """
+        if self.centroids is None:
+            return [(self.ids[row], score) for row, score in top_k_similar(query, self.matrix, threshold, limit)]
+
+        query_vector = as_vector(query, self.dimension)
+        if query_vector is None:
+            return []
+        probes = np.argsort(-(self.centroids @ query_vector))[:self.nprobe]
+        rows = np.flatnonzero(np.isin(self.assignments, probes))
+        return [
+            (self.ids[rows[row]], score)
+            for row, score in top_k_similar(query, self.matrix[rows], threshold, limit)
+        ]
+
+    def save(self, path: str):
+        """Guardar el índice de forma atómica (archivo temporal + rename)"""
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    ids=np.array(self.ids, dtype=str),
+                    matrix=self.matrix,
+                    centroids=self.centroids if self.centroids is not None else np.zeros((0, self.dimension), np.float32),
+                    assignments=self.assignments,
+                    meta=np.array([self.dimension, self.nprobe, self.trained_size, self.built_at], dtype=np.float64)
+                )
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'GroupVectorIndex':
+        with np.load(path) as data:
+            dimension, nprobe, trained_size, built_at = data['meta']
+            index = cls(int(dimension), int(nprobe))
+            index._set_ids(data['ids'].tolist())
+            index.matrix = data['matrix']
+            index.centroids = data['centroids'] if len(data['centroids']) else None
+            index.assignments = data['assignments']
+            index.trained_size = int(trained_size)
+            index.built_at = float(built_at)
+        return index
+
+
+class DocumentIndexManager:
+    """
+    Índices por grupo guardados en un directorio de caché local
+
+    Cada grupo tiene un archivo <group_id><suffix> con un índice de tipo
+    index_class y un registro incremental <archivo>.log (una línea JSON por
+    alta o baja). add/remove solo añaden una línea al registro; el archivo
+    completo se reescribe al construir, cuando el índice se reentrena o
+    cuando el registro crece más que el propio índice. Los índices se
+    cargan en memoria bajo demanda y cada proceso aplica solo las líneas
+    nuevas del registro, así que ve los cambios de los demás al momento.
+    Las modificaciones toman un flock sobre <archivo>.lock, de modo que el
+    bot y los workers de gunicorn no pisan los cambios de los demás. Un
+    índice con más de max_age segundos se considera caducado para que se
+    reconstruya y recoja cambios hechos desde otras máquinas.
+    """
+
+    index_class = GroupVectorIndex
+    suffix = '.npz'
+
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, max_age: float = 3600.0, nprobe: int = 8):
+        self.index_dir = index_dir
+        self.max_age = max_age
+        self.nprobe = nprobe
+        # group_id -> (índice, firma del archivo base, inodo del registro, bytes leídos, líneas)
+        self._indexes: Dict[str, Tuple[Any, Tuple[int, int], Optional[int], int, int]] = {}
+        # Reentrante: add/remove/search llaman a get dentro de la sección crítica
+        self._lock = threading.RLock()
+        os.makedirs(index_dir, exist_ok=True)
+
+    def _path(self, group_id) -> str:
+        return os.path.join(self.index_dir, f"{group_id}{self.suffix}")
+
+    def _log_path(self, group_id) -> str:
+        return self._path(group_id) + '.log'
+
+    @contextmanager
+    def _locked(self, group_id):
+        """Exclusión entre hilos y entre procesos del equipo para modificar el archivo de un grupo"""
+        with self._lock:
+            with open(self._path(group_id) + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def get(self, group_id) -> Optional[Any]:
+        """Obtener el índice vigente de un grupo, o None si hay que construirlo"""
+        group_id = str(group_id)
+        path = self._path(group_id)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._indexes.pop(group_id, None)
+                return None
+            # os.replace crea un inodo nuevo: detecta reescrituras aunque coincida el mtime
+            signature = (stat.st_ino, stat.st_mtime_ns)
+
+            cached = self._indexes.get(group_id)
+            if cached is None or cached[1] != signature:
+                try:
+                    cached = (self.index_class.load(path), signature, None, 0, 0)
+                except Exception as e:
+                    logger.warning(f"Índice del grupo {group_id} ilegible, se reconstruirá: {e}")
+                    return None
+            cached = self._replay_log(group_id, cached)
+            self._indexes[group_id] = cached
+
+            index = cached[0]
+            if time.time() - index.built_at > self.max_age:
+                return None
+            return index
+
+    def _replay_log(self, group_id: str, cached: Tuple[Any, Tuple[int, int], Optional[int], int, int]):
+        """Aplicar las líneas del registro incremental que aún no se leyeron"""
+        index, signature, log_inode, offset, entries = cached
+        try:
+            with open(self._log_path(group_id), 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != log_inode:
+                    # Registro nuevo tras una compactación: se lee desde el principio
+                    log_inode, offset, entries = inode, 0, 0
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return cached
+
+        # Solo líneas completas: otra escritura puede estar en curso
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            if entry['op'] == 'add':
+                index.apply_add(entry['id'], entry['data'])
+            else:
+                index.remove(entry['id'])
+            entries += 1
+        return index, signature, log_inode, offset + len(complete), entries
+
+    def _append_log(self, group_id: str, entry: Dict[str, Any]):
+        """Añadir una línea al registro (llamar dentro de _locked, tras get)"""
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        fd = os.open(self._log_path(group_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            inode = os.fstat(fd).st_ino
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        index, signature, log_inode, offset, entries = self._indexes[group_id]
+        if inode != log_inode:
+            # Primera línea de un registro nuevo (get ya aplicó todo lo anterior)
+            offset, entries = 0, 0
+        self._indexes[group_id] = (index, signature, inode, offset + len(line), entries + 1)
+
+    def build(self, group_id, ids: Sequence[str], embeddings: Sequence[Any], dimension: int) -> GroupVectorIndex:
+        """Construir y guardar el índice completo de un grupo"""
+        index = GroupVectorIndex.build(ids, embeddings, dimension, self.nprobe)
+        with self._locked(group_id):
+            self._store(str(group_id), index)
+        logger.info(f"Índice del grupo {group_id} construido con {len(index)} documentos")
+        return index
+
+    def search(self, group_id, query, threshold: float = 0.0,
+               limit: int = 5) -> Optional[List[Tuple[str, float]]]:
+        """Buscar en el índice del grupo; None si no hay índice vigente"""
+        with self._lock:
+            index = self.get(group_id)
+            if index is None:
+                return None
+            return index.search(query, threshold, limit)
+
+    def add(self, group_id, doc_id, data) -> bool:
+        """Añadir un documento al índice del grupo si ya existe"""
+        group_id = str(group_id)
+        with self._locked(group_id):
+            index = self.get(group_id)
+            if index is None:
+                return False
+            payload = index.log_payload(data)
+            if payload is None:
+                return False
+
+            trained_size = getattr(index, 'trained_size', None)
+            self._append_log(group_id, {'op': 'add', 'id': str(doc_id), 'data': payload})
+            index.apply_add(doc_id, payload)
+            self._compact_if_needed(group_id, index, getattr(index, 'trained_size', None) != trained_size)
+            return True
+
+    def remove(self, group_id, doc_id) -> bool:
+        """Eliminar un documento del índice del grupo si existe"""
+        group_id = str(group_id)
+        with self._locked(group_id):
+            index = self.get(group_id)
+            if index is None or not index.remove(doc_id):
+                return False
+            self._append_log(group_id, {'op': 'remove', 'id': str(doc_id)})
+            self._compact_if_needed(group_id, index)
+            return True
+
+    def _compact_if_needed(self, group_id: str, index: Any, retrained: bool = False):
+        """Reescribir el archivo completo si el índice se reentrenó o el registro ya es grande"""
+        entries = self._indexes[group_id][4]
+        if retrained or entries > max(COMPACT_MIN_ENTRIES, len(index)):
+            self._store(group_id, index)
+
+    def _store(self, group_id: str, index: Any):
+        """Guardar el índice completo de un grupo y vaciar su registro (llamar dentro de _locked)"""
+        with self._lock:
+            path = self._path(group_id)
+            index.save(path)
+            # Quien lea el registro anterior junto al archivo nuevo solo reaplica
+            # cambios ya incluidos: altas y bajas son idempotentes
+            try:
+                os.unlink(self._log_path(group_id))
+            except FileNotFoundError:
+                pass
+            stat = os.stat(path)
+            self._indexes[group_id] = (index, (stat.st_ino, stat.st_mtime_ns), None, 0, 0)
+
+
+_manager: Optional[DocumentIndexManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_document_index() -> Optional[DocumentIndexManager]:
+    """
+    Obtener el gestor de índices compartido del proceso
+
+    DOCUMENT_INDEX_DIR define el directorio, DOCUMENT_INDEX_MAX_AGE los
+    segundos antes de reconstruir (0 desactiva el índice local) y
+    DOCUMENT_INDEX_NPROBE las listas exploradas por consulta.
+    """
+    global _manager
+    max_age = float(os.getenv('DOCUMENT_INDEX_MAX_AGE', 3600))
+    if max_age <= 0:
+        return None
+
+    with _manager_lock:
+        if _manager is None:
+            try:
+                _manager = DocumentIndexManager(
+                    index_dir=os.getenv('DOCUMENT_INDEX_DIR', DEFAULT_INDEX_DIR),
+                    max_age=max_age,
+                    nprobe=int(os.getenv('DOCUMENT_INDEX_NPROBE', 8))
+                )
+            except OSError as e:
+                logger.error(f"No se pudo crear el directorio de índices: {e}")
+                return None
+        return _manager
@@ -0,0 +1,195 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOB_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'telegramapi_drive_blobs')
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+BLOB_SUFFIX = '.blob'
+TEMP_SUFFIX = '.tmp'
+# Temporales de escrituras interrumpidas (proceso caído) que se pueden borrar
+STALE_TEMP_SECONDS = 3600
+
+
+class DriveBlobCache:
+    """
+    Caché en disco del contenido de archivos de Google Drive
+
+    Cada archivo se guarda con el hash de (google_drive_file_id, modifiedTime):
+    si el archivo cambia en Drive la clave cambia y la versión anterior se
+    desaloja con el tiempo. Solo usa el sistema de archivos, así que los
+    workers de gunicorn y el bot del mismo host comparten el directorio:
+    - las escrituras van a un temporal y se publican con os.replace (nadie
+      ve un archivo a medias);
+    - cada acierto actualiza la fecha de modificación, que sirve de orden LRU;
+    - al superar max_bytes se borran los archivos usados hace más tiempo;
+      quien ya tenía uno abierto lo sigue leyendo aunque se borre.
+    """
+
+    def __init__(self, directory: str = DEFAULT_BLOB_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Inicializar caché
+
+        Args:
+            directory: Directorio de los archivos (se crea si no existe)
+            max_bytes: Tamaño total máximo antes de desalojar
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_id: str, modified_time: str) -> str:
+        """Clave de una versión de un archivo de Drive"""
+        return hashlib.sha256(f"{file_id}:{modified_time}".encode('utf-8')).hexdigest()
+
+    def path_for(self, file_id: str, modified_time: str) -> str:
+        return os.path.join(self.directory, self.make_key(file_id, modified_time) + BLOB_SUFFIX)
+
+    def get(self, file_id: str, modified_time: str) -> Optional[str]:
+        """
+        Ruta del archivo en caché, o None si no está
+
+        La ruta puede desaparecer si otro proceso desaloja la entrada: abrirla
+        en seguida y, si falla, tratarlo como un fallo de caché.
+        """
+        path = self.path_for(file_id, modified_time)
+        try:
+            # Marcar como usado recientemente (orden LRU compartido entre procesos)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, file_id: str, modified_time: str, fill: Callable[[str], Optional[int]]) -> Optional[str]:
+        """
+        Guardar una versión de un archivo escribiéndola de forma atómica
+
+        Args:
+            fill: Función que escribe el contenido en la ruta temporal que recibe
+                  y devuelve los bytes escritos (None si falló)
+
+        Returns:
+            Ruta del archivo en caché, o None si fill falló o no cabe
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=TEMP_SUFFIX)
+        os.close(fd)
+        try:
+            size = fill(tmp_path)
+            if size is None or size > self.max_bytes:
+                return None
+            path = self.path_for(file_id, modified_time)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str = None):
+        """Borrar los archivos usados hace más tiempo hasta respetar max_bytes"""
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(TEMP_SUFFIX):
+                if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                    self._unlink(entry.path)
+                continue
+            if entry.name.endswith(BLOB_SUFFIX):
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            # Otro proceso pudo borrarlo antes: cuenta igual como liberado
+            self._unlink(path)
+            evicted += 1
+            freed += size
+        logger.info(f"Caché de archivos de Drive: {evicted} archivos desalojados ({freed} bytes)")
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Borrar todos los archivos de la caché y reiniciar contadores"""
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(BLOB_SUFFIX):
+                self._unlink(entry.path)
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Obtener contadores de uso (de este proceso) y tamaño (compartido)"""
+        entries = 0
+        size = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(BLOB_SUFFIX):
+                try:
+                    size += entry.stat().st_size
+                    entries += 1
+                except FileNotFoundError:
+                    continue
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'size_bytes': size,
+            'max_bytes': self.max_bytes
+        }
+
+
+def get_drive_blob_cache() -> Optional[DriveBlobCache]:
+    """
+    Crear la caché configurada por entorno
+
+    DRIVE_BLOB_CACHE_DIR define el directorio y DRIVE_BLOB_CACHE_MAX_MB el
+    tamaño; un tamaño de 0 desactiva la caché.
+    """
+    max_mb = float(os.getenv('DRIVE_BLOB_CACHE_MAX_MB', DEFAULT_MAX_BYTES / (1024 * 1024)))
+    if max_mb <= 0:
+        return None
+
+    try:
+        return DriveBlobCache(
+            directory=os.getenv('DRIVE_BLOB_CACHE_DIR', DEFAULT_BLOB_CACHE_DIR),
+            max_bytes=int(max_mb * 1024 * 1024)
+        )
+    except OSError as e:
+        logger.error(f"No se pudo crear la caché de archivos de Drive: {e}")
+        return None
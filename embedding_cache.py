@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from vector_search import Embedding
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'telegramapi_embeddings.sqlite3')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 del contenido de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 del texto normalizado (espacios colapsados)"""
+    normalized = ' '.join(text.split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Caché persistente de texto extraído y embeddings en SQLite
+
+    Las entradas se identifican por el hash del contenido (archivo o texto)
+    y el nombre del modelo, de modo que un mismo archivo subido varias veces
+    no vuelve a pasar por OCR ni por el modelo. El vector se guarda como
+    float32 binario. Cuando el tamaño total supera max_bytes se eliminan las
+    entradas usadas hace más tiempo. SQLite en modo WAL permite compartir el
+    archivo entre el bot y la interfaz web.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Inicializar caché
+
+        Args:
+            path: Ruta del archivo SQLite
+            max_bytes: Tamaño máximo aproximado (texto + vectores) antes de desalojar
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    metadata TEXT,
+                    size_bytes INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+            )
+
+    @staticmethod
+    def make_key(content_hash: str, model_name: str, kind: str = 'file') -> str:
+        """Construir la clave de una entrada (tipo, modelo y hash del contenido)"""
+        return f"{kind}:{model_name}:{content_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtener una entrada y marcarla como usada
+
+        Returns:
+            Diccionario con text, embedding y metadata, o None si no existe
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, embedding, metadata FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+
+        text, blob, metadata = row
+        return {
+            'text': text,
+            'embedding': Embedding(np.frombuffer(blob, dtype=np.float32)),
+            'metadata': json.loads(metadata) if metadata else {}
+        }
+
+    def set(self, key: str, text: str, embedding: Any, metadata: Dict[str, Any] = None):
+        """Guardar una entrada, desalojando las menos usadas si se supera el tamaño"""
+        blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        size_bytes = len(text.encode('utf-8')) + len(blob)
+        if size_bytes > self.max_bytes:
+            return
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, text, embedding, metadata, size_bytes, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, text, blob, json.dumps(metadata or {}), size_bytes, time.time())
+            )
+            self._evict()
+
+    def _evict(self):
+        """Eliminar las entradas menos usadas hasta respetar max_bytes"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size_bytes in self._conn.execute(
+            "SELECT key, size_bytes FROM embeddings ORDER BY last_access ASC"
+        ):
+            stale_keys.append((key,))
+            freed += size_bytes
+            if freed >= excess:
+                break
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale_keys)
+        logger.info(f"Caché de embeddings: {len(stale_keys)} entradas desalojadas ({freed} bytes)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Obtener contadores de uso y tamaño"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM embeddings"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'size_bytes': size,
+            'max_bytes': self.max_bytes
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_default_cache() -> Optional[EmbeddingCache]:
+    """
+    Crear la caché configurada por entorno
+
+    EMBEDDING_CACHE_PATH define el archivo y EMBEDDING_CACHE_MAX_MB el tamaño;
+    un tamaño de 0 desactiva la caché.
+    """
+    max_mb = float(os.getenv('EMBEDDING_CACHE_MAX_MB', DEFAULT_MAX_BYTES / (1024 * 1024)))
+    if max_mb <= 0:
+        return None
+
+    try:
+        return EmbeddingCache(
+            path=os.getenv('EMBEDDING_CACHE_PATH', DEFAULT_CACHE_PATH),
+            max_bytes=int(max_mb * 1024 * 1024)
+        )
+    except sqlite3.Error as e:
+        logger.error(f"No se pudo abrir la caché de embeddings: {e}")
+        return None
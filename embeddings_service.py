@@ -1,44 +1,110 @@
 import os
 import io
+import time
 import logging
-from typing import List, Optional, Dict, Any
-from sentence_transformers import SentenceTransformer
+import threading
+import importlib.util
+from typing import List, Optional, Dict, Any, Tuple
 import numpy as np
 import openai
-from PIL import Image
-import pytesseract
-import PyPDF2
 import docx
 import json
 import tempfile
 import base64
 from io import BytesIO
+from embedding_cache import EmbeddingCache, get_default_cache, hash_file, hash_text
+from vector_search import (Embedding, QuantizedMatrix, as_vector, build_embedding_matrix,
+                           top_k_quantized, top_k_similar)
+from ttl_cache import TTLCache
+from pdf_extraction import extract_pdf_text, get_pdf_limits
+from ocr import get_ocr_engine
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# sentence-transformers (y torch) solo se importa al cargar el modelo, pero
+# su ausencia se sigue informando al importar este módulo
+if importlib.util.find_spec('sentence_transformers') is None:
+    raise ImportError("No module named 'sentence_transformers'")
+
+# Límite de caracteres por texto antes de generar el embedding
+MAX_EMBEDDING_TEXT_LENGTH = 5000
+DEFAULT_EMBEDDING_BATCH_SIZE = 32
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+
 class EmbeddingsService:
     """Servicio para generar embeddings vectoriales de documentos"""
     
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", use_openai: bool = False):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", use_openai: bool = False,
+                 cache: Optional[EmbeddingCache] = None):
         """
         Inicializar servicio de embeddings
         
         Args:
             model_name: Nombre del modelo de sentence-transformers
             use_openai: Si usar OpenAI para embeddings (requiere API key)
+            cache: Caché de texto/embeddings por contenido (por defecto la configurada por entorno)
         """
         self.use_openai = use_openai
         self.model_name = model_name
+        self.cache = cache if cache is not None else get_default_cache()
+        
+        # Caché en memoria de consultas frecuentes: texto normalizado -> embedding
+        query_cache_size = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 2048))
+        self.query_cache = TTLCache(
+            maxsize=query_cache_size,
+            ttl=float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', 3600))
+        ) if query_cache_size > 0 else None
+        
+        # Presupuesto de páginas y caracteres por PDF
+        self.pdf_max_pages, self.pdf_max_chars = get_pdf_limits()
+        
+        # OCR de fotos y PDF escaneados (preprocesado y caché por hash de imagen)
+        self.ocr = get_ocr_engine()
+        
+        # Desde cuántos documentos usar la búsqueda cuantizada int8 (0 = nunca)
+        self.quantized_min_documents = int(os.getenv('QUANTIZED_SEARCH_MIN_DOCUMENTS', 0))
+        self.quantized_oversample = int(os.getenv('QUANTIZED_SEARCH_OVERSAMPLE', 4))
+        
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._uncased = None
         
         if use_openai:
             openai.api_key = os.getenv('OPENAI_API_KEY')
             self.embedding_model = "text-embedding-ada-002"
-        else:
-            # Cargar modelo local de sentence-transformers
-            self.model = SentenceTransformer(model_name)
-            logger.info(f"Modelo de embeddings cargado: {model_name}")
+    
+    @property
+    def model(self):
+        """Modelo local de sentence-transformers, cargado en el primer uso"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+                    logger.info(f"Modelo de embeddings cargado: {self.model_name}")
+        return self._model
+    
+    @property
+    def model_loaded(self) -> bool:
+        """Indica si el modelo local ya está en memoria"""
+        return self._model is not None
+    
+    @property
+    def uncased(self) -> bool:
+        """Indica si el modelo pasa el texto a minúsculas (modelos locales uncased)"""
+        if self.use_openai:
+            return False
+        if self._uncased is None:
+            try:
+                tokenizer = getattr(self.model, 'tokenizer', None)
+            except Exception as e:
+                logger.warning(f"No se pudo cargar el modelo para consultar su tokenizer: {e}")
+                return False
+            self._uncased = bool(getattr(tokenizer, 'do_lower_case', False))
+        return self._uncased
     
     def extract_text_from_file(self, file_path: str, content_type: str) -> str:
         """
@@ -69,23 +135,30 @@ class EmbeddingsService:
     
     def _extract_text_from_pdf(self, file_path: str) -> str:
         """Extraer texto de archivo PDF"""
-        text = ""
+        return self.extract_pdf(file_path)['text']
+    
+    def extract_pdf(self, file_path: str, submit=None) -> Dict[str, Any]:
+        """
+        Extraer texto de un PDF página a página, dentro del presupuesto configurado
+        
+        Args:
+            file_path: Ruta del archivo
+            submit: Función para repartir rangos de páginas (ej: ProcessingPool.submit)
+            
+        Returns:
+            Diccionario con text, pages (rango de caracteres de cada página),
+            page_count, pages_read y truncated
+        """
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+            return extract_pdf_text(file_path, self.pdf_max_pages, self.pdf_max_chars, submit=submit)
         except Exception as e:
             logger.error(f"Error al leer PDF: {e}")
-        
-        return text.strip()
+            return {'text': "", 'pages': [], 'page_count': 0, 'pages_read': 0, 'truncated': False}
     
     def _extract_text_from_image(self, file_path: str) -> str:
         """Extraer texto de imagen usando OCR"""
         try:
-            image = Image.open(file_path)
-            text = pytesseract.image_to_string(image, lang='spa+eng')
-            return text.strip()
+            return self.ocr.ocr_file(file_path)
         except Exception as e:
             logger.error(f"Error en OCR: {e}")
             return ""
@@ -120,7 +193,7 @@ class EmbeddingsService:
             logger.error(f"Error al leer archivo de texto: {e}")
             return ""
     
-    def generate_embedding(self, text: str) -> List[float]:
+    def generate_embedding(self, text: str) -> Embedding:
         """
         Generar embedding vectorial de texto
         
@@ -128,7 +201,7 @@ class EmbeddingsService:
             text: Texto para generar embedding
             
         Returns:
-            Lista de floats representando el embedding
+            Embedding (array float32) del texto
         """
         if not text.strip():
             logger.warning("Texto vacío para generar embedding")
@@ -143,62 +216,174 @@ class EmbeddingsService:
             logger.error(f"Error al generar embedding: {e}")
             return self._get_zero_embedding()
     
-    def _generate_openai_embedding(self, text: str) -> List[float]:
+    def _generate_openai_embedding(self, text: str) -> Embedding:
         """Generar embedding usando OpenAI API"""
         try:
             response = openai.Embedding.create(
                 model=self.embedding_model,
                 input=text
             )
-            embedding = response['data'][0]['embedding']
-            return embedding
+            return Embedding(response['data'][0]['embedding'])
         except Exception as e:
             logger.error(f"Error con OpenAI API: {e}")
             return self._get_zero_embedding()
     
-    def _generate_local_embedding(self, text: str) -> List[float]:
+    def _generate_local_embedding(self, text: str) -> Embedding:
         """Generar embedding usando modelo local"""
         try:
             # Limitar longitud del texto para evitar problemas de memoria
-            if len(text) > 5000:
-                text = text[:5000]
+            if len(text) > MAX_EMBEDDING_TEXT_LENGTH:
+                text = text[:MAX_EMBEDDING_TEXT_LENGTH]
             
-            embedding = self.model.encode(text)
-            return embedding.tolist()
+            # encode() ya devuelve float32: se envuelve sin copiar
+            return Embedding(self.model.encode(text))
         except Exception as e:
             logger.error(f"Error con modelo local: {e}")
             return self._get_zero_embedding()
     
-    def _get_zero_embedding(self) -> List[float]:
+    def generate_embeddings_batch(self, texts: List[str],
+                                  batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE) -> List[Embedding]:
+        """
+        Generar embeddings de varios textos en lotes
+        
+        Con el modelo local cada lote se codifica en una sola llamada a
+        encode(); con OpenAI cada lote es una única solicitud a la API.
+        
+        Args:
+            texts: Textos para generar embeddings
+            batch_size: Número de textos por lote
+            
+        Returns:
+            Lista de embeddings en el mismo orden que texts (ceros para textos vacíos)
+        """
+        embeddings = [None] * len(texts)
+        
+        # Los textos vacíos no se envían al modelo
+        pending = []
+        for i, text in enumerate(texts):
+            if text and text.strip():
+                pending.append((i, text[:MAX_EMBEDDING_TEXT_LENGTH]))
+            else:
+                embeddings[i] = self._get_zero_embedding()
+        
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            batch_texts = [text for _, text in batch]
+            
+            try:
+                if self.use_openai:
+                    batch_embeddings = self._generate_openai_embeddings_batch(batch_texts)
+                else:
+                    batch_embeddings = [Embedding(row) for row in self.model.encode(
+                        batch_texts, batch_size=batch_size, show_progress_bar=False
+                    )]
+            except Exception as e:
+                logger.error(f"Error al generar lote de embeddings: {e}")
+                batch_embeddings = [self._get_zero_embedding() for _ in batch]
+            
+            for (i, _), embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+        
+        return embeddings
+    
+    def _generate_openai_embeddings_batch(self, texts: List[str]) -> List[Embedding]:
+        """Generar embeddings de un lote con una sola solicitud a OpenAI"""
+        response = openai.Embedding.create(
+            model=self.embedding_model,
+            input=texts
+        )
+        # La API puede no respetar el orden de entrada; usar el índice
+        data = sorted(response['data'], key=lambda item: item['index'])
+        return [Embedding(item['embedding']) for item in data]
+    
+    def _get_zero_embedding(self) -> Embedding:
         """Obtener embedding de ceros como fallback"""
         # Dimensión estándar para text-embedding-ada-002 o all-MiniLM-L6-v2
-        dimension = 1536 if self.use_openai else 384
-        return [0.0] * dimension
+        return Embedding.zeros(self.get_embedding_dimension())
+    
+    def get_cached_file_embedding(self, file_path: str, content_type: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Buscar en la caché el resultado de un archivo ya procesado con este modelo
+        
+        Returns:
+            (resultado en caché o None, clave de la caché o None si no hay caché)
+        """
+        if self.cache is None:
+            return None, None
+        
+        model_name = self.embedding_model if self.use_openai else self.model_name
+        try:
+            file_key = self.cache.make_key(f"{content_type}:{hash_file(file_path)}", model_name)
+        except OSError as e:
+            logger.warning(f"No se pudo calcular el hash de {file_path}: {e}")
+            return None, None
+        
+        cached = self.cache.get(file_key)
+        if cached is not None:
+            cached['metadata']['cache_hit'] = True
+        return cached, file_key
     
-    def generate_embedding_from_file(self, file_path: str, content_type: str) -> Dict[str, Any]:
+    def generate_embedding_from_file(self, file_path: str, content_type: str,
+                                     extraction: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Generar embedding de archivo completo
         
+        Si el mismo contenido ya se procesó con este modelo, el texto y el
+        embedding se leen de la caché sin volver a extraer ni codificar.
+        
         Args:
             file_path: Ruta del archivo
             content_type: Tipo de contenido
+            extraction: Resultado de extract_pdf ya calculado (ej: en paralelo por el pool)
             
         Returns:
             Diccionario con embedding y metadata
         """
-        # Extraer texto del archivo
-        text = self.extract_text_from_file(file_path, content_type)
+        model_name = self.embedding_model if self.use_openai else self.model_name
+        
+        cached, file_key = self.get_cached_file_embedding(file_path, content_type)
+        if cached is not None:
+            return cached
+        
+        # Extraer texto del archivo (los PDF conservan el rango de cada página)
+        if extraction is None and content_type == 'pdf':
+            extraction = self.extract_pdf(file_path)
+        text = extraction['text'] if extraction is not None else self.extract_text_from_file(file_path, content_type)
+        
+        # Mismo texto con otros bytes (ej: PDF re-exportado): reutilizar el vector
+        text_key = None
+        embedding = None
+        if self.cache is not None and text.strip():
+            text_key = self.cache.make_key(hash_text(text), model_name, kind='text')
+            cached = self.cache.get(text_key)
+            if cached is not None:
+                embedding = cached['embedding']
         
         # Generar embedding
-        embedding = self.generate_embedding(text)
+        if embedding is None:
+            embedding = self.generate_embedding(text)
+            # generate_embedding devuelve ceros si falla: no guardarlos
+            if text_key is not None and not embedding.is_zero():
+                self.cache.set(text_key, '', embedding)
         
         # Generar metadata
         metadata = {
             'content_type': content_type,
             'text_length': len(text),
-            'embedding_model': self.embedding_model if self.use_openai else self.model_name,
+            'embedding_model': model_name,
             'extraction_success': bool(text.strip())
         }
+        if extraction is not None:
+            metadata.update({
+                'page_count': extraction['page_count'],
+                'pages_read': extraction['pages_read'],
+                'truncated': extraction['truncated'],
+                'pages': extraction['pages']
+            })
+        
+        # No guardar fallos de extracción ni de modelo: podrían ser temporales
+        if file_key is not None and text.strip() and not embedding.is_zero():
+            self.cache.set(file_key, text, embedding, metadata)
         
         return {
             'text': text,
@@ -247,6 +432,9 @@ class EmbeddingsService:
         """
         Encontrar documentos similares usando embeddings
         
+        A partir de QUANTIZED_SEARCH_MIN_DOCUMENTS documentos puntúa con
+        embeddings int8 y re-puntúa de forma exacta los mejores candidatos.
+        
         Args:
             query_embedding: Embedding de la consulta
             document_embeddings: Lista de documentos con embeddings
@@ -256,26 +444,58 @@ class EmbeddingsService:
         Returns:
             Lista de documentos similares ordenados por similaridad
         """
+        candidates = [doc for doc in document_embeddings if 'embedding' in doc]
+        
+        if self.quantized_min_documents and len(candidates) >= self.quantized_min_documents:
+            matches = self._top_k_quantized(query_embedding, candidates, threshold, limit)
+        else:
+            # Una matriz float32 normalizada y un solo producto matricial para todos
+            matrix, positions = build_embedding_matrix(
+                [doc['embedding'] for doc in candidates],
+                dimension=len(query_embedding)
+            )
+            matches = [(positions[row], similarity)
+                       for row, similarity in top_k_similar(query_embedding, matrix, threshold, limit)]
+        
         results = []
+        for position, similarity in matches:
+            # Copiar solo los documentos que se devuelven
+            doc_result = candidates[position].copy()
+            doc_result['similarity'] = similarity
+            results.append(doc_result)
         
-        for doc in document_embeddings:
-            if 'embedding' not in doc:
-                continue
-            
-            similarity = self.calculate_similarity(query_embedding, doc['embedding'])
-            
-            if similarity >= threshold:
-                doc_result = doc.copy()
-                doc_result['similarity'] = similarity
-                results.append(doc_result)
+        return results
+    
+    def _top_k_quantized(self, query_embedding: Any, candidates: List[Dict],
+                         threshold: float, limit: int) -> List[Tuple[int, float]]:
+        """
+        Top-k aproximado con embeddings int8 y re-puntuación exacta de los mejores
         
-        # Ordenar por similaridad descendente
-        results.sort(key=lambda x: x['similarity'], reverse=True)
+        Los embeddings se cuantizan por bloques, así que nunca se mantiene la
+        matriz float32 de todos los documentos; los vectores originales solo se
+        vuelven a leer para los candidatos re-puntuados.
         
-        return results[:limit]
+        Returns:
+            Lista de (posición en candidates, similaridad exacta)
+        """
+        quantized, positions = QuantizedMatrix.from_embeddings(
+            [doc['embedding'] for doc in candidates],
+            dimension=len(query_embedding)
+        )
+        
+        def rescore(rows: List[int]) -> np.ndarray:
+            return build_embedding_matrix(
+                [candidates[positions[row]]['embedding'] for row in rows],
+                dimension=quantized.dimension
+            )[0]
+        
+        matches = top_k_quantized(query_embedding, quantized, rescore, threshold, limit,
+                                  oversample=self.quantized_oversample)
+        return [(positions[row], similarity) for row, similarity in matches]
     
     def process_file_for_search(self, file_path: str, content_type: str, 
-                               chunk_size: int = 1000, overlap: int = 200) -> List[Dict]:
+                               chunk_size: int = DEFAULT_CHUNK_SIZE, overlap: int = DEFAULT_CHUNK_OVERLAP,
+                               batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE) -> List[Dict]:
         """
         Procesar archivo dividiéndolo en chunks para mejor búsqueda
         
@@ -284,49 +504,66 @@ class EmbeddingsService:
             content_type: Tipo de contenido
             chunk_size: Tamaño del chunk en caracteres
             overlap: Solapamiento entre chunks
+            batch_size: Chunks por lote al generar embeddings
             
         Returns:
             Lista de chunks con embeddings
         """
         text = self.extract_text_from_file(file_path, content_type)
         
-        if not text.strip():
+        chunk_embeddings = self.generate_chunk_embeddings(text, chunk_size, overlap, batch_size)
+        for chunk in chunk_embeddings:
+            chunk['content_type'] = content_type
+        
+        return chunk_embeddings
+    
+    def generate_chunk_embeddings(self, text: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                  overlap: int = DEFAULT_CHUNK_OVERLAP,
+                                  batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE) -> List[Dict]:
+        """
+        Dividir un texto ya extraído en chunks y generar sus embeddings en lotes
+        
+        Returns:
+            Lista de dicts con chunk_id, text, start_char y embedding
+        """
+        if not text or not text.strip():
             return []
         
-        # Dividir texto en chunks
-        chunks = self._create_text_chunks(text, chunk_size, overlap)
+        spans = self._create_text_chunk_spans(text, chunk_size, overlap)
+        embeddings = self.generate_embeddings_batch([chunk for _, chunk in spans], batch_size=batch_size)
         
-        # Generar embeddings para cada chunk
-        chunk_embeddings = []
-        for i, chunk in enumerate(chunks):
-            embedding = self.generate_embedding(chunk)
-            chunk_embeddings.append({
+        return [
+            {
                 'chunk_id': i,
                 'text': chunk,
-                'embedding': embedding,
-                'content_type': content_type
-            })
-        
-        return chunk_embeddings
+                'start_char': start,
+                'embedding': embedding
+            }
+            for i, ((start, chunk), embedding) in enumerate(zip(spans, embeddings))
+        ]
     
     def _create_text_chunks(self, text: str, chunk_size: int, overlap: int) -> List[str]:
         """Dividir texto en chunks con solapamiento"""
+        return [chunk for _, chunk in self._create_text_chunk_spans(text, chunk_size, overlap)]
+    
+    def _create_text_chunk_spans(self, text: str, chunk_size: int, overlap: int) -> List[Tuple[int, str]]:
+        """Dividir texto en chunks con solapamiento, con la posición inicial de cada uno"""
         chunks = []
         start = 0
         
         while start < len(text):
             end = min(start + chunk_size, len(text))
-            chunk = text[start:end]
-            chunks.append(chunk)
+            chunks.append((start, text[start:end]))
             
             if end == len(text):
                 break
                 
-            start = end - overlap
+            # Avanzar siempre, aunque el solapamiento sea mayor que el chunk
+            start = max(end - overlap, start + 1)
         
         return chunks
     
-    def generate_query_embedding(self, query: str) -> List[float]:
+    def generate_query_embedding(self, query: str) -> Embedding:
         """
         Generar embedding para consulta de búsqueda
         
@@ -336,36 +573,46 @@ class EmbeddingsService:
         Returns:
             Embedding de la consulta
         """
-        return self.generate_embedding(query)
+        if self.query_cache is None or not query.strip():
+            return self.generate_embedding(query)
+        
+        # Los espacios no cambian la pregunta; las mayúsculas solo si el modelo las ignora
+        key = ' '.join((query.lower() if self.uncased else query).split())
+        start = time.perf_counter()
+        embedding = self.query_cache.get(key)
+        if embedding is not None:
+            self.query_cache.record_hit_cost(time.perf_counter() - start)
+            return embedding
+        
+        embedding = self.generate_embedding(query)
+        # No guardar el vector de ceros que se devuelve cuando falla el modelo
+        if not embedding.is_zero():
+            self.query_cache.set(key, embedding)
+            self.query_cache.record_miss_cost(time.perf_counter() - start)
+        return embedding
     
     def get_embedding_dimension(self) -> int:
         """Obtener dimensión del embedding"""
         return 1536 if self.use_openai else 384
     
-    def validate_embedding(self, embedding: List[float]) -> bool:
+    def validate_embedding(self, embedding: Any) -> bool:
         """
         Validar que el embedding sea válido
         
         Args:
-            embedding: Embedding a validar
+            embedding: Embedding, lista o array a validar
             
         Returns:
             True si es válido, False si no
         """
-        if not isinstance(embedding, list):
+        if isinstance(embedding, str):
             return False
         
-        if len(embedding) != self.get_embedding_dimension():
-            return False
-        
-        # Verificar que todos los valores sean números válidos
-        for value in embedding:
-            if not isinstance(value, (int, float)) or np.isnan(value) or np.isinf(value):
-                return False
-        
-        return True
+        # Dimensión y valores finitos en una sola operación sobre el array
+        vector = as_vector(embedding, self.get_embedding_dimension())
+        return vector is not None and bool(np.isfinite(vector).all())
     
-    def normalize_embedding(self, embedding: List[float]) -> List[float]:
+    def normalize_embedding(self, embedding: Any) -> Embedding:
         """
         Normalizar embedding para mejor rendimiento
         
@@ -376,14 +623,40 @@ class EmbeddingsService:
             Embedding normalizado
         """
         try:
-            vec = np.array(embedding)
+            vec = np.asarray(embedding, dtype=np.float32)
             norm = np.linalg.norm(vec)
             
             if norm == 0:
-                return embedding
+                return Embedding(vec)
             
-            normalized = vec / norm
-            return normalized.tolist()
+            return Embedding(vec / norm)
         except Exception as e:
             logger.error(f"Error normalizando embedding: {e}")
-            return embedding
\ No newline at end of file
+            return embedding
+
+
+_services: Dict[Tuple[str, bool], EmbeddingsService] = {}
+_services_lock = threading.Lock()
+
+
+def get_embeddings_service(model_name: str = None, use_openai: bool = None) -> EmbeddingsService:
+    """
+    Obtener el EmbeddingsService compartido del proceso
+
+    Todas las instancias de UserDatabase (bot, interfaz web) usan el mismo
+    servicio, de modo que el modelo se carga una sola vez y solo cuando se
+    genera el primer embedding. Por defecto se usan EMBEDDING_MODEL y
+    USE_OPENAI_EMBEDDINGS.
+    """
+    if model_name is None:
+        model_name = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    if use_openai is None:
+        use_openai = os.getenv('USE_OPENAI_EMBEDDINGS', 'false').lower() == 'true'
+    key = (model_name, use_openai)
+
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = EmbeddingsService(model_name=model_name, use_openai=use_openai)
+            _services[key] = service
+        return service
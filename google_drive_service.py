@@ -1,32 +1,141 @@
 import os
 import json
+import time
 import logging
+import threading
 from datetime import datetime, timedelta
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-import requests
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.errors import BatchError, HttpError
+from googleapiclient.http import BatchHttpRequest, MediaFileUpload, MediaIoBaseDownload
 from cryptography.fernet import Fernet
 import io
+import shutil
 import tempfile
 from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urljoin
+from supabase_client import SupabaseClient, get_supabase_client
+from ttl_cache import TTLCache
+from drive_blob_cache import get_drive_blob_cache
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sesiones de Drive por usuario (credenciales descifradas y clientes construidos),
+# compartidas por todas las instancias del proceso. Cada entrada vence cuando
+# vence su token; DRIVE_SESSION_TTL solo se usa si el token no trae expiración
+DRIVE_SESSION_CACHE = TTLCache(
+    maxsize=int(os.getenv('DRIVE_SESSION_CACHE_SIZE', 1000)),
+    ttl=float(os.getenv('DRIVE_SESSION_TTL', 3600))
+)
+# Segundos antes de la expiración en los que el token se renueva por adelantado
+TOKEN_REFRESH_MARGIN = float(os.getenv('DRIVE_TOKEN_REFRESH_MARGIN', 300))
+# Perfil de Drive de cada usuario (conexión, carpeta y token cifrado): una sola
+# lectura de la fila del usuario por operación en lugar de una por método
+DRIVE_PROFILE_CACHE = TTLCache(
+    maxsize=int(os.getenv('DRIVE_PROFILE_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('DRIVE_PROFILE_TTL', 300))
+)
+PROFILE_FIELDS = "id,google_drive_connected,google_drive_folder_id,google_drive_token"
+# Bytes por solicitud al descargar (cada bloque se escribe al destino antes de pedir el siguiente)
+DEFAULT_DOWNLOAD_CHUNK_SIZE = int(float(os.getenv('DRIVE_DOWNLOAD_CHUNK_MB', 8)) * 1024 * 1024)
+# Operaciones por solicitud de lote (Drive admite como máximo 100)
+DRIVE_BATCH_SIZE = 100
+DRIVE_BATCH_PATH = 'batch/drive/v3'
+# Reintentos de las operaciones de un lote que fallan por límites de uso o errores temporales
+BATCH_MAX_RETRIES = int(os.getenv('DRIVE_BATCH_RETRIES', 3))
+BATCH_RETRY_DELAY = float(os.getenv('DRIVE_BATCH_RETRY_DELAY', 1.0))
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+FILE_INFO_FIELDS = 'id,name,size,mimeType,createdTime,modifiedTime'
+
+_session_locks: Dict[str, threading.Lock] = {}
+_discovery_document: Optional[str] = None
+
+
+def _build_drive_service(credentials: Credentials, api_endpoint: str = None):
+    """Construir un cliente de Drive leyendo el documento de descubrimiento una sola vez"""
+    global _discovery_document
+    client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+    if _discovery_document is None:
+        _discovery_document = discovery_cache.get_static_doc('drive', 'v3')
+    if _discovery_document is None:
+        return build('drive', 'v3', credentials=credentials, client_options=client_options)
+    return build_from_document(_discovery_document, credentials=credentials, client_options=client_options)
+
+
+def _is_retryable(error: HttpError) -> bool:
+    """Indica si una operación fallida de un lote vale la pena reintentarla"""
+    status = getattr(error.resp, 'status', None)
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403 and isinstance(error.error_details, list):
+        return any(isinstance(detail, dict) and detail.get('reason') in RETRYABLE_REASONS
+                   for detail in error.error_details)
+    return False
+
+
+def _seconds_until_expiry(credentials: Credentials) -> Optional[float]:
+    """Segundos de vida que le quedan al token (None si no tiene expiración)"""
+    if credentials.expiry is None:
+        return None
+    # google-auth guarda la expiración en UTC sin zona horaria
+    return (credentials.expiry - datetime.utcnow()).total_seconds()
+
+
+class DriveSession:
+    """
+    Credenciales de Drive de un usuario y sus clientes ya construidos
+
+    Las credenciales se comparten entre hilos y su renovación se hace bajo
+    lock; cada hilo usa su propio cliente porque httplib2 no es thread-safe.
+    """
+    
+    def __init__(self, user_id: str, credentials: Credentials, api_endpoint: str = None):
+        self.user_id = user_id
+        self.credentials = credentials
+        self.api_endpoint = api_endpoint
+        self.lock = threading.Lock()
+        self._local = threading.local()
+    
+    def service(self):
+        """Cliente de Drive de este hilo"""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = _build_drive_service(self.credentials, self.api_endpoint)
+            self._local.service = service
+        return service
+    
+    def files(self):
+        """Recurso files() del cliente de este hilo (construirlo cuesta milisegundos)"""
+        files = getattr(self._local, 'files', None)
+        if files is None:
+            files = self.service().files()
+            self._local.files = files
+        return files
+    
+    def batch(self, callback=None) -> BatchHttpRequest:
+        """Nuevo lote de solicitudes para el cliente de este hilo"""
+        if self.api_endpoint:
+            # El documento de descubrimiento apunta el lote a Google aunque haya otro endpoint
+            return BatchHttpRequest(callback=callback, batch_uri=urljoin(self.api_endpoint, DRIVE_BATCH_PATH))
+        return self.service().new_batch_http_request(callback=callback)
+
 class GoogleDriveService:
     """Servicio para manejar Google Drive API con OAuth2"""
     
     SCOPES = ['https://www.googleapis.com/auth/drive.file']
     BOT_FOLDER_NAME = 'TelegramBot_Documents'
     
-    def __init__(self, supabase_url: str, supabase_key: str, encryption_key: str = None):
+    def __init__(self, supabase_url: str, supabase_key: str, encryption_key: str = None,
+                 supabase_client: SupabaseClient = None):
         self.supabase_url = supabase_url
         self.supabase_key = supabase_key
+        self.client = supabase_client or get_supabase_client(supabase_url, supabase_key)
         
         # Clave de cifrado para tokens OAuth
         if encryption_key:
@@ -36,14 +145,22 @@ class GoogleDriveService:
             key = Fernet.generate_key()
             self.cipher_suite = Fernet(key)
             logger.warning("Se generó una nueva clave de cifrado. Para producción, usa una clave fija.")
+        
+        self.sessions = DRIVE_SESSION_CACHE
+        self.profiles = DRIVE_PROFILE_CACHE
+        self.refresh_margin = TOKEN_REFRESH_MARGIN
+        self.download_chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE
+        # Copia local de los archivos descargados (None si DRIVE_BLOB_CACHE_MAX_MB=0)
+        self.blob_cache = get_drive_blob_cache()
+        self.batch_size = DRIVE_BATCH_SIZE
+        self.batch_retries = BATCH_MAX_RETRIES
+        self.batch_retry_delay = BATCH_RETRY_DELAY
+        # URL base alternativa de la API de Drive (ej: un proxy); None = la de Google
+        self.api_endpoint = os.getenv('DRIVE_API_ENDPOINT') or None
     
     def _get_supabase_headers(self) -> Dict[str, str]:
         """Obtener headers para Supabase"""
-        return {
-            "apikey": self.supabase_key,
-            "Authorization": f"Bearer {self.supabase_key}",
-            "Content-Type": "application/json"
-        }
+        return self.client.get_headers()
     
     def _encrypt_token(self, token_data: dict) -> str:
         """Cifrar datos de token OAuth"""
@@ -102,24 +219,16 @@ class GoogleDriveService:
             
             credentials = flow.credentials
             
-            # Preparar datos del token
-            token_data = {
-                'token': credentials.token,
-                'refresh_token': credentials.refresh_token,
-                'token_uri': credentials.token_uri,
-                'client_id': credentials.client_id,
-                'client_secret': credentials.client_secret,
-                'scopes': credentials.scopes,
-                'expiry': credentials.expiry.isoformat() if credentials.expiry else None
-            }
-            
             # Cifrar tokens
-            encrypted_token = self._encrypt_token(token_data)
+            encrypted_token = self._encrypt_token(self._token_data(credentials))
             
             # Guardar tokens en base de datos
             success = self._save_user_tokens(state, encrypted_token)
             
             if success:
+                # El perfil y la sesión en caché tenían los tokens anteriores
+                self.invalidate_user_profile(state)
+                self.invalidate_drive_session(state)
                 # Crear carpeta del bot en Google Drive
                 self._create_bot_folder(state)
                 return True, "Vinculación exitosa con Google Drive"
@@ -132,8 +241,6 @@ class GoogleDriveService:
     
     def _save_user_tokens(self, user_id: str, encrypted_token: str) -> bool:
         """Guardar tokens OAuth en base de datos"""
-        headers = self._get_supabase_headers()
-        
         # Actualizar usuario con tokens de Google Drive
         update_data = {
             'google_drive_token': encrypted_token,
@@ -141,30 +248,90 @@ class GoogleDriveService:
             'google_drive_connected_at': datetime.now().isoformat()
         }
         
-        response = requests.patch(
-            f"{self.supabase_url}/rest/v1/users",
-            headers=headers,
+        response = self.client.patch(
+            "users",
             params={"id": f"eq.{user_id}"},
             json=update_data
         )
         
-        return response.status_code == 204
+        if response.status_code != 204:
+            return False
+        self._update_cached_profile(user_id, google_drive_token=encrypted_token, google_drive_connected=True)
+        return True
     
-    def _get_user_credentials(self, user_id: str) -> Optional[Credentials]:
-        """Obtener credenciales de Google Drive del usuario"""
-        headers = self._get_supabase_headers()
+    def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtener el perfil de Drive del usuario (conexión, carpeta y token cifrado)
+        
+        Se lee de Supabase una vez y se guarda en caché; los cambios hechos
+        por este servicio actualizan la copia en caché. Los perfiles sin Drive
+        vinculado no se guardan: la vinculación puede ocurrir en otro proceso
+        y el siguiente intento del usuario debe verla. El diccionario
+        devuelto es compartido y no debe modificarse.
         
-        # Buscar usuario
-        response = requests.get(
-            f"{self.supabase_url}/rest/v1/users",
-            headers=headers,
-            params={"id": f"eq.{user_id}"}
+        Returns:
+            Diccionario con id, google_drive_connected, google_drive_folder_id y
+            google_drive_token, o None si el usuario no existe
+        """
+        key = str(user_id)
+        profile = self.profiles.get(key)
+        if profile is not None:
+            return profile
+        
+        response = self.client.get(
+            "users",
+            params={"id": f"eq.{user_id}", "select": PROFILE_FIELDS}
         )
         
         if response.status_code != 200 or not response.json():
             return None
         
-        user_data = response.json()[0]
+        profile = response.json()[0]
+        if self._is_linked(profile):
+            self.profiles.set(key, profile)
+        return profile
+    
+    @staticmethod
+    def _is_linked(profile: Dict[str, Any]) -> bool:
+        """Perfil con Drive conectado y token guardado (el único que se guarda en caché)"""
+        return bool(profile.get('google_drive_connected') and profile.get('google_drive_token'))
+    
+    def _update_cached_profile(self, user_id: str, **fields):
+        """Aplicar a la copia en caché un cambio ya guardado en Supabase"""
+        key = str(user_id)
+        profile = self.profiles.get(key)
+        if profile is not None:
+            # Copia nueva: otros hilos pueden estar leyendo la anterior
+            profile = {**profile, **fields}
+            if self._is_linked(profile):
+                self.profiles.set(key, profile)
+            else:
+                self.profiles.invalidate(key)
+    
+    def invalidate_user_profile(self, user_id: str) -> bool:
+        """Descartar el perfil en caché de un usuario"""
+        return self.profiles.invalidate(str(user_id))
+    
+    @staticmethod
+    def _token_data(credentials: Credentials) -> dict:
+        """Datos del token OAuth que se guardan cifrados"""
+        return {
+            'token': credentials.token,
+            'refresh_token': credentials.refresh_token,
+            'token_uri': credentials.token_uri,
+            'client_id': credentials.client_id,
+            'client_secret': credentials.client_secret,
+            'scopes': credentials.scopes,
+            'expiry': credentials.expiry.isoformat() if credentials.expiry else None
+        }
+    
+    def _get_user_credentials(self, user_id: str) -> Optional[Credentials]:
+        """Obtener credenciales de Google Drive del usuario"""
+        # Buscar usuario (perfil en caché)
+        user_data = self.get_user_profile(user_id)
+        if not user_data:
+            return None
+        
         encrypted_token = user_data.get('google_drive_token')
         
         if not encrypted_token:
@@ -182,40 +349,86 @@ class GoogleDriveService:
             token_uri=token_data['token_uri'],
             client_id=token_data['client_id'],
             client_secret=token_data['client_secret'],
-            scopes=token_data['scopes']
+            scopes=token_data['scopes'],
+            expiry=datetime.fromisoformat(token_data['expiry']) if token_data.get('expiry') else None
         )
         
-        # Verificar si el token necesita ser renovado
-        if creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            
-            # Actualizar tokens en base de datos
-            new_token_data = {
-                'token': creds.token,
-                'refresh_token': creds.refresh_token,
-                'token_uri': creds.token_uri,
-                'client_id': creds.client_id,
-                'client_secret': creds.client_secret,
-                'scopes': creds.scopes,
-                'expiry': creds.expiry.isoformat() if creds.expiry else None
-            }
-            
-            encrypted_token = self._encrypt_token(new_token_data)
-            self._save_user_tokens(user_id, encrypted_token)
+        # Renovar el token si venció o está por vencer
+        remaining = _seconds_until_expiry(creds)
+        if creds.refresh_token and (creds.expired or (remaining is not None and remaining <= self.refresh_margin)):
+            if not self._refresh_credentials(user_id, creds):
+                return None
         
         return creds
     
+    def _refresh_credentials(self, user_id: str, creds: Credentials) -> bool:
+        """Renovar el token de acceso y guardar los tokens nuevos en base de datos"""
+        try:
+            creds.refresh(Request())
+        except Exception as e:
+            logger.error(f"Error al renovar token de Google Drive del usuario {user_id}: {e}")
+            return False
+        
+        self._save_user_tokens(user_id, self._encrypt_token(self._token_data(creds)))
+        return True
+    
+    def _get_drive_session(self, user_id: str) -> Optional[DriveSession]:
+        """
+        Obtener la sesión de Drive del usuario desde la caché
+        
+        Solo la primera llamada (o la siguiente a que venza el token) consulta
+        Supabase, descifra el token y construye el cliente. Si el token vence
+        en menos de refresh_margin segundos se renueva por adelantado.
+        """
+        key = str(user_id)
+        session = self.sessions.get(key)
+        if session is None:
+            # Un solo hilo construye la sesión de cada usuario
+            with _session_locks.setdefault(key, threading.Lock()):
+                session = self.sessions.get(key)
+                if session is None:
+                    creds = self._get_user_credentials(user_id)
+                    if not creds:
+                        return None
+                    session = DriveSession(key, creds, self.api_endpoint)
+                    self._cache_session(session)
+                    return session
+        
+        remaining = _seconds_until_expiry(session.credentials)
+        if remaining is not None and remaining <= self.refresh_margin and session.credentials.refresh_token:
+            with session.lock:
+                # Otro hilo pudo renovarlo mientras esperábamos
+                remaining = _seconds_until_expiry(session.credentials)
+                if remaining is not None and remaining <= self.refresh_margin:
+                    if not self._refresh_credentials(key, session.credentials):
+                        self.invalidate_drive_session(key)
+                        return None
+                    self._cache_session(session)
+        
+        return session
+    
+    def _cache_session(self, session: DriveSession):
+        """Guardar una sesión hasta que venza su token"""
+        self.sessions.set(session.user_id, session, ttl=_seconds_until_expiry(session.credentials))
+    
+    def _get_drive_files(self, user_id: str):
+        """Recurso files() de Drive del usuario, o None si no tiene credenciales"""
+        session = self._get_drive_session(user_id)
+        return session.files() if session else None
+    
+    def invalidate_drive_session(self, user_id: str) -> bool:
+        """Descartar la sesión en caché de un usuario (ej: tras volver a vincular Drive)"""
+        return self.sessions.invalidate(str(user_id))
+    
     def _create_bot_folder(self, user_id: str) -> Optional[str]:
         """Crear carpeta del bot en Google Drive del usuario"""
         try:
-            creds = self._get_user_credentials(user_id)
-            if not creds:
+            files = self._get_drive_files(user_id)
+            if files is None:
                 return None
             
-            service = build('drive', 'v3', credentials=creds)
-            
             # Verificar si ya existe la carpeta
-            existing_folders = service.files().list(
+            existing_folders = files.list(
                 q=f"name='{self.BOT_FOLDER_NAME}' and mimeType='application/vnd.google-apps.folder'",
                 spaces='drive'
             ).execute()
@@ -230,7 +443,7 @@ class GoogleDriveService:
                     'mimeType': 'application/vnd.google-apps.folder'
                 }
                 
-                folder = service.files().create(
+                folder = files.create(
                     body=folder_metadata,
                     fields='id'
                 ).execute()
@@ -249,31 +462,29 @@ class GoogleDriveService:
     
     def _save_user_folder_id(self, user_id: str, folder_id: str) -> bool:
         """Guardar ID de carpeta del bot en base de datos"""
-        headers = self._get_supabase_headers()
-        
         update_data = {
             'google_drive_folder_id': folder_id
         }
         
-        response = requests.patch(
-            f"{self.supabase_url}/rest/v1/users",
-            headers=headers,
+        response = self.client.patch(
+            "users",
             params={"id": f"eq.{user_id}"},
             json=update_data
         )
         
-        return response.status_code == 204
+        if response.status_code != 204:
+            return False
+        self._update_cached_profile(user_id, google_drive_folder_id=folder_id)
+        return True
     
     def upload_file(self, user_id: str, file_path: str, file_name: str, mime_type: str = None) -> Optional[str]:
         """Subir archivo a Google Drive del usuario"""
         try:
-            creds = self._get_user_credentials(user_id)
-            if not creds:
+            files = self._get_drive_files(user_id)
+            if files is None:
                 logger.error("No se encontraron credenciales para el usuario")
                 return None
             
-            service = build('drive', 'v3', credentials=creds)
-            
             # Obtener ID de carpeta del bot
             folder_id = self._get_user_folder_id(user_id)
             if not folder_id:
@@ -292,7 +503,7 @@ class GoogleDriveService:
             media = MediaFileUpload(file_path, mimetype=mime_type, resumable=True)
             
             # Subir archivo
-            file = service.files().create(
+            file = files.create(
                 body=file_metadata,
                 media_body=media,
                 fields='id,name,size,mimeType,createdTime'
@@ -309,55 +520,160 @@ class GoogleDriveService:
     
     def _get_user_folder_id(self, user_id: str) -> Optional[str]:
         """Obtener ID de carpeta del bot del usuario"""
-        headers = self._get_supabase_headers()
+        profile = self.get_user_profile(user_id)
+        return profile.get('google_drive_folder_id') if profile else None
+    
+    def download_file(self, user_id: str, file_id: str) -> Optional[bytes]:
+        """
+        Descargar archivo de Google Drive completo en memoria
         
-        response = requests.get(
-            f"{self.supabase_url}/rest/v1/users",
-            headers=headers,
-            params={"id": f"eq.{user_id}"}
-        )
+        Para archivos grandes usar download_to, que no mantiene el archivo en memoria.
+        """
+        file_io = io.BytesIO()
+        if self.download_to(user_id, file_id, file_io) is None:
+            return None
+        return file_io.getvalue()
+    
+    def download_to(self, user_id: str, file_id: str, destination, chunk_size: int = None,
+                    file_info: Dict = None) -> Optional[int]:
+        """
+        Descargar un archivo de Google Drive por bloques directamente a un destino
         
-        if response.status_code == 200 and response.json():
-            return response.json()[0].get('google_drive_folder_id')
+        Con la caché local activa, una versión ya descargada (mismo modifiedTime)
+        se copia desde disco sin volver a Drive.
         
-        return None
+        Args:
+            user_id: UUID del usuario
+            file_id: ID del archivo en Drive
+            destination: Ruta del archivo a escribir u objeto de archivo binario abierto
+            chunk_size: Bytes por solicitud (por defecto DRIVE_DOWNLOAD_CHUNK_MB)
+            file_info: Resultado de get_file_info si ya se tiene (evita pedirlo otra vez)
+            
+        Returns:
+            Bytes escritos, o None si falló (una ruta a medio escribir se elimina)
+        """
+        files = self._get_drive_files(user_id)
+        if files is None:
+            return None
+        
+        if self.blob_cache is not None:
+            size = self._download_cached(user_id, files, file_id, destination, chunk_size, file_info)
+            if size is not None:
+                return size
+        
+        if not isinstance(destination, (str, os.PathLike)):
+            return self._download_chunks(files, file_id, destination, chunk_size)
+        return self._download_to_path(files, file_id, destination, chunk_size)
     
-    def download_file(self, user_id: str, file_id: str) -> Optional[bytes]:
-        """Descargar archivo de Google Drive"""
-        try:
-            creds = self._get_user_credentials(user_id)
-            if not creds:
+    def _download_cached(self, user_id: str, files, file_id: str, destination, chunk_size: int = None,
+                         file_info: Dict = None) -> Optional[int]:
+        """
+        Servir la descarga desde la caché local, llenándola si hace falta
+        
+        Returns:
+            Bytes escritos, o None para descargar sin caché (sin modifiedTime,
+            archivo mayor que la caché o entrada desalojada por otro proceso)
+        """
+        if file_info is None:
+            file_info = self.get_file_info(user_id, file_id)
+        modified_time = file_info.get('modifiedTime') if file_info else None
+        if not modified_time or int(file_info.get('size') or 0) > self.blob_cache.max_bytes:
+            return None
+        
+        path = self.blob_cache.get(file_id, modified_time)
+        if path is None:
+            path = self.blob_cache.put(
+                file_id, modified_time,
+                lambda tmp_path: self._download_to_path(files, file_id, tmp_path, chunk_size)
+            )
+            if path is None:
                 return None
-            
-            service = build('drive', 'v3', credentials=creds)
-            
-            # Descargar archivo
-            request = service.files().get_media(fileId=file_id)
-            file_io = io.BytesIO()
-            downloader = MediaIoBaseDownload(file_io, request)
+        
+        try:
+            source = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        
+        with source:
+            if not isinstance(destination, (str, os.PathLike)):
+                shutil.copyfileobj(source, destination)
+            else:
+                try:
+                    with open(destination, 'wb') as sink:
+                        shutil.copyfileobj(source, sink)
+                except OSError as e:
+                    logger.error(f"Error al copiar {file_id} desde la caché local: {e}")
+                    if os.path.exists(destination):
+                        os.unlink(destination)
+                    return None
+            return os.fstat(source.fileno()).st_size
+    
+    def _download_to_path(self, files, file_id: str, destination, chunk_size: int = None) -> Optional[int]:
+        """Descargar a una ruta, eliminando el archivo si la descarga no termina"""
+        size = None
+        try:
+            with open(destination, 'wb') as sink:
+                size = self._download_chunks(files, file_id, sink, chunk_size)
+        except OSError as e:
+            logger.error(f"Error al escribir descarga en {destination}: {e}")
+        
+        if size is None and os.path.exists(destination):
+            os.unlink(destination)
+        return size
+    
+    def _download_chunks(self, files, file_id: str, sink, chunk_size: int = None) -> Optional[int]:
+        """Copiar el contenido de un archivo de Drive al sink, un bloque por solicitud"""
+        try:
+            request = files.get_media(fileId=file_id)
+            downloader = MediaIoBaseDownload(sink, request, chunksize=chunk_size or self.download_chunk_size)
             
             done = False
+            status = None
             while done is False:
                 status, done = downloader.next_chunk()
             
-            return file_io.getvalue()
+            return status.resumable_progress if status else 0
             
         except HttpError as e:
             logger.error(f"Error al descargar archivo: {e}")
             return None
     
+    def read_file_range(self, user_id: str, file_id: str, start: int = 0, end: int = None) -> Optional[bytes]:
+        """
+        Leer solo un rango de bytes de un archivo de Drive (ej: para vistas previas)
+        
+        Args:
+            start: Primer byte
+            end: Último byte incluido (None = hasta el final)
+            
+        Returns:
+            Bytes del rango (vacío si start está más allá del final), o None si falló
+        """
+        files = self._get_drive_files(user_id)
+        if files is None:
+            return None
+        
+        try:
+            request = files.get_media(fileId=file_id)
+            request.headers['range'] = f"bytes={start}-{'' if end is None else end}"
+            return request.execute()
+            
+        except HttpError as e:
+            if e.resp.status == 416:
+                return b""
+            logger.error(f"Error al leer rango del archivo: {e}")
+            return None
+    
     def get_file_info(self, user_id: str, file_id: str) -> Optional[Dict]:
         """Obtener información de archivo de Google Drive"""
         try:
-            creds = self._get_user_credentials(user_id)
-            if not creds:
+            files = self._get_drive_files(user_id)
+            if files is None:
                 return None
             
-            service = build('drive', 'v3', credentials=creds)
-            
-            file_info = service.files().get(
+            file_info = files.get(
                 fileId=file_id,
-                fields='id,name,size,mimeType,createdTime,modifiedTime'
+                fields=FILE_INFO_FIELDS
             ).execute()
             
             return file_info
@@ -369,13 +685,11 @@ class GoogleDriveService:
     def delete_file(self, user_id: str, file_id: str) -> bool:
         """Eliminar archivo de Google Drive"""
         try:
-            creds = self._get_user_credentials(user_id)
-            if not creds:
+            files = self._get_drive_files(user_id)
+            if files is None:
                 return False
             
-            service = build('drive', 'v3', credentials=creds)
-            
-            service.files().delete(fileId=file_id).execute()
+            files.delete(fileId=file_id).execute()
             logger.info(f"Archivo eliminado: {file_id}")
             
             return True
@@ -384,22 +698,115 @@ class GoogleDriveService:
             logger.error(f"Error al eliminar archivo: {e}")
             return False
     
+    def delete_files(self, user_id: str, file_ids: List[str]) -> Dict[str, bool]:
+        """
+        Eliminar varios archivos de Google Drive con solicitudes de lote
+        
+        Returns:
+            Mapa file_id -> True si se eliminó
+        """
+        results = self._execute_batch(user_id, file_ids, lambda files, file_id: files.delete(fileId=file_id))
+        deleted = {file_id: file_id in results and results[file_id][1] is None for file_id in file_ids}
+        logger.info(f"Archivos eliminados: {sum(deleted.values())} de {len(deleted)}")
+        return deleted
+    
+    def get_files_info(self, user_id: str, file_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Obtener información de varios archivos de Google Drive con solicitudes de lote
+        
+        Returns:
+            Mapa file_id -> información del archivo (None si falló)
+        """
+        results = self._execute_batch(
+            user_id, file_ids,
+            lambda files, file_id: files.get(fileId=file_id, fields=FILE_INFO_FIELDS)
+        )
+        return {
+            file_id: results[file_id][0] if file_id in results and results[file_id][1] is None else None
+            for file_id in file_ids
+        }
+    
+    def _execute_batch(self, user_id: str, file_ids: List[str], make_request) -> Dict[str, Tuple[Any, Optional[HttpError]]]:
+        """
+        Ejecutar una operación sobre varios archivos en lotes de Drive
+        
+        Agrupa hasta batch_size operaciones por solicitud HTTP y reintenta, con
+        espera exponencial, solo las que fallaron por límites de uso o errores
+        temporales del servidor.
+        
+        Args:
+            make_request: Función (files, file_id) -> solicitud sin ejecutar
+            
+        Returns:
+            Mapa file_id -> (respuesta, error); error es None si tuvo éxito.
+            Vacío si el usuario no tiene credenciales de Drive.
+        """
+        session = self._get_drive_session(user_id)
+        if session is None:
+            return {}
+        files = session.files()
+        
+        results = {}
+        pending = list(dict.fromkeys(file_ids))
+        for attempt in range(self.batch_retries + 1):
+            if attempt:
+                time.sleep(self.batch_retry_delay * 2 ** (attempt - 1))
+            
+            retry = []
+            for start in range(0, len(pending), self.batch_size):
+                group = pending[start:start + self.batch_size]
+                outcomes = self._execute_batch_group(session, files, group, make_request)
+                for file_id in group:
+                    # Parte ausente en la respuesta del lote: se trata como un error temporal
+                    missing = file_id not in outcomes
+                    results[file_id] = outcomes.get(file_id, (None, BatchError("Operación sin respuesta en el lote")))
+                    error = results[file_id][1]
+                    if error is not None and (missing or _is_retryable(error)):
+                        retry.append(file_id)
+            
+            pending = retry
+            if not pending:
+                break
+        
+        if pending:
+            logger.warning(f"{len(pending)} operaciones de lote siguen fallando tras {self.batch_retries} reintentos")
+        return results
+    
+    def _execute_batch_group(self, session: DriveSession, files, group: List[str],
+                             make_request) -> Dict[str, Tuple[Any, Optional[HttpError]]]:
+        """Enviar un lote (una solicitud HTTP) y recoger el resultado de cada operación"""
+        outcomes = {}
+        
+        def collect(request_id, response, error):
+            outcomes[group[int(request_id)]] = (response, error)
+        
+        batch = session.batch(callback=collect)
+        for index, file_id in enumerate(group):
+            batch.add(make_request(files, file_id), request_id=str(index))
+        
+        try:
+            batch.execute()
+        except HttpError as e:
+            # Falló el lote completo (ej: 503 o respuesta mal formada): todas sus operaciones comparten el error
+            logger.error(f"Error al ejecutar lote de Drive: {e}")
+            return {file_id: (None, e) for file_id in group}
+        
+        return outcomes
+    
     def list_files(self, user_id: str, folder_id: str = None) -> List[Dict]:
         """Listar archivos en Google Drive del usuario"""
         try:
-            creds = self._get_user_credentials(user_id)
-            if not creds:
+            files = self._get_drive_files(user_id)
+            if files is None:
                 return []
             
-            service = build('drive', 'v3', credentials=creds)
-            
             if not folder_id:
                 folder_id = self._get_user_folder_id(user_id)
             
             # Consulta para listar archivos
             query = f"'{folder_id}' in parents and trashed=false" if folder_id else "trashed=false"
             
-            results = service.files().list(
+            results = files.list(
                 q=query,
                 pageSize=100,
                 fields="files(id,name,size,mimeType,createdTime,modifiedTime)"
@@ -413,27 +820,13 @@ class GoogleDriveService:
     
     def is_user_connected(self, user_id: str) -> bool:
         """Verificar si el usuario tiene Google Drive conectado"""
-        headers = self._get_supabase_headers()
-        
-        response = requests.get(
-            f"{self.supabase_url}/rest/v1/users",
-            headers=headers,
-            params={"id": f"eq.{user_id}"}
-        )
-        
-        if response.status_code == 200 and response.json():
-            user_data = response.json()[0]
-            return user_data.get('google_drive_connected', False)
-        
-        return False
+        profile = self.get_user_profile(user_id)
+        return bool(profile and profile.get('google_drive_connected', False))
     
     def get_user_by_telegram_id(self, telegram_id: int) -> Optional[Dict]:
         """Obtener usuario por telegram_id"""
-        headers = self._get_supabase_headers()
-        
-        response = requests.get(
-            f"{self.supabase_url}/rest/v1/users",
-            headers=headers,
+        response = self.client.get(
+            "users",
             params={"telegram_id": f"eq.{telegram_id}"}
         )
         
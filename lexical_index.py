@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import math
+import time
+import heapq
+import logging
+import tempfile
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from document_index import DEFAULT_INDEX_DIR, DocumentIndexManager
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Palabras unidas por guiones, puntos o barras se indexan completas y por partes
+# para que "F-2024-0117" coincida tanto con la referencia exacta como con "2024"
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+TOKEN_SEPARATORS = re.compile(r"[-./]")
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Dividir un texto en términos para el índice léxico
+
+    Pasa a minúsculas y elimina acentos; descarta las letras sueltas pero
+    conserva los números de un dígito.
+    """
+    if not text:
+        return []
+    normalized = text.lower()
+    if not normalized.isascii():
+        normalized = unicodedata.normalize('NFKD', normalized)
+        normalized = ''.join(c for c in normalized if not unicodedata.combining(c))
+
+    terms = []
+    for match in TOKEN_PATTERN.finditer(normalized):
+        token = match.group()
+        parts = TOKEN_SEPARATORS.split(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if len(part) > 1 or part.isdigit())
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = RRF_K,
+                           weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """
+    Combinar varios rankings con reciprocal rank fusion
+
+    Cada documento suma weight / (k + posición) por cada ranking en el que
+    aparece (posición desde 1). Solo usa posiciones, así que no hace falta
+    que las puntuaciones de BM25 y coseno estén en la misma escala.
+
+    Returns:
+        Lista de (document_id, puntuación) ordenada de mayor a menor; a
+        igual puntuación gana el documento visto antes
+    """
+    scores: Dict[str, float] = {}
+    for position, ranking in enumerate(rankings):
+        weight = weights[position] if weights else 1.0
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 del texto de los documentos de un grupo
+
+    Guarda las frecuencias de términos de cada documento y reconstruye las
+    listas de postings al cargar. Una consulta solo recorre las postings de
+    sus términos, no el texto de todos los documentos.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        self.built_at = time.time()
+        # Normalización por longitud de cada documento; se recalcula tras add/remove
+        self._norms: Optional[Dict[str, float]] = None
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Sequence[str]) -> 'BM25Index':
+        """Construir el índice completo a partir de los textos del grupo"""
+        index = cls()
+        for doc_id, text in zip(ids, texts):
+            index.add(doc_id, text)
+        index.built_at = time.time()
+        return index
+
+    def add(self, doc_id: str, text: str) -> bool:
+        """Añadir o reemplazar un documento"""
+        return self.apply_add(doc_id, self.log_payload(text))
+
+    @staticmethod
+    def log_payload(text: str) -> Dict[str, int]:
+        """Frecuencias de términos del texto, tal como se guardan en el registro incremental"""
+        return dict(Counter(tokenize(text)))
+
+    def apply_add(self, doc_id: str, frequencies: Dict[str, int]) -> bool:
+        """Añadir o reemplazar un documento a partir de sus frecuencias ya calculadas"""
+        doc_id = str(doc_id)
+        self.remove(doc_id)
+        self._insert(doc_id, frequencies)
+        return True
+
+    def _insert(self, doc_id: str, frequencies: Dict[str, int]):
+        self.documents[doc_id] = frequencies
+        length = sum(frequencies.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        self._norms = None
+        for term, tf in frequencies.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id: str) -> bool:
+        """Eliminar un documento del índice"""
+        frequencies = self.documents.pop(str(doc_id), None)
+        if frequencies is None:
+            return False
+        self.total_length -= self.doc_lengths.pop(str(doc_id))
+        self._norms = None
+        for term in frequencies:
+            posting = self.postings[term]
+            del posting[str(doc_id)]
+            if not posting:
+                del self.postings[term]
+        return True
+
+    def search(self, query: str, threshold: float = 0.0, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        Buscar los documentos con mayor puntuación BM25
+
+        Returns:
+            Lista de (document_id, puntuación) ordenada de mayor a menor
+        """
+        if limit <= 0 or not self.documents:
+            return []
+
+        size = len(self.documents)
+        norms = self._length_norms()
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            weight = math.log(1 + (size - df + 0.5) / (df + 0.5)) * (self.k1 + 1)
+            for doc_id, tf in posting.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf / (tf + norms[doc_id])
+
+        matches = [(doc_id, score) for doc_id, score in scores.items() if score > threshold]
+        return heapq.nlargest(limit, matches, key=lambda item: item[1])
+
+    def _length_norms(self) -> Dict[str, float]:
+        """k1 * (1 - b + b * longitud / longitud media) de cada documento"""
+        if self._norms is None:
+            average_length = self.total_length / len(self.documents) or 1.0
+            self._norms = {
+                doc_id: self.k1 * (1 - self.b + self.b * length / average_length)
+                for doc_id, length in self.doc_lengths.items()
+            }
+        return self._norms
+
+    def save(self, path: str):
+        """Guardar el índice de forma atómica (archivo temporal + rename)"""
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'k1': self.k1,
+                    'b': self.b,
+                    'built_at': self.built_at,
+                    'documents': self.documents
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(data['k1'], data['b'])
+        for doc_id, frequencies in data['documents'].items():
+            index._insert(doc_id, frequencies)
+        index.built_at = data['built_at']
+        return index
+
+
+class LexicalIndexManager(DocumentIndexManager):
+    """Índices BM25 por grupo, guardados junto a los índices vectoriales"""
+
+    index_class = BM25Index
+    suffix = '.bm25.json'
+
+    def build(self, group_id, ids: Sequence[str], texts: Sequence[str]) -> BM25Index:
+        """Construir y guardar el índice léxico completo de un grupo"""
+        index = BM25Index.build(ids, texts)
+        with self._locked(group_id):
+            self._store(str(group_id), index)
+        logger.info(f"Índice léxico del grupo {group_id} construido con {len(index)} documentos")
+        return index
+
+
+_manager: Optional[LexicalIndexManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_lexical_index() -> Optional[LexicalIndexManager]:
+    """
+    Obtener el gestor de índices léxicos compartido del proceso
+
+    Usa el mismo directorio que los índices vectoriales (DOCUMENT_INDEX_DIR);
+    LEXICAL_INDEX_MAX_AGE define los segundos antes de reconstruir (0
+    desactiva la búsqueda híbrida).
+    """
+    global _manager
+    max_age = float(os.getenv('LEXICAL_INDEX_MAX_AGE', 3600))
+    if max_age <= 0:
+        return None
+
+    with _manager_lock:
+        if _manager is None:
+            try:
+                _manager = LexicalIndexManager(
+                    index_dir=os.getenv('DOCUMENT_INDEX_DIR', DEFAULT_INDEX_DIR),
+                    max_age=max_age
+                )
+            except OSError as e:
+                logger.error(f"No se pudo crear el directorio de índices: {e}")
+                return None
+        return _manager
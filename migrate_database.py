@@ -87,13 +87,6 @@ def add_google_drive_columns():
             """,
             "description": "Crear índice para google_drive_file_id"
         },
-        {
-            "sql": """
-                CREATE INDEX IF NOT EXISTS idx_documents_embedding_gin 
-                ON documents USING gin(embedding);
-            """,
-            "description": "Crear índice GIN para embeddings (búsqueda vectorial)"
-        },
         {
             "sql": """
                 CREATE INDEX IF NOT EXISTS idx_users_google_drive_connected 
@@ -119,46 +112,95 @@ def create_search_functions():
     """Crear funciones para búsqueda semántica"""
     
     functions = [
+        {
+            "sql": """
+                DROP FUNCTION IF EXISTS search_documents_by_similarity(vector, uuid, float, int);
+            """,
+            "description": "Eliminar versión anterior de la búsqueda semántica (filtrada por usuario)"
+        },
+        {
+            "sql": """
+                DROP FUNCTION IF EXISTS search_documents_by_similarity(vector, uuid, float, int, int, int);
+            """,
+            "description": "Eliminar versión anterior de la búsqueda semántica (sin candidatos por grupo)"
+        },
         {
             "sql": """
                 CREATE OR REPLACE FUNCTION search_documents_by_similarity(
                     query_embedding vector(384),
-                    user_uuid uuid,
+                    match_group_id uuid,
                     similarity_threshold float DEFAULT 0.7,
-                    result_limit int DEFAULT 5
+                    result_limit int DEFAULT 5,
+                    ef_search int DEFAULT 40,
+                    ivfflat_probes int DEFAULT 10,
+                    candidate_limit int DEFAULT 100
                 )
                 RETURNS TABLE (
                     id uuid,
                     title text,
-                    content text,
+                    text_content text,
                     file_type text,
                     google_drive_file_id text,
+                    file_size bigint,
+                    metadata jsonb,
                     similarity float,
                     created_at timestamp
                 ) AS $$
                 BEGIN
+                    -- Parámetros de búsqueda del índice vectorial solo para esta transacción
+                    PERFORM set_config('hnsw.ef_search', LEAST(GREATEST(ef_search, candidate_limit), 1000)::text, true);
+                    PERFORM set_config('ivfflat.probes', ivfflat_probes::text, true);
+                    -- El filtro por grupo se aplica después del índice: con el escaneo
+                    -- iterativo (pgvector >= 0.8) se siguen leyendo vecinos hasta
+                    -- reunir los candidatos del grupo en lugar de quedarse con los
+                    -- ef_search más cercanos de toda la tabla
+                    BEGIN
+                        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+                        PERFORM set_config('ivfflat.iterative_scan', 'relaxed_order', true);
+                    EXCEPTION WHEN OTHERS THEN
+                        -- Versión sin escaneo iterativo: el cliente completa los resultados cortos
+                        NULL;
+                    END;
+                    
                     RETURN QUERY
+                    WITH candidates AS MATERIALIZED (
+                        -- Vecinos más cercanos del grupo (usa el índice vectorial)
+                        SELECT
+                            d.id,
+                            d.title,
+                            d.text_content,
+                            d.file_type,
+                            d.google_drive_file_id,
+                            d.file_size,
+                            d.metadata,
+                            d.embedding <=> query_embedding AS distance,
+                            d.created_at
+                        FROM documents d
+                        INNER JOIN group_documents gd ON d.id = gd.document_id
+                        WHERE gd.group_id = match_group_id
+                        AND d.embedding IS NOT NULL
+                        ORDER BY d.embedding <=> query_embedding
+                        LIMIT GREATEST(candidate_limit, result_limit)
+                    )
+                    -- relaxed_order puede devolver candidatos algo desordenados: ordenar de nuevo
                     SELECT 
-                        d.id,
-                        d.title,
-                        d.text_content as content,
-                        d.file_type,
-                        d.google_drive_file_id,
-                        1 - (d.embedding <=> query_embedding) as similarity,
-                        d.created_at
-                    FROM documents d
-                    INNER JOIN group_documents gd ON d.id = gd.document_id
-                    INNER JOIN groups g ON gd.group_id = g.id
-                    INNER JOIN group_members gm ON g.id = gm.group_id
-                    WHERE gm.user_id = user_uuid
-                    AND gm.status = 'verified'
-                    AND 1 - (d.embedding <=> query_embedding) >= similarity_threshold
-                    ORDER BY d.embedding <=> query_embedding
+                        c.id,
+                        c.title::text,
+                        c.text_content::text,
+                        c.file_type::text,
+                        c.google_drive_file_id::text,
+                        c.file_size::bigint,
+                        c.metadata::jsonb,
+                        (1 - c.distance)::float as similarity,
+                        c.created_at::timestamp
+                    FROM candidates c
+                    WHERE 1 - c.distance >= similarity_threshold
+                    ORDER BY c.distance
                     LIMIT result_limit;
                 END;
                 $$ LANGUAGE plpgsql;
             """,
-            "description": "Crear función de búsqueda semántica para documentos"
+            "description": "Crear función de búsqueda semántica para documentos de un grupo"
         },
         {
             "sql": """
@@ -200,8 +242,7 @@ def create_search_functions():
                         ORDER BY d.created_at DESC
                         LIMIT result_limit;
                     ELSE
-                        -- Aquí se generaría el embedding del query_text
-                        -- Por ahora, usamos una búsqueda por texto
+                        -- Búsqueda de texto completo sobre search_vector (índice GIN)
                         RETURN QUERY
                         SELECT 
                             d.id,
@@ -211,17 +252,15 @@ def create_search_functions():
                             d.google_drive_file_id,
                             d.file_size,
                             d.created_at,
-                            0.8 as similarity
+                            ts_rank(d.search_vector, websearch_to_tsquery('simple', query_text))::float as similarity
                         FROM documents d
                         INNER JOIN group_documents gd ON d.id = gd.document_id
                         INNER JOIN groups g ON gd.group_id = g.id
                         WHERE g.admin_id = user_uuid
                         AND g.name LIKE 'Personal_%'
-                        AND (
-                            d.title ILIKE '%' || query_text || '%'
-                            OR d.text_content ILIKE '%' || query_text || '%'
-                        )
-                        ORDER BY d.created_at DESC
+                        AND d.search_vector @@ websearch_to_tsquery('simple', query_text)
+                        ORDER BY ts_rank(d.search_vector, websearch_to_tsquery('simple', query_text)) DESC,
+                                 d.created_at DESC
                         LIMIT result_limit;
                     END IF;
                 END;
@@ -241,6 +280,370 @@ def create_search_functions():
     logger.info(f"✅ Funciones creadas: {success_count}/{len(functions)} exitosas")
     return success_count == len(functions)
 
+def create_vector_indexes(index_type: str = None, m: int = None, ef_construction: int = None,
+                          lists: int = None):
+    """
+    Crear índice vectorial (pgvector) sobre documents.embedding
+    
+    Args:
+        index_type: 'hnsw' (por defecto) o 'ivfflat'
+        m: Conexiones por nodo del grafo HNSW
+        ef_construction: Candidatos evaluados al construir el grafo HNSW
+        lists: Número de listas de IVFFlat (recomendado: filas / 1000)
+    """
+    index_type = (index_type or os.getenv('VECTOR_INDEX_TYPE', 'hnsw')).lower()
+    m = m or int(os.getenv('VECTOR_INDEX_M', 16))
+    ef_construction = ef_construction or int(os.getenv('VECTOR_INDEX_EF_CONSTRUCTION', 64))
+    lists = lists or int(os.getenv('VECTOR_INDEX_LISTS', 100))
+    
+    if index_type == 'hnsw':
+        index_sql = f"""
+                CREATE INDEX IF NOT EXISTS idx_documents_embedding_hnsw
+                ON documents USING hnsw (embedding vector_cosine_ops)
+                WITH (m = {m}, ef_construction = {ef_construction});
+            """
+        description = f"Crear índice HNSW para embeddings (m={m}, ef_construction={ef_construction})"
+    elif index_type == 'ivfflat':
+        index_sql = f"""
+                CREATE INDEX IF NOT EXISTS idx_documents_embedding_ivfflat
+                ON documents USING ivfflat (embedding vector_cosine_ops)
+                WITH (lists = {lists});
+            """
+        description = f"Crear índice IVFFlat para embeddings (lists={lists})"
+    else:
+        logger.error(f"❌ Tipo de índice vectorial no soportado: {index_type}")
+        return False
+    
+    migrations = [
+        {
+            "sql": "CREATE EXTENSION IF NOT EXISTS vector;",
+            "description": "Habilitar extensión pgvector"
+        },
+        {
+            "sql": "DROP INDEX IF EXISTS idx_documents_embedding_gin;",
+            "description": "Eliminar índice GIN de embeddings (no aplica a columnas vector)"
+        },
+        {
+            "sql": index_sql,
+            "description": description
+        },
+        {
+            "sql": """
+                CREATE INDEX IF NOT EXISTS idx_group_documents_group_id
+                ON group_documents(group_id);
+            """,
+            "description": "Crear índice para group_documents.group_id"
+        }
+    ]
+    
+    logger.info("🧭 Creando índices vectoriales")
+    
+    success_count = 0
+    for migration in migrations:
+        if execute_sql(migration["sql"], migration["description"]):
+            success_count += 1
+    
+    logger.info(f"✅ Índices creados: {success_count}/{len(migrations)} exitosos")
+    return success_count == len(migrations)
+
+def create_text_search_index():
+    """Crear columna tsvector con índice GIN para la búsqueda por términos en documents"""
+    
+    migrations = [
+        {
+            "sql": """
+                ALTER TABLE documents
+                ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(text_content, ''))
+                ) STORED;
+            """,
+            "description": "Agregar columna search_vector a tabla documents"
+        },
+        {
+            "sql": """
+                CREATE INDEX IF NOT EXISTS idx_documents_search_vector
+                ON documents USING gin (search_vector);
+            """,
+            "description": "Crear índice GIN para search_vector"
+        }
+    ]
+    
+    logger.info("🔤 Creando índice de texto completo")
+    
+    success_count = 0
+    for migration in migrations:
+        if execute_sql(migration["sql"], migration["description"]):
+            success_count += 1
+    
+    logger.info(f"✅ Índices creados: {success_count}/{len(migrations)} exitosos")
+    return success_count == len(migrations)
+
+
+def create_chunk_tables():
+    """Crear tabla document_chunks, su índice vectorial y la búsqueda por pasajes"""
+    
+    migrations = [
+        {
+            "sql": """
+                CREATE TABLE IF NOT EXISTS document_chunks (
+                    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+                    document_id uuid NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    chunk_index int NOT NULL,
+                    start_char int NOT NULL DEFAULT 0,
+                    page int,
+                    content text NOT NULL,
+                    embedding vector(384),
+                    created_at timestamp DEFAULT NOW(),
+                    UNIQUE (document_id, chunk_index)
+                );
+            """,
+            "description": "Crear tabla document_chunks"
+        },
+        {
+            "sql": """
+                ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS page int;
+            """,
+            "description": "Agregar página de origen a document_chunks"
+        },
+        {
+            "sql": """
+                CREATE INDEX IF NOT EXISTS idx_document_chunks_document_id
+                ON document_chunks(document_id);
+            """,
+            "description": "Crear índice para document_chunks.document_id"
+        },
+        {
+            "sql": """
+                CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding_hnsw
+                ON document_chunks USING hnsw (embedding vector_cosine_ops);
+            """,
+            "description": "Crear índice HNSW para embeddings de chunks"
+        },
+        {
+            "sql": """
+                -- El tipo de retorno cambió (columna page): hay que recrear la función
+                DROP FUNCTION IF EXISTS search_document_chunks(vector, uuid, float, int, int, int);
+                CREATE OR REPLACE FUNCTION search_document_chunks(
+                    query_embedding vector(384),
+                    match_group_id uuid,
+                    similarity_threshold float DEFAULT 0.3,
+                    result_limit int DEFAULT 5,
+                    chunks_per_document int DEFAULT 1,
+                    candidate_limit int DEFAULT 200
+                )
+                RETURNS TABLE (
+                    document_id uuid,
+                    title text,
+                    file_type text,
+                    file_path text,
+                    created_at timestamp,
+                    chunk_index int,
+                    start_char int,
+                    page int,
+                    content text,
+                    similarity float
+                ) AS $$
+                BEGIN
+                    -- Igual que search_documents_by_similarity: el filtro por grupo va
+                    -- después del índice, así que se pide escaneo iterativo y un
+                    -- ef_search que cubra los candidatos
+                    PERFORM set_config('hnsw.ef_search', LEAST(GREATEST(candidate_limit, 40), 1000)::text, true);
+                    BEGIN
+                        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+                    EXCEPTION WHEN OTHERS THEN
+                        NULL;
+                    END;
+                    
+                    RETURN QUERY
+                    WITH candidates AS MATERIALIZED (
+                        -- Los chunks más cercanos del grupo (usa el índice HNSW)
+                        SELECT
+                            c.document_id,
+                            c.chunk_index,
+                            c.start_char,
+                            c.page,
+                            c.content,
+                            (1 - (c.embedding <=> query_embedding))::float AS similarity
+                        FROM document_chunks c
+                        INNER JOIN group_documents gd ON gd.document_id = c.document_id
+                        WHERE gd.group_id = match_group_id
+                        AND c.embedding IS NOT NULL
+                        ORDER BY c.embedding <=> query_embedding
+                        LIMIT candidate_limit
+                    ), ranked AS (
+                        SELECT
+                            candidates.*,
+                            row_number() OVER (
+                                PARTITION BY candidates.document_id ORDER BY candidates.similarity DESC
+                            ) AS passage_rank
+                        FROM candidates
+                        WHERE candidates.similarity >= similarity_threshold
+                    ), top_documents AS (
+                        -- Cada documento puntúa por su mejor pasaje
+                        SELECT ranked.document_id, max(ranked.similarity) AS document_score
+                        FROM ranked
+                        GROUP BY ranked.document_id
+                        ORDER BY document_score DESC
+                        LIMIT result_limit
+                    )
+                    SELECT
+                        r.document_id,
+                        d.title::text,
+                        d.file_type::text,
+                        d.file_path::text,
+                        d.created_at::timestamp,
+                        r.chunk_index,
+                        r.start_char,
+                        r.page,
+                        r.content,
+                        r.similarity
+                    FROM ranked r
+                    INNER JOIN top_documents t ON t.document_id = r.document_id
+                    INNER JOIN documents d ON d.id = r.document_id
+                    WHERE r.passage_rank <= chunks_per_document
+                    ORDER BY t.document_score DESC, r.document_id, r.passage_rank;
+                END;
+                $$ LANGUAGE plpgsql;
+            """,
+            "description": "Crear función de búsqueda de pasajes por grupo"
+        }
+    ]
+    
+    logger.info("🧩 Creando almacenamiento por chunks")
+    
+    success_count = 0
+    for migration in migrations:
+        if execute_sql(migration["sql"], migration["description"]):
+            success_count += 1
+    
+    logger.info(f"✅ Migraciones de chunks: {success_count}/{len(migrations)} exitosas")
+    return success_count == len(migrations)
+
+def backfill_document_chunks():
+    """Dividir en pasajes los documentos subidos antes de crear document_chunks"""
+    try:
+        # Necesita el modelo de embeddings: se importa solo en este paso
+        from database import UserDatabase
+        backfilled = UserDatabase().backfill_document_chunks()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron generar chunks de documentos existentes: {e}")
+        return False
+    
+    if backfilled is None:
+        logger.warning("⚠️ Chunks de documentos existentes pendientes (embeddings o consulta no disponibles)")
+        return False
+    
+    logger.info(f"✅ Chunks generados para {backfilled} documentos existentes")
+    return True
+
+def create_counter_functions():
+    """Crear funciones de incremento atómico para contadores de almacenamiento y tokens"""
+    
+    functions = [
+        {
+            "sql": """
+                ALTER TABLE users
+                ADD COLUMN IF NOT EXISTS tokens_used BIGINT DEFAULT 0;
+            """,
+            "description": "Agregar columna tokens_used a tabla users"
+        },
+        {
+            "sql": """
+                CREATE OR REPLACE FUNCTION increment_group_storage(
+                    p_group_id uuid,
+                    p_delta bigint
+                )
+                RETURNS bigint AS $$
+                    UPDATE groups
+                    SET shared_storage_bytes = COALESCE(shared_storage_bytes, 0) + p_delta
+                    WHERE id = p_group_id
+                    RETURNING shared_storage_bytes;
+                $$ LANGUAGE sql;
+            """,
+            "description": "Crear función de incremento atómico de almacenamiento de grupo"
+        },
+        {
+            "sql": """
+                CREATE OR REPLACE FUNCTION increment_user_tokens(
+                    p_user_id uuid,
+                    p_delta bigint
+                )
+                RETURNS bigint AS $$
+                    UPDATE users
+                    SET tokens_used = COALESCE(tokens_used, 0) + p_delta
+                    WHERE id = p_user_id
+                    RETURNING tokens_used;
+                $$ LANGUAGE sql;
+            """,
+            "description": "Crear función de incremento atómico de tokens de usuario"
+        },
+        {
+            "sql": """
+                CREATE OR REPLACE FUNCTION increment_user_tokens_batch(
+                    p_deltas jsonb
+                )
+                RETURNS int AS $$
+                    WITH deltas AS (
+                        SELECT key::uuid AS user_id, value::bigint AS delta
+                        FROM jsonb_each_text(p_deltas)
+                    ), updated AS (
+                        UPDATE users u
+                        SET tokens_used = COALESCE(u.tokens_used, 0) + d.delta
+                        FROM deltas d
+                        WHERE u.id = d.user_id
+                        RETURNING u.id
+                    )
+                    SELECT count(*)::int FROM updated;
+                $$ LANGUAGE sql;
+            """,
+            "description": "Crear función de incremento de tokens en lote"
+        },
+        {
+            "sql": """
+                ALTER TABLE groups
+                ADD COLUMN IF NOT EXISTS documents_version BIGINT NOT NULL DEFAULT 0;
+            """,
+            "description": "Agregar columna documents_version a tabla groups"
+        },
+        {
+            "sql": """
+                CREATE OR REPLACE FUNCTION bump_group_documents_version()
+                RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        UPDATE groups
+                        SET documents_version = documents_version + 1
+                        WHERE id = NEW.group_id;
+                    END IF;
+                    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                        UPDATE groups
+                        SET documents_version = documents_version + 1
+                        WHERE id = OLD.group_id AND (TG_OP = 'DELETE' OR OLD.group_id IS DISTINCT FROM NEW.group_id);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                
+                DROP TRIGGER IF EXISTS group_documents_version ON group_documents;
+                CREATE TRIGGER group_documents_version
+                AFTER INSERT OR UPDATE OR DELETE ON group_documents
+                FOR EACH ROW EXECUTE FUNCTION bump_group_documents_version();
+            """,
+            "description": "Crear trigger de versión de documentos por grupo"
+        }
+    ]
+    
+    logger.info("🔢 Creando funciones de contadores atómicos")
+    
+    success_count = 0
+    for function in functions:
+        if execute_sql(function["sql"], function["description"]):
+            success_count += 1
+    
+    logger.info(f"✅ Funciones creadas: {success_count}/{len(functions)} exitosas")
+    return success_count == len(functions)
+
 def create_backup_tables():
     """Crear tablas de respaldo antes de la migración"""
     
@@ -357,6 +760,15 @@ def main():
         
         log_migration("add_google_drive_columns", True)
         
+        # Paso 2b: Crear índice de texto completo (lo usan las funciones de búsqueda)
+        logger.info("🔤 Creando índice de texto completo...")
+        if not create_text_search_index():
+            logger.error("❌ Error creando índice de texto completo")
+            log_migration("create_text_search_index", False, "Error creando índice de texto completo")
+            return False
+        
+        log_migration("create_text_search_index", True)
+        
         # Paso 3: Crear funciones de búsqueda
         logger.info("🔍 Creando funciones de búsqueda...")
         if not create_search_functions():
@@ -366,6 +778,38 @@ def main():
         
         log_migration("create_search_functions", True)
         
+        # Paso 3a: Crear índice vectorial
+        logger.info("🧭 Creando índice vectorial...")
+        if not create_vector_indexes():
+            logger.error("❌ Error creando índice vectorial")
+            log_migration("create_vector_indexes", False, "Error creando índice vectorial")
+            return False
+        
+        log_migration("create_vector_indexes", True)
+        
+        # Paso 3a2: Crear tabla de chunks y búsqueda por pasajes
+        logger.info("🧩 Creando tabla de chunks...")
+        if not create_chunk_tables():
+            logger.error("❌ Error creando tabla de chunks")
+            log_migration("create_chunk_tables", False, "Error creando tabla de chunks")
+            return False
+        
+        log_migration("create_chunk_tables", True)
+        
+        # Paso 3a3: Chunks de los documentos anteriores (no bloquea la migración:
+        # se puede repetir después y mientras tanto el contexto usa el documento completo)
+        logger.info("🧩 Generando chunks de documentos existentes...")
+        log_migration("backfill_document_chunks", backfill_document_chunks())
+        
+        # Paso 3b: Crear funciones de contadores atómicos
+        logger.info("🔢 Creando funciones de contadores...")
+        if not create_counter_functions():
+            logger.error("❌ Error creando funciones de contadores")
+            log_migration("create_counter_functions", False, "Error creando funciones")
+            return False
+        
+        log_migration("create_counter_functions", True)
+        
         # Paso 4: Verificar migración
         logger.info("✅ Verificando migración...")
         if not verify_migration():
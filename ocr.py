@@ -0,0 +1,216 @@
+import io
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import pytesseract
+from PIL import Image, ImageOps
+
+from embedding_cache import EmbeddingCache, get_default_cache, hash_file
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_OCR_LANG = 'spa+eng'
+DEFAULT_TARGET_DPI = 300
+DEFAULT_MAX_SIDE = 2000
+
+
+class OCREngine:
+    """
+    OCR con tesseract para fotos e imágenes de PDF escaneados
+
+    Antes de reconocer, las imágenes se pasan a escala de grises y se reducen:
+    las de PDF a target_dpi (según el tamaño de la página) y las fotos a
+    max_side píxeles en el lado mayor. Los JPEG se decodifican ya reducidos
+    (modo draft), sin cargar la foto completa en memoria. Idiomas y
+    configuración se resuelven una sola vez por proceso y el texto se guarda
+    en la caché de embeddings por hash de la imagen.
+    """
+
+    def __init__(self, lang: str = None, target_dpi: int = None, max_side: int = None,
+                 psm: int = 3, cache: Optional[EmbeddingCache] = None, pdf_pages: bool = True):
+        """
+        Inicializar motor OCR
+
+        Args:
+            lang: Idiomas de tesseract (ej: spa+eng)
+            target_dpi: Resolución a la que se reducen las imágenes de PDF
+            max_side: Lado mayor máximo de las fotos, en píxeles
+            psm: Modo de segmentación de página de tesseract
+            cache: Caché del texto reconocido por hash de imagen (None = sin caché)
+            pdf_pages: Si reconocer las páginas de PDF sin capa de texto
+        """
+        self.lang = lang or DEFAULT_OCR_LANG
+        self.target_dpi = target_dpi or DEFAULT_TARGET_DPI
+        self.max_side = max_side or DEFAULT_MAX_SIDE
+        self.psm = psm
+        self.cache = cache
+        self.pdf_pages = pdf_pages
+        self.config = f"--oem 1 --psm {psm}"
+        # El resultado depende del preprocesado: forma parte de la clave de caché
+        self.cache_model = f"tesseract-{self.lang}-psm{psm}-{self.target_dpi}dpi-{self.max_side}px"
+        self._available: Optional[bool] = None
+        self._lock = threading.Lock()
+        self._timings = {'images': 0, 'cache_hits': 0, 'pixels_in': 0, 'pixels_out': 0,
+                         'prepare_s': 0.0, 'ocr_s': 0.0}
+
+    @property
+    def available(self) -> bool:
+        """Comprobar una vez si tesseract está instalado y qué idiomas tiene"""
+        if self._available is None:
+            with self._lock:
+                if self._available is None:
+                    # Varios procesos con OpenMP cada uno se estorban entre sí
+                    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+                    try:
+                        installed = set(pytesseract.get_languages(config=''))
+                        wanted = [code for code in self.lang.split('+') if code in installed]
+                        if wanted and len(wanted) < len(self.lang.split('+')):
+                            logger.warning(f"Idiomas OCR no instalados; se usará {'+'.join(wanted)}")
+                            self.lang = '+'.join(wanted)
+                        self._available = True
+                    except Exception as e:
+                        logger.error(f"Tesseract no disponible, OCR desactivado: {e}")
+                        self._available = False
+        return self._available
+
+    def prepare(self, image: Image.Image, scale: float = None) -> Image.Image:
+        """
+        Preparar una imagen para OCR: orientación EXIF, escala de grises y reducción
+
+        Args:
+            image: Imagen abierta con PIL
+            scale: Factor de reducción (por defecto el que deja el lado mayor en max_side)
+        """
+        if scale is None:
+            scale = min(1.0, self.max_side / max(image.size))
+        target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+
+        # JPEG: el decodificador reduce 1/2, 1/4 o 1/8 y entrega solo la luminancia
+        if image.format == 'JPEG' and scale < 1.0:
+            image.draft('L', target)
+
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'L':
+            image = image.convert('L')
+
+        # Si el decodificador ya dejó la imagen cerca del objetivo (hasta un 10%
+        # más grande) no compensa otra pasada de remuestreo
+        if scale < 1.0 and max(image.size) > max(target) * 1.1:
+            # Las dimensiones pueden venir giradas por la orientación EXIF
+            if (image.width > image.height) != (target[0] > target[1]):
+                target = (target[1], target[0])
+            image = image.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        return image
+
+    def image_to_text(self, image: Image.Image, content_hash: str, scale: float = None) -> str:
+        """
+        Reconocer el texto de una imagen, usando la caché si ya se procesó
+
+        Args:
+            image: Imagen abierta con PIL (aún sin decodificar, si es posible)
+            content_hash: Hash de los bytes de la imagen
+            scale: Factor de reducción (ver prepare)
+        """
+        key = EmbeddingCache.make_key(content_hash, self.cache_model, kind='ocr')
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self._lock:
+                    self._timings['cache_hits'] += 1
+                return cached['text']
+
+        if not self.available:
+            return ""
+
+        start = time.perf_counter()
+        pixels_in = image.width * image.height
+        prepared = self.prepare(image, scale)
+        prepared_at = time.perf_counter()
+        text = pytesseract.image_to_string(prepared, lang=self.lang, config=self.config).strip()
+        finished = time.perf_counter()
+
+        with self._lock:
+            self._timings['images'] += 1
+            self._timings['pixels_in'] += pixels_in
+            self._timings['pixels_out'] += prepared.width * prepared.height
+            self._timings['prepare_s'] += prepared_at - start
+            self._timings['ocr_s'] += finished - prepared_at
+        logger.info(f"OCR {image.width}x{image.height} -> {prepared.width}x{prepared.height}: "
+                    f"preparación {(prepared_at - start) * 1000:.0f} ms, "
+                    f"tesseract {(finished - prepared_at) * 1000:.0f} ms, {len(text)} caracteres")
+
+        if self.cache is not None:
+            self.cache.set(key, text, [], {'width': prepared.width, 'height': prepared.height})
+        return text
+
+    def ocr_file(self, file_path: str) -> str:
+        """Reconocer el texto de una foto o imagen guardada en disco"""
+        with Image.open(file_path) as image:
+            return self.image_to_text(image, hash_file(file_path))
+
+    def ocr_pdf_page(self, page, number: int = None) -> str:
+        """
+        Reconocer el texto de las imágenes de una página de PDF escaneada
+
+        Cada imagen se reduce a target_dpi según el ancho de la página.
+        """
+        try:
+            images = page.images
+        except Exception as e:
+            logger.warning(f"No se pudieron leer las imágenes de la página {number}: {e}")
+            return ""
+
+        page_width_in = float(page.mediabox.width) / 72 or 1.0
+        texts = []
+        for embedded in images:
+            try:
+                with Image.open(io.BytesIO(embedded.data)) as image:
+                    scale = min(1.0, self.target_dpi * page_width_in / image.width)
+                    content_hash = hashlib.sha256(embedded.data).hexdigest()
+                    text = self.image_to_text(image, content_hash, scale)
+            except Exception as e:
+                logger.warning(f"Error en OCR de {embedded.name} (página {number}): {e}")
+                continue
+            if text:
+                texts.append(text)
+        return "\n".join(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Imágenes reconocidas, aciertos de caché y tiempo acumulado por etapa"""
+        with self._lock:
+            stats = dict(self._timings)
+        if stats['images']:
+            stats['avg_prepare_ms'] = stats['prepare_s'] * 1000 / stats['images']
+            stats['avg_ocr_ms'] = stats['ocr_s'] * 1000 / stats['images']
+        return stats
+
+
+_engine: Optional[OCREngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_ocr_engine() -> OCREngine:
+    """
+    Obtener el motor OCR compartido del proceso
+
+    OCR_LANG, OCR_TARGET_DPI y OCR_MAX_SIDE configuran el reconocimiento y
+    el preprocesado; OCR_PDF_PAGES=0 desactiva el OCR de PDF escaneados. El
+    texto se guarda en la caché de embeddings (EMBEDDING_CACHE_PATH).
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = OCREngine(
+                lang=os.getenv('OCR_LANG', DEFAULT_OCR_LANG),
+                target_dpi=int(os.getenv('OCR_TARGET_DPI', DEFAULT_TARGET_DPI)),
+                max_side=int(os.getenv('OCR_MAX_SIDE', DEFAULT_MAX_SIDE)),
+                cache=get_default_cache(),
+                pdf_pages=os.getenv('OCR_PDF_PAGES', '1') != '0'
+            )
+        return _engine
@@ -0,0 +1,174 @@
+import os
+import math
+import logging
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import PyPDF2
+
+from ocr import get_ocr_engine
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PAGES = 500
+DEFAULT_MAX_CHARS = 2_000_000
+DEFAULT_PAGES_PER_TASK = 20
+
+
+def get_pdf_limits() -> Tuple[int, int]:
+    """
+    Presupuesto de extracción configurado por entorno
+
+    PDF_MAX_PAGES limita las páginas leídas y PDF_MAX_CHARS los caracteres
+    de texto devueltos (0 = sin límite).
+    """
+    return (
+        int(os.getenv('PDF_MAX_PAGES', DEFAULT_MAX_PAGES)),
+        int(os.getenv('PDF_MAX_CHARS', DEFAULT_MAX_CHARS))
+    )
+
+
+def count_pdf_pages(file_path: str) -> int:
+    with open(file_path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def _page_text(page, number: int) -> str:
+    # Una página dañada no debe impedir leer el resto del documento
+    try:
+        text = page.extract_text() or ""
+    except Exception as e:
+        logger.warning(f"No se pudo extraer la página {number}: {e}")
+        text = ""
+
+    # Solo las páginas sin capa de texto (escaneadas) pasan por OCR
+    if not text.strip():
+        engine = get_ocr_engine()
+        if engine.pdf_pages:
+            text = engine.ocr_pdf_page(page, number)
+    return text
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Extraer el texto de las páginas [start, stop) (se ejecuta en los procesos del pool)"""
+    with open(file_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        return [_page_text(reader.pages[number], number + 1) for number in range(start, stop)]
+
+
+def iter_pdf_pages(file_path: str, max_pages: Optional[int] = None,
+                   submit: Optional[Callable[..., Future]] = None,
+                   pages_per_task: int = DEFAULT_PAGES_PER_TASK, window: int = 4) -> Iterator[Tuple[int, str]]:
+    """
+    Recorrer las páginas de un PDF en orden, sin cargar todo el texto a la vez
+
+    Con submit (por ejemplo ProcessingPool.submit) el documento se divide en
+    rangos que se extraen en paralelo; como mucho hay window rangos en curso
+    y el siguiente se encola al consumir uno. Si el consumidor deja de
+    iterar, los rangos pendientes se cancelan.
+
+    Cada rango vuelve a abrir y analizar el PDF completo, así que tiene al
+    menos pages_per_task páginas y los documentos grandes se reparten en unos
+    2 * window rangos en lugar de cientos de rangos pequeños.
+
+    Yields:
+        (número de página desde 1, texto de la página)
+    """
+    with open(file_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        stop = len(reader.pages) if not max_pages else min(len(reader.pages), max_pages)
+
+        if submit is None or stop <= pages_per_task:
+            for number in range(stop):
+                yield number + 1, _page_text(reader.pages[number], number + 1)
+            return
+
+    task_size = max(pages_per_task, math.ceil(stop / (2 * window)))
+    ranges = iter([(start, min(start + task_size, stop)) for start in range(0, stop, task_size)])
+    pending = deque()
+    try:
+        for start, end in ranges:
+            pending.append((start, submit(extract_page_range, file_path, start, end)))
+            if len(pending) >= window:
+                break
+
+        while pending:
+            start, future = pending.popleft()
+            texts = future.result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append((next_range[0], submit(extract_page_range, file_path, *next_range)))
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def extract_pdf_text(file_path: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                     submit: Optional[Callable[..., Future]] = None,
+                     pages_per_task: int = DEFAULT_PAGES_PER_TASK, window: int = 4) -> Dict[str, Any]:
+    """
+    Extraer el texto de un PDF respetando un presupuesto de páginas y caracteres
+
+    Las páginas se unen con saltos de línea en una sola operación (join) y se
+    registra el rango de caracteres de cada una para poder citar la página
+    de cualquier fragmento del texto.
+
+    Returns:
+        Diccionario con text, pages ([{page, start_char, end_char}] de las
+        páginas con texto), page_count, pages_read y truncated
+    """
+    page_count = count_pdf_pages(file_path)
+    parts = []
+    pages = []
+    length = 0
+    pages_read = 0
+    truncated = bool(max_pages) and page_count > max_pages
+
+    page_iter = iter_pdf_pages(file_path, max_pages, submit, pages_per_task, window)
+    try:
+        for number, text in page_iter:
+            pages_read = number
+            text = text.strip()
+            if not text:
+                continue
+
+            start = length + 1 if parts else 0
+            if max_chars and start + len(text) > max_chars:
+                text = text[:max(0, max_chars - start)]
+                truncated = True
+                if not text:
+                    break
+
+            parts.append(text)
+            length = start + len(text)
+            pages.append({'page': number, 'start_char': start, 'end_char': length})
+            if truncated and max_chars and length >= max_chars:
+                break
+    finally:
+        page_iter.close()
+
+    if truncated:
+        logger.info(f"PDF {os.path.basename(file_path)} recortado: {pages_read}/{page_count} páginas, "
+                    f"{length} caracteres")
+
+    return {
+        'text': "\n".join(parts),
+        'pages': pages,
+        'page_count': page_count,
+        'pages_read': pages_read,
+        'truncated': truncated
+    }
+
+
+def page_for_offset(pages: Sequence[Dict[str, int]], offset: int) -> Optional[int]:
+    """Página que contiene la posición offset del texto extraído (None si no hay páginas)"""
+    if not pages:
+        return None
+    position = bisect_right([page['start_char'] for page in pages], offset) - 1
+    return pages[max(position, 0)]['page']
@@ -0,0 +1,183 @@
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from pdf_extraction import extract_pdf_text, get_pdf_limits
+from vector_search import Embedding
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUBMIT_TIMEOUT = 60.0
+
+
+class ProcessingQueueFull(RuntimeError):
+    """La cola de trabajos pesados está llena"""
+
+
+# ----------------------------------------------------------------------
+# Funciones que se ejecutan dentro de los procesos del pool. Cada proceso
+# usa su propio EmbeddingsService compartido (modelo cargado una vez).
+# ----------------------------------------------------------------------
+
+def _worker_extract_text(file_path: str, content_type: str) -> str:
+    from embeddings_service import get_embeddings_service
+    return get_embeddings_service().extract_text_from_file(file_path, content_type)
+
+
+def _worker_embedding_from_file(file_path: str, content_type: str,
+                                extraction: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    from embeddings_service import get_embeddings_service
+    return get_embeddings_service().generate_embedding_from_file(file_path, content_type, extraction)
+
+
+def _worker_cached_file_embedding(file_path: str, content_type: str) -> Optional[Dict[str, Any]]:
+    from embeddings_service import get_embeddings_service
+    return get_embeddings_service().get_cached_file_embedding(file_path, content_type)[0]
+
+
+def _worker_embeddings_batch(texts: List[str], batch_size: int) -> List[Embedding]:
+    from embeddings_service import get_embeddings_service
+    return get_embeddings_service().generate_embeddings_batch(texts, batch_size=batch_size)
+
+
+def _worker_chunk_embeddings(text: str, chunk_size: int, overlap: int) -> List[Dict[str, Any]]:
+    from embeddings_service import get_embeddings_service
+    return get_embeddings_service().generate_chunk_embeddings(text, chunk_size, overlap)
+
+
+class ProcessingPool:
+    """
+    Pool de procesos para extracción de texto (OCR, PDF) y embeddings
+
+    Mueve el trabajo CPU fuera del proceso del bot y de los workers de
+    gunicorn. La cola está acotada: como máximo max_pending trabajos en
+    curso o en espera; al llenarse, submit espera hasta submit_timeout y
+    luego lanza ProcessingQueueFull en lugar de acumular memoria.
+    """
+
+    def __init__(self, max_workers: int = None, max_pending: int = None,
+                 submit_timeout: float = DEFAULT_SUBMIT_TIMEOUT):
+        """
+        Inicializar pool
+
+        Args:
+            max_workers: Procesos del pool (por defecto el número de CPUs)
+            max_pending: Trabajos admitidos a la vez (por defecto 2 por proceso)
+            submit_timeout: Segundos que submit espera por un hueco en la cola
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 2
+        self.submit_timeout = submit_timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # spawn: los procesos no heredan hilos ni conexiones del proceso padre
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        logger.info(f"Pool de procesamiento iniciado (procesos={self.max_workers}, cola={self.max_pending})")
+
+    def submit(self, func: Callable, *args, timeout: Optional[float] = None) -> Future:
+        """
+        Encolar un trabajo en el pool
+
+        Args:
+            func: Función de nivel de módulo (debe poder serializarse)
+            timeout: Espera máxima por un hueco; usa submit_timeout si es None
+
+        Returns:
+            Future con el resultado
+        """
+        wait = self.submit_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=wait):
+            raise ProcessingQueueFull(f"Cola de procesamiento llena ({self.max_pending} trabajos)")
+
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Ejecutar un trabajo desde un handler asíncrono sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        # La espera por un hueco en la cola también ocurre fuera del loop
+        future = await loop.run_in_executor(None, self.submit, func, *args)
+        return await asyncio.wrap_future(future)
+
+    def extract_text(self, file_path: str, content_type: str) -> str:
+        """Extraer texto de un archivo en un proceso del pool"""
+        if content_type == 'pdf':
+            return self.extract_pdf(file_path)['text']
+        return self.submit(_worker_extract_text, file_path, content_type).result()
+
+    def extract_pdf(self, file_path: str) -> Dict[str, Any]:
+        """
+        Extraer un PDF repartiendo rangos de páginas entre los procesos del pool
+
+        Como mucho hay max_workers rangos en cola a la vez, así que un PDF
+        grande no ocupa toda la cola ni bloquea a los demás trabajos.
+        """
+        max_pages, max_chars = get_pdf_limits()
+        try:
+            return extract_pdf_text(file_path, max_pages, max_chars, submit=self.submit, window=self.max_workers)
+        except ProcessingQueueFull:
+            raise
+        except Exception as e:
+            # Igual que EmbeddingsService.extract_pdf: un PDF ilegible no interrumpe la subida
+            logger.error(f"Error al leer PDF: {e}")
+            return {'text': "", 'pages': [], 'page_count': 0, 'pages_read': 0, 'truncated': False}
+
+    def generate_embedding_from_file(self, file_path: str, content_type: str) -> Dict[str, Any]:
+        """Extraer texto y generar su embedding en un proceso del pool"""
+        if content_type != 'pdf':
+            return self.submit(_worker_embedding_from_file, file_path, content_type).result()
+
+        # PDF ya procesado: no hace falta volver a leer sus páginas
+        cached = self.submit(_worker_cached_file_embedding, file_path, content_type).result()
+        if cached is not None:
+            return cached
+        extraction = self.extract_pdf(file_path)
+        return self.submit(_worker_embedding_from_file, file_path, content_type, extraction).result()
+
+    def generate_embeddings_batch(self, texts: List[str], batch_size: int = 32) -> List[Embedding]:
+        """Generar embeddings de varios textos en un proceso del pool"""
+        return self.submit(_worker_embeddings_batch, texts, batch_size).result()
+
+    def generate_chunk_embeddings(self, text: str, chunk_size: int, overlap: int) -> List[Dict[str, Any]]:
+        """Dividir un texto en chunks y generar sus embeddings en un proceso del pool"""
+        return self.submit(_worker_chunk_embeddings, text, chunk_size, overlap).result()
+
+    def shutdown(self, wait: bool = True):
+        """Detener los procesos del pool"""
+        self._executor.shutdown(wait=wait)
+
+
+_pool: Optional[ProcessingPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_processing_pool() -> Optional[ProcessingPool]:
+    """
+    Obtener el pool compartido del proceso
+
+    PROCESSING_WORKERS define el número de procesos (0 = procesar en línea,
+    sin pool) y PROCESSING_QUEUE_SIZE los trabajos admitidos a la vez.
+    """
+    global _pool
+    workers = int(os.getenv('PROCESSING_WORKERS', 0))
+    if workers <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            queue_size = int(os.getenv('PROCESSING_QUEUE_SIZE', 0)) or None
+            _pool = ProcessingPool(max_workers=workers, max_pending=queue_size)
+        return _pool
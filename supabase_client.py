@@ -0,0 +1,216 @@
+import os
+import logging
+import threading
+from typing import Optional, Dict, Any, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# httpx es opcional: solo lo necesita el cliente asíncrono del bot
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 10.0
+
+
+class SupabaseClient:
+    """Cliente REST (PostgREST) de Supabase con conexiones persistentes"""
+
+    def __init__(self, supabase_url: str, supabase_key: str,
+                 pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        """
+        Inicializar cliente de Supabase
+
+        Args:
+            supabase_url: URL base del proyecto de Supabase
+            supabase_key: API key de Supabase
+            pool_size: Número máximo de conexiones keep-alive por host
+            timeout: Timeout por defecto (segundos) para cada solicitud
+        """
+        self.supabase_url = (supabase_url or '').rstrip('/')
+        self.supabase_key = supabase_key
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        # Una única sesión reutiliza las conexiones TCP/TLS entre llamadas
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if supabase_key:
+            self.session.headers.update(self.get_headers())
+
+    def get_headers(self) -> Dict[str, str]:
+        """Obtener headers por defecto para las solicitudes a Supabase"""
+        return {
+            "apikey": self.supabase_key,
+            "Authorization": f"Bearer {self.supabase_key}",
+            "Content-Type": "application/json"
+        }
+
+    def rest_url(self, path: str) -> str:
+        """Construir URL completa de un recurso de /rest/v1"""
+        return f"{self.supabase_url}/rest/v1/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, timeout: Optional[float] = None,
+                **kwargs) -> requests.Response:
+        """
+        Ejecutar una solicitud contra /rest/v1 usando el pool de conexiones
+
+        Args:
+            method: Método HTTP
+            path: Recurso relativo a /rest/v1 (ej: "users" o "rpc/search_documents")
+            timeout: Timeout de esta llamada; usa el valor por defecto si es None
+            **kwargs: Argumentos adicionales para requests (params, json, headers...)
+
+        Returns:
+            Respuesta HTTP
+        """
+        return self.session.request(
+            method,
+            self.rest_url(path),
+            timeout=self.timeout if timeout is None else timeout,
+            **kwargs
+        )
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', path, **kwargs)
+
+    def rpc(self, function_name: str, payload: Dict[str, Any], **kwargs) -> requests.Response:
+        """Llamar a una función RPC de PostgREST"""
+        return self.post(f"rpc/{function_name}", json=payload, **kwargs)
+
+    def close(self):
+        """Cerrar las conexiones del pool"""
+        self.session.close()
+
+
+class AsyncSupabaseClient:
+    """Cliente REST asíncrono de Supabase sobre httpx.AsyncClient"""
+
+    def __init__(self, supabase_url: str, supabase_key: str,
+                 pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        """
+        Inicializar cliente asíncrono
+
+        El httpx.AsyncClient se crea en el primer uso para que quede ligado al
+        event loop que realmente ejecuta las solicitudes (el de la aplicación
+        de Telegram). Los headers de Supabase se envían por solicitud, de modo
+        que el mismo pool puede usarse para webhooks externos sin filtrar la key.
+        """
+        if not HTTPX_AVAILABLE:
+            raise ImportError("httpx es necesario para AsyncSupabaseClient")
+
+        self.supabase_url = (supabase_url or '').rstrip('/')
+        self.supabase_key = supabase_key
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._http = None
+
+    @property
+    def http(self) -> 'httpx.AsyncClient':
+        """Cliente httpx compartido (pool de conexiones)"""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size
+                ),
+                timeout=self.timeout
+            )
+        return self._http
+
+    def get_headers(self) -> Dict[str, str]:
+        """Obtener headers por defecto para las solicitudes a Supabase"""
+        return {
+            "apikey": self.supabase_key,
+            "Authorization": f"Bearer {self.supabase_key}",
+            "Content-Type": "application/json"
+        }
+
+    def rest_url(self, path: str) -> str:
+        """Construir URL completa de un recurso de /rest/v1"""
+        return f"{self.supabase_url}/rest/v1/{path.lstrip('/')}"
+
+    async def request(self, method: str, path: str, timeout: Optional[float] = None,
+                      headers: Optional[Dict[str, str]] = None, **kwargs) -> 'httpx.Response':
+        """Ejecutar una solicitud contra /rest/v1 sin bloquear el event loop"""
+        merged_headers = self.get_headers()
+        if headers:
+            merged_headers.update(headers)
+        return await self.http.request(
+            method,
+            self.rest_url(path),
+            headers=merged_headers,
+            timeout=self.timeout if timeout is None else timeout,
+            **kwargs
+        )
+
+    async def get(self, path: str, **kwargs) -> 'httpx.Response':
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> 'httpx.Response':
+        return await self.request('POST', path, **kwargs)
+
+    async def patch(self, path: str, **kwargs) -> 'httpx.Response':
+        return await self.request('PATCH', path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> 'httpx.Response':
+        return await self.request('DELETE', path, **kwargs)
+
+    async def rpc(self, function_name: str, payload: Dict[str, Any], **kwargs) -> 'httpx.Response':
+        """Llamar a una función RPC de PostgREST"""
+        return await self.post(f"rpc/{function_name}", json=payload, **kwargs)
+
+    async def aclose(self):
+        """Cerrar las conexiones del pool"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+_clients: Dict[Tuple[str, str], SupabaseClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_supabase_client(supabase_url: str = None, supabase_key: str = None) -> SupabaseClient:
+    """
+    Obtener el cliente compartido del proceso para una URL/key de Supabase
+
+    El tamaño del pool y el timeout se leen de SUPABASE_POOL_SIZE y
+    SUPABASE_TIMEOUT la primera vez que se crea el cliente.
+    """
+    supabase_url = supabase_url or os.getenv('SUPABASE_URL')
+    supabase_key = supabase_key or os.getenv('SUPABASE_KEY')
+    key = (supabase_url, supabase_key)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = SupabaseClient(
+                supabase_url,
+                supabase_key,
+                pool_size=int(os.getenv('SUPABASE_POOL_SIZE', DEFAULT_POOL_SIZE)),
+                timeout=float(os.getenv('SUPABASE_TIMEOUT', DEFAULT_TIMEOUT))
+            )
+            _clients[key] = client
+            logger.info(f"Cliente de Supabase creado (pool={client.pool_size}, timeout={client.timeout}s)")
+        return client
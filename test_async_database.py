@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Pruebas de AsyncUserDatabase contra un servidor PostgREST local
+"""
+
+import os
+import sys
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_database import AsyncUserDatabase
+from database import IDENTITY_CACHE
+from benchmarks.stub_server import StubServer
+
+USER = {"id": "uuid-1", "telegram_id": 42, "plan_expiration": "2999-01-01T00:00:00",
+        "current_plan_id": "plan-1", "used_storage_bytes": 10}
+PLAN = {"id": "plan-1", "storage_limit_bytes": 1000}
+
+
+def make_routes():
+    return {
+        ('GET', 'users'): lambda params, body: (200, [USER] if params.get('telegram_id') == 'eq.42' else []),
+        ('GET', 'plans'): lambda params, body: (200, [PLAN]),
+        ('GET', 'groups'): lambda params, body: (200, [{"id": "group-1"}]),
+    }
+
+
+def test_check_user_plan_and_personal_group():
+    async def scenario(server):
+        adb = AsyncUserDatabase(supabase_url=server.url, supabase_key='test-key')
+        try:
+            plan = await adb.check_user_plan(42)
+            group_id = await adb.get_or_create_personal_group(42)
+            missing = await adb.check_user_plan(7)
+        finally:
+            await adb.close()
+        return plan, group_id, missing
+
+    with StubServer(routes=make_routes()) as server:
+        plan, group_id, missing = asyncio.run(scenario(server))
+
+    assert plan == {'active': True, 'used_storage': 10, 'storage_limit': 1000}
+    assert group_id == "group-1"
+    assert missing['active'] is False
+
+
+def test_concurrent_chats_do_not_serialize():
+    """Cien consultas concurrentes deben tardar ~ una latencia, no cien"""
+    latency = 0.05
+    chats = 100
+
+    async def scenario(server):
+        adb = AsyncUserDatabase(supabase_url=server.url, supabase_key='test-key', pool_size=chats)
+        # Sin caché de identidad: medir solo la concurrencia del cliente
+        IDENTITY_CACHE.clear()
+        try:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(adb.get_user_uuid(42) for _ in range(chats)))
+            return results, time.perf_counter() - start
+        finally:
+            await adb.close()
+
+    with StubServer(routes=make_routes(), latency=latency) as server:
+        results, elapsed = asyncio.run(scenario(server))
+
+    assert results == ["uuid-1"] * chats
+    assert elapsed < chats * latency / 4
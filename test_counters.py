@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los contadores atómicos de almacenamiento y tokens
+"""
+
+import os
+import sys
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import UserDatabase
+from supabase_client import SupabaseClient
+import usage_buffer
+from usage_buffer import TokenUsageBuffer
+from benchmarks.stub_server import StubServer
+
+
+def make_db(server, tmp_path):
+    db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+    db.client = SupabaseClient(server.url, 'test-key')
+    return db
+
+
+def test_group_storage_uses_single_rpc(tmp_path):
+    calls = []
+
+    def increment(params, body):
+        calls.append(body)
+        return 200, 1500
+
+    routes = {
+        ('POST', 'rpc/increment_group_storage'): increment,
+        ('POST', 'rpc/increment_user_tokens'): lambda params, body: (200, 42),
+    }
+    with StubServer(routes=routes) as server:
+        db = make_db(server, tmp_path)
+        assert db.update_group_storage("group-1", 500) is True
+        assert db.update_user_tokens("uuid-1", 42) is True
+        db.client.close()
+
+        assert len(server.requests) == 2
+        assert not server.count('GET', 'groups')
+        assert not server.count('PATCH', 'groups')
+
+    assert calls == [{"p_group_id": "group-1", "p_delta": 500}]
+
+
+def test_group_storage_falls_back_without_migration(tmp_path):
+    patched = []
+
+    def patch_group(params, body):
+        patched.append(body)
+        return 204, None
+
+    routes = {
+        ('POST', 'rpc/increment_group_storage'): lambda params, body: (404, {"message": "not found"}),
+        ('GET', 'groups'): lambda params, body: (200, [{"shared_storage_bytes": 1000}]),
+        ('PATCH', 'groups'): patch_group,
+    }
+    with StubServer(routes=routes) as server:
+        db = make_db(server, tmp_path)
+        assert db.update_group_storage("group-1", 500) is True
+        db.client.close()
+
+    assert patched == [{"shared_storage_bytes": 1500}]
+
+
+def test_token_buffer_batches_deltas(tmp_path):
+    batches = []
+
+    def batch(params, body):
+        batches.append(body["p_deltas"])
+        return 200, len(body["p_deltas"])
+
+    with StubServer(routes={('POST', 'rpc/increment_user_tokens_batch'): batch}) as server:
+        db = make_db(server, tmp_path)
+        db.token_buffer = TokenUsageBuffer(db._apply_token_deltas, flush_interval=3600)
+        for _ in range(50):
+            db.update_user_tokens("uuid-1", 10)
+            db.update_user_tokens("uuid-2", 1)
+        assert not server.requests
+
+        db.token_buffer.flush()
+        db.token_buffer.close()
+        db.client.close()
+
+        assert len(server.requests) == 1
+
+    assert batches == [{"uuid-1": 500, "uuid-2": 50}]
+
+
+def test_token_buffer_keeps_deltas_on_failure():
+    results = [False, True]
+    sent = []
+
+    def flush_func(deltas):
+        sent.append(deltas)
+        return results.pop(0)
+
+    buffer = TokenUsageBuffer(flush_func, flush_interval=3600)
+    buffer.add("uuid-1", 5)
+    assert buffer.flush() is False
+    buffer.add("uuid-1", 3)
+    assert buffer.pending() == {"uuid-1": 8}
+    assert buffer.flush() is True
+    buffer.close()
+
+    assert sent == [{"uuid-1": 5}, {"uuid-1": 8}]
+
+
+def test_token_buffer_is_shared_by_the_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_buffer, '_buffer', None)
+    monkeypatch.setenv('TOKEN_FLUSH_INTERVAL', '3600')
+    threads = lambda: sum(t.name == 'token-usage-flush' for t in threading.enumerate())
+    before = threads()
+
+    first = UserDatabase(db_file=str(tmp_path / 'users.json'))
+    second = UserDatabase(db_file=str(tmp_path / 'users.json'))
+    first.update_user_tokens("uuid-1", 10)
+    second.update_user_tokens("uuid-1", 5)
+
+    # Un solo hilo de envío para todas las instancias del proceso
+    assert first.token_buffer is second.token_buffer
+    assert threads() == before + 1
+    assert first.token_buffer.pending() == {"uuid-1": 15}
+
+    first.token_buffer.flush_func = lambda deltas: True
+    first.token_buffer.close()
+
+    monkeypatch.setenv('TOKEN_FLUSH_INTERVAL', '0')
+    assert usage_buffer.get_token_usage_buffer(lambda deltas: True) is None
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la ingesta y búsqueda por pasajes (document_chunks)
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import UserDatabase
+from supabase_client import SupabaseClient
+from benchmarks.stub_server import StubServer
+
+
+class FixedEmbedder:
+    """Sustituto del modelo: divide en trozos fijos y devuelve vectores constantes"""
+
+    def generate_query_embedding(self, text):
+        return [1.0, 0.0]
+
+    def generate_chunk_embeddings(self, text, chunk_size, overlap):
+        step = chunk_size - overlap
+        return [
+            {'chunk_id': i, 'text': text[start:start + chunk_size], 'start_char': start, 'embedding': [1.0, 0.0]}
+            for i, start in enumerate(range(0, max(len(text) - overlap, 1), step))
+        ]
+
+
+def make_db(server, tmp_path):
+    db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+    db.client = SupabaseClient(server.url, 'test-key')
+    db.embeddings_service = FixedEmbedder()
+    db.processing_pool = None
+    return db
+
+
+def test_chunks_are_inserted_in_bulk(tmp_path):
+    inserted = []
+
+    def insert(params, body):
+        inserted.append(body)
+        return 201, []
+
+    with StubServer(routes={('POST', 'document_chunks'): insert}) as server:
+        db = make_db(server, tmp_path)
+        db.chunk_size, db.chunk_overlap = 100, 20
+        stored = db._store_document_chunks("doc-1", "x" * 10000, batch_size=50)
+        assert db._store_document_chunks("doc-2", "   ") == 0
+        db.client.close()
+
+        assert server.count('POST', 'document_chunks') == 3
+
+    assert stored == 125
+    rows = [row for batch in inserted for row in batch]
+    assert [row['chunk_index'] for row in rows] == list(range(125))
+    assert rows[1]['start_char'] == 80
+    assert rows[-1]['start_char'] + len(rows[-1]['content']) == 10000
+
+
+def test_context_returns_best_passages(tmp_path):
+    rows = [
+        {"document_id": "d2", "title": "Informe", "file_type": "pdf", "file_path": "", "created_at": "2024",
+         "chunk_index": 7, "start_char": 5600, "content": "pasaje relevante " * 100, "similarity": 0.9},
+        {"document_id": "d2", "title": "Informe", "file_type": "pdf", "file_path": "", "created_at": "2024",
+         "chunk_index": 2, "start_char": 1600, "content": "segundo pasaje", "similarity": 0.8},
+        {"document_id": "d1", "title": "Notas", "file_type": "text", "file_path": "", "created_at": "2024",
+         "chunk_index": 0, "start_char": 0, "content": "inicio", "similarity": 0.5},
+    ]
+    payloads = []
+
+    def search(params, body):
+        payloads.append(body)
+        return 200, rows
+
+    routes = {
+        ('GET', 'users'): lambda params, body: (200, [{"id": "uuid-1"}]),
+        ('GET', 'groups'): lambda params, body: (200, [{"id": "group-1"}]),
+        ('POST', 'rpc/search_document_chunks'): search,
+    }
+    with StubServer(routes=routes) as server:
+        db = make_db(server, tmp_path)
+        success, docs = db.get_user_documents_for_context(4242, "¿qué dice el informe?", limit=2)
+        db.client.close()
+
+        assert not server.count('POST', 'rpc/search_documents')
+
+    assert success is True
+    assert payloads[0]["match_group_id"] == "group-1"
+    assert [doc['id'] for doc in docs] == ["d2", "d1"]
+    assert docs[0]['content'].startswith("pasaje relevante")
+    assert "[...]\nsegundo pasaje" in docs[0]['content']
+    assert [p['chunk_index'] for p in docs[0]['passages']] == [7, 2]
+
+
+def test_context_completes_passages_with_documents_without_chunks(tmp_path):
+    passage = {"document_id": "d2", "title": "Informe", "file_type": "pdf", "file_path": "", "created_at": "2024",
+               "chunk_index": 0, "start_char": 0, "content": "pasaje", "similarity": 0.9}
+    # d1 se subió antes de document_chunks: solo lo encuentra la búsqueda por documento
+    documents = [
+        {"id": "d2", "title": "Informe", "content": "texto completo", "file_type": "pdf", "file_path": "",
+         "created_at": "2024"},
+        {"id": "d1", "title": "Antiguo", "content": "x" * 3000, "file_type": "text", "file_path": "",
+         "created_at": "2023"},
+    ]
+    routes = {
+        ('GET', 'users'): lambda params, body: (200, [{"id": "uuid-1"}]),
+        ('GET', 'groups'): lambda params, body: (200, [{"id": "group-1"}]),
+        ('POST', 'rpc/search_document_chunks'): lambda params, body: (200, [passage]),
+        ('POST', 'rpc/search_documents'): lambda params, body: (200, documents),
+    }
+    with StubServer(routes=routes) as server:
+        db = make_db(server, tmp_path)
+        success, docs = db.get_user_documents_for_context(4242, "¿qué dice el informe?", limit=3)
+        db.client.close()
+
+    assert success is True
+    assert [doc['id'] for doc in docs] == ["d2", "d1"]
+    assert docs[0]['content'] == "pasaje"
+    assert len(docs[1]['content']) == 1003
+
+
+def test_backfill_chunks_only_for_documents_without_them(tmp_path):
+    documents = [
+        {"id": "d1", "text_content": "texto antiguo " * 20,
+         "metadata": {"processing_metadata": {"pages": [{"page": 1, "start_char": 0, "end_char": 280}]}}},
+        {"id": "d2", "text_content": "ya dividido", "metadata": {}},
+        {"id": "d3", "text_content": "   ", "metadata": None},
+    ]
+    inserted = []
+
+    def insert(params, body):
+        inserted.extend(body)
+        return 201, []
+
+    routes = {
+        ('GET', 'documents'): lambda params, body: (200, documents if params['offset'] == '0' else []),
+        ('GET', 'document_chunks'): lambda params, body: (200, [{"document_id": "d2"}]),
+        ('POST', 'document_chunks'): insert,
+    }
+    with StubServer(routes=routes) as server:
+        db = make_db(server, tmp_path)
+        db.chunk_size, db.chunk_overlap = 100, 20
+        assert db.backfill_document_chunks(page_size=2) == 1
+        db.client.close()
+
+        assert server.count('GET', 'documents') == 2
+
+    assert {row['document_id'] for row in inserted} == {"d1"}
+    assert all(row['page'] == 1 for row in inserted)
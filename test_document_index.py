@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Pruebas del índice vectorial local por grupo
+"""
+
+import os
+import sys
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import document_index
+from document_index import DocumentIndexManager, GroupVectorIndex
+from vector_search import Embedding
+from database import UserDatabase
+from supabase_client import SupabaseClient
+from benchmarks.stub_server import StubServer
+
+
+def clustered_embeddings(n, dim=16, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return centers[rng.integers(0, clusters, n)] + 0.1 * rng.normal(size=(n, dim))
+
+
+def test_small_group_search_is_exact_and_incremental():
+    vectors = clustered_embeddings(50)
+    index = GroupVectorIndex.build([f"d{i}" for i in range(50)], vectors.tolist(), dimension=16)
+    assert index.centroids is None
+
+    assert index.search(vectors[7], limit=1)[0][0] == "d7"
+    assert index.add("nuevo", (vectors[7] * 2).tolist())
+    assert {doc_id for doc_id, _ in index.search(vectors[7], limit=2)} == {"d7", "nuevo"}
+    assert index.remove("d7")
+    assert index.search(vectors[7], limit=1)[0][0] == "nuevo"
+    assert len(index) == 50
+
+
+def test_ivf_recall_on_large_group(monkeypatch):
+    monkeypatch.setattr(document_index, 'MIN_IVF_SIZE', 500)
+    vectors = clustered_embeddings(4000)
+    ids = [f"d{i}" for i in range(4000)]
+    index = GroupVectorIndex.build(ids, vectors.tolist(), dimension=16, nprobe=8)
+    assert index.centroids is not None
+
+    exact = GroupVectorIndex(16)
+    exact.ids, exact.matrix = index.ids, index.matrix
+    hits = 0
+    for q in clustered_embeddings(50, seed=1):
+        expected = {doc_id for doc_id, _ in exact.search(q, limit=10)}
+        got = {doc_id for doc_id, _ in index.search(q, limit=10)}
+        hits += len(expected & got)
+    assert hits / 500 >= 0.9
+
+
+def test_manager_persists_and_reloads(tmp_path):
+    vectors = clustered_embeddings(20)
+    manager = DocumentIndexManager(str(tmp_path))
+    manager.build("g1", [f"d{i}" for i in range(20)], vectors.tolist(), dimension=16)
+    assert manager.add("g1", "d20", vectors[3].tolist())
+
+    other = DocumentIndexManager(str(tmp_path))
+    assert len(other.get("g1")) == 21
+    assert other.search("g2", vectors[0]) is None
+
+    expired = DocumentIndexManager(str(tmp_path), max_age=1e-9)
+    assert expired.get("g1") is None
+
+
+def test_updates_go_to_the_log_until_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_index, 'COMPACT_MIN_ENTRIES', 8)
+    vectors = clustered_embeddings(40)
+    manager = DocumentIndexManager(str(tmp_path))
+    manager.build("g1", [f"d{i}" for i in range(20)], vectors[:20].tolist(), dimension=16)
+    path = manager._path("g1")
+    base = os.stat(path)
+
+    other = DocumentIndexManager(str(tmp_path))
+    assert len(other.get("g1")) == 20
+
+    assert manager.add("g1", "d20", vectors[20].tolist())
+    assert manager.remove("g1", "d3")
+    assert not manager.remove("g1", "d3")
+    # El archivo completo no se reescribe: los cambios van al registro
+    assert (os.stat(path).st_ino, os.stat(path).st_mtime_ns) == (base.st_ino, base.st_mtime_ns)
+    assert os.path.getsize(manager._log_path("g1")) > 0
+
+    # Otro proceso solo aplica las líneas nuevas del registro
+    index = other.get("g1")
+    assert len(index) == 20
+    assert "d3" not in index.ids
+    assert index.search(vectors[20], limit=1)[0][0] == "d20"
+
+    # Altas nuevas y reemplazos hasta que el registro supera el tamaño del índice
+    for i in list(range(21, 40)) + list(range(21, 40)):
+        assert manager.add("g1", f"d{i}", vectors[i].tolist())
+    assert os.stat(path).st_ino != base.st_ino
+    assert manager._indexes["g1"][4] < 39
+
+    index = other.get("g1")
+    assert sorted(index.ids) == sorted(f"d{i}" for i in range(40) if i != 3)
+    reloaded = DocumentIndexManager(str(tmp_path)).get("g1")
+    assert sorted(reloaded.ids) == sorted(index.ids)
+    assert all(reloaded.search(vectors[i], limit=1)[0][0] == f"d{i}" for i in (0, 20, 39))
+
+
+def add_documents(index_dir, worker, count):
+    manager = DocumentIndexManager(index_dir)
+    for i in range(count):
+        assert manager.add("g1", f"w{worker}-{i}", clustered_embeddings(1, seed=worker * 100 + i)[0].tolist())
+
+
+def test_concurrent_processes_do_not_lose_updates(tmp_path):
+    DocumentIndexManager(str(tmp_path)).build("g1", ["d0"], clustered_embeddings(1).tolist(), dimension=16)
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=add_documents, args=(str(tmp_path), w, 15)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert len(DocumentIndexManager(str(tmp_path)).get("g1")) == 1 + 4 * 15
+
+
+def test_database_search_uses_index(tmp_path):
+    vectors = clustered_embeddings(30)
+    rows = [{"document_id": f"d{i}", "documents": {"id": f"d{i}", "embedding": str(v.tolist())}}
+            for i, v in enumerate(vectors)]
+
+    def documents(params, body):
+        ids = params['id'][len('in.('):-1].split(',')
+        assert 'embedding' not in params['select']
+        return 200, [{"id": doc_id, "title": doc_id} for doc_id in ids if doc_id != "d5"]
+
+    routes = {
+        ('GET', 'group_documents'): lambda params, body: (200, rows),
+        ('GET', 'documents'): documents,
+    }
+    with StubServer(routes=routes) as server:
+        db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+        db.client = SupabaseClient(server.url, 'test-key')
+        db.document_index = DocumentIndexManager(str(tmp_path / 'index'))
+
+        first = db._search_group_index("g1", vectors[5].tolist(), threshold=0.0, limit=3)
+        db._index_document("g1", "d99", vectors[2].tolist())
+        second = db._search_group_index("g1", vectors[2].tolist(), threshold=0.0, limit=2)
+        db.client.close()
+
+        # Una sola descarga de embeddings; después solo los documentos encontrados
+        assert server.count('GET', 'group_documents') == 1
+        assert server.count('GET', 'documents') == 2
+
+    # d5 ya no existe en la tabla: se descarta y se elimina del índice
+    assert "d5" not in [doc['id'] for doc in first]
+    assert "d5" not in db.document_index.get("g1").ids
+    assert {doc['id'] for doc in second} == {"d2", "d99"}
+    assert all(0.0 <= doc['similarity'] <= 1.0 for doc in second)
+
+
+def test_rpc_search_is_used_first_and_disabled_when_missing(tmp_path):
+    payloads = []
+
+    def search(params, body):
+        payloads.append(body)
+        return 200, [{"id": "d1", "title": "Uno", "similarity": 0.9}]
+
+    with StubServer(routes={('POST', 'rpc/search_documents_by_similarity'): search}) as server:
+        db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+        db.client = SupabaseClient(server.url, 'test-key')
+        results = db._search_documents_rpc("g1", [0.1, 0.2], threshold=0.5, limit=3)
+        db.client.close()
+
+    assert results == [{"id": "d1", "title": "Uno", "similarity": 0.9}]
+    assert payloads[0]["match_group_id"] == "g1"
+    assert Embedding.from_pgvector(payloads[0]["query_embedding"]) == [0.1, 0.2]
+    assert payloads[0]["result_limit"] == 3
+
+    missing = {('POST', 'rpc/search_documents_by_similarity'): lambda params, body: (404, {})}
+    with StubServer(routes=missing) as server:
+        db.client = SupabaseClient(server.url, 'test-key')
+        assert db._search_documents_rpc("g1", [0.1, 0.2], 0.5, 3) is None
+        assert db._search_documents_rpc("g1", [0.1, 0.2], 0.5, 3) is None
+        db.client.close()
+
+        # Tras el 404 no se vuelve a intentar la RPC
+        assert server.count('POST', 'rpc/search_documents_by_similarity') == 1
+
+
+def test_short_rpc_result_falls_back_to_group_search(tmp_path):
+    # Los documentos del grupo no están entre los vecinos más cercanos de toda la
+    # tabla: el índice del servidor los descarta al filtrar por grupo y la RPC
+    # devuelve menos filas de las pedidas
+    vectors = clustered_embeddings(10)
+    rows = [{"document_id": f"d{i}", "documents": {"id": f"d{i}", "embedding": str(v.tolist())}}
+            for i, v in enumerate(vectors)]
+    rpc_rows = []
+
+    def documents(params, body):
+        ids = params['id'][len('in.('):-1].split(',')
+        return 200, [{"id": doc_id, "title": doc_id} for doc_id in ids]
+
+    routes = {
+        ('POST', 'rpc/search_documents_by_similarity'): lambda params, body: (200, rpc_rows),
+        ('GET', 'group_documents'): lambda params, body: (200, rows),
+        ('GET', 'documents'): documents,
+    }
+    with StubServer(routes=routes) as server:
+        db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+        db.client = SupabaseClient(server.url, 'test-key')
+        db.document_index = DocumentIndexManager(str(tmp_path / 'index'))
+
+        results = db._search_group_documents("g1", vectors[4].tolist(), threshold=0.0, limit=3)
+        assert len(results) == 3
+        assert results[0]['id'] == "d4"
+
+        # Con limit filas la RPC es suficiente
+        rpc_rows.extend({"id": f"d{i}", "similarity": 0.9} for i in range(3))
+        server.reset()
+        assert db._search_group_documents("g1", vectors[4].tolist(), threshold=0.0, limit=3) == rpc_rows
+        assert server.count('GET', 'group_documents') == 0
+        db.client.close()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las operaciones de Google Drive en lote
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from google_drive_service import DriveSession
+from benchmarks.stub_server import StubServer
+from test_drive_sessions import USER_ID, make_service
+
+
+def make_batch_service(server):
+    service = make_service(server, expires_in=3600)
+    service.api_endpoint = f"{server.url}/"
+    service.batch_retry_delay = 0
+    return service
+
+
+def test_delete_files_groups_up_to_batch_size():
+    with StubServer() as server:
+        service = make_batch_service(server)
+        for i in range(250):
+            server.routes[('DELETE', f'files/f{i}')] = lambda params, body: (204, None)
+        file_ids = [f"f{i}" for i in range(250)]
+
+        deleted = service.delete_files(USER_ID, file_ids)
+
+        assert deleted == {file_id: True for file_id in file_ids}
+        # 250 operaciones en 3 solicitudes HTTP (100 + 100 + 50)
+        assert server.count('POST', 'batch/drive/v3') == 3
+        assert server.count('DELETE') == 250
+
+
+def test_get_files_info_reports_each_item():
+    with StubServer() as server:
+        service = make_batch_service(server)
+        server.routes[('GET', 'files/a')] = lambda params, body: (
+            200, {"id": "a", "name": "a.pdf", "fields": params.get('fields')}
+        )
+        server.routes[('GET', 'files/missing')] = lambda params, body: (
+            404, {"error": {"code": 404, "message": "File not found", "errors": [{"reason": "notFound"}]}}
+        )
+
+        info = service.get_files_info(USER_ID, ["a", "missing"])
+
+        assert info["a"]["name"] == "a.pdf"
+        assert info["a"]["fields"] == "id,name,size,mimeType,createdTime,modifiedTime"
+        assert info["missing"] is None
+        # Un 404 no se reintenta
+        assert server.count('POST', 'batch/drive/v3') == 1
+
+
+def test_only_rate_limited_items_are_retried():
+    with StubServer() as server:
+        service = make_batch_service(server)
+        attempts = {"b": 0}
+
+        def rate_limited(params, body):
+            attempts["b"] += 1
+            if attempts["b"] < 3:
+                return 403, {"error": {"code": 403, "message": "Rate limit",
+                                       "errors": [{"reason": "userRateLimitExceeded"}]}}
+            return 204, None
+
+        server.routes[('DELETE', 'files/a')] = lambda params, body: (204, None)
+        server.routes[('DELETE', 'files/b')] = rate_limited
+        server.routes[('DELETE', 'files/c')] = lambda params, body: (503, {"error": {"code": 503}})
+
+        service.batch_retries = 3
+        deleted = service.delete_files(USER_ID, ["a", "b", "c"])
+
+        assert deleted == {"a": True, "b": True, "c": False}
+        assert server.count('DELETE', 'files/a') == 1
+        assert server.count('DELETE', 'files/b') == 3
+        # Error temporal persistente: se agotan los reintentos
+        assert server.count('DELETE', 'files/c') == 4
+        assert server.count('POST', 'batch/drive/v3') == 4
+
+
+def test_failed_batch_request_marks_all_items():
+    with StubServer() as server:
+        service = make_batch_service(server)
+        server.routes[('POST', 'batch/drive/v3')] = lambda params, body: (400, {"error": "bad"})
+        service.batch_retries = 0
+
+        assert service.delete_files(USER_ID, ["a", "b"]) == {"a": False, "b": False}
+
+
+def test_missing_batch_part_is_retried(monkeypatch):
+    original_batch = DriveSession.batch
+
+    def lossy_batch(self, callback=None):
+        # Respuesta incompleta: la segunda operación de cada lote nunca llega
+        return original_batch(self, callback=lambda request_id, response, error: (
+            None if request_id == "1" else callback(request_id, response, error)
+        ))
+
+    monkeypatch.setattr(DriveSession, 'batch', lossy_batch)
+    with StubServer() as server:
+        service = make_batch_service(server)
+        server.routes[('DELETE', 'files/a')] = lambda params, body: (204, None)
+        server.routes[('DELETE', 'files/b')] = lambda params, body: (204, None)
+
+        assert service.delete_files(USER_ID, ["a", "b"]) == {"a": True, "b": True}
+        assert server.count('DELETE', 'files/b') == 2
+
+        service.batch_retries = 0
+        assert service.delete_files(USER_ID, ["a", "b"]) == {"a": True, "b": False}
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la caché en disco de archivos de Google Drive
+"""
+
+import io
+import os
+import sys
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from drive_blob_cache import DriveBlobCache
+from benchmarks.stub_server import StubServer
+from test_drive_downloads import CONTENT, make_db
+
+MODIFIED = "2024-05-01T10:00:00.000Z"
+
+
+def writer(data):
+    def fill(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+        return len(data)
+    return fill
+
+
+def test_put_and_get_by_file_and_version(tmp_path):
+    cache = DriveBlobCache(str(tmp_path), max_bytes=1000)
+
+    assert cache.get("abc", MODIFIED) is None
+    path = cache.put("abc", MODIFIED, writer(b"x" * 100))
+    assert cache.get("abc", MODIFIED) == path
+    with open(path, 'rb') as f:
+        assert f.read() == b"x" * 100
+
+    # Una versión nueva del archivo en Drive es otra entrada
+    assert cache.get("abc", "2024-06-01T10:00:00.000Z") is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['entries'] == 1
+
+
+def test_evicts_least_recently_used_by_bytes(tmp_path):
+    cache = DriveBlobCache(str(tmp_path), max_bytes=250)
+    for file_id in ("a", "b"):
+        cache.put(file_id, MODIFIED, writer(b"x" * 100))
+        time.sleep(0.01)
+
+    # "a" se vuelve a usar, así que "b" es la más antigua
+    assert cache.get("a", MODIFIED)
+    time.sleep(0.01)
+    cache.put("c", MODIFIED, writer(b"x" * 100))
+
+    assert cache.get("a", MODIFIED)
+    assert cache.get("b", MODIFIED) is None
+    assert cache.get("c", MODIFIED)
+    assert cache.stats()['size_bytes'] == 200
+
+
+def test_failed_or_oversized_fill_leaves_nothing(tmp_path):
+    cache = DriveBlobCache(str(tmp_path), max_bytes=50)
+
+    assert cache.put("a", MODIFIED, lambda path: None) is None
+    assert cache.put("b", MODIFIED, writer(b"x" * 100)) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_concurrent_writers_stay_within_budget(tmp_path):
+    cache = DriveBlobCache(str(tmp_path), max_bytes=1000)
+    threads = [
+        threading.Thread(target=cache.put, args=(f"file-{i}", MODIFIED, writer(os.urandom(300))))
+        for i in range(12)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    names = os.listdir(tmp_path)
+    assert all(name.endswith('.blob') for name in names)
+    assert cache.stats()['size_bytes'] <= 1000
+
+
+def test_drive_download_is_served_from_cache(tmp_path):
+    with StubServer() as server:
+        db = make_db(server, tmp_path)
+        server.routes[('GET', 'files/abc')] = lambda params, body: (
+            (200, CONTENT) if params.get('alt') == 'media'
+            else (200, {"id": "abc", "size": str(len(CONTENT)), "modifiedTime": MODIFIED})
+        )
+        drive = db.drive_service
+        drive.blob_cache = DriveBlobCache(str(tmp_path / 'blobs'), max_bytes=10 * 1024 * 1024)
+
+        def media_requests():
+            return sum(1 for method, resource, params in server.requests
+                       if resource == 'files/abc' and params.get('alt') == 'media')
+
+        target = tmp_path / 'first.bin'
+        assert drive.download_to("uuid-1", "abc", str(target)) == len(CONTENT)
+        assert target.read_bytes() == CONTENT
+        assert media_requests() == 5
+
+        # Segunda descarga (y en memoria): solo se consulta modifiedTime
+        assert drive.download_file("uuid-1", "abc") == CONTENT
+        sink = io.BytesIO()
+        file_info = {"size": str(len(CONTENT)), "modifiedTime": MODIFIED}
+        assert drive.download_to("uuid-1", "abc", sink, file_info=file_info) == len(CONTENT)
+        assert sink.getvalue() == CONTENT
+        assert media_requests() == 5
+        assert server.count('GET', 'files/abc') == 7
+        assert drive.blob_cache.stats()['hits'] == 2
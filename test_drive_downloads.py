@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las descargas de Google Drive por bloques y lecturas por rango
+"""
+
+import io
+import os
+import sys
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ttl_cache import TTLCache
+from database import UserDatabase
+from supabase_client import SupabaseClient
+from benchmarks.stub_server import StubServer
+
+USER = {"id": "uuid-1", "telegram_id": 42}
+CONTENT = os.urandom(300_000)
+CHUNK_SIZE = 64 * 1024
+
+
+def make_db(server, tmp_path):
+    db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+    db.client = SupabaseClient(server.url, 'test-key')
+    db.identity_cache = TTLCache(maxsize=100, ttl=60)
+
+    drive = db.drive_service
+    drive.client = db.client
+    drive.sessions = TTLCache(maxsize=10, ttl=3600)
+    drive.profiles = TTLCache(maxsize=10, ttl=300)
+    drive.api_endpoint = f"{server.url}/"
+    drive.download_chunk_size = CHUNK_SIZE
+    drive.blob_cache = None
+
+    token = drive._encrypt_token({
+        'token': 'token', 'refresh_token': 'refresh', 'token_uri': f"{server.url}/token",
+        'client_id': 'client-id', 'client_secret': 'client-secret', 'scopes': drive.SCOPES,
+        'expiry': (datetime.utcnow() + timedelta(hours=1)).isoformat()
+    })
+    server.routes.update({
+        ('GET', 'users'): lambda params, body: (
+            200, [{**USER, "google_drive_connected": True, "google_drive_token": token}]
+            if params.get('telegram_id') == 'eq.42' or params.get('id') == 'eq.uuid-1' else []
+        ),
+        ('GET', 'documents'): lambda params, body: (
+            200, [{"id": "doc-1", "title": "informe.pdf", "google_drive_file_id": "abc"}]
+        ),
+        ('GET', 'files/abc'): lambda params, body: (200, CONTENT),
+    })
+    return db
+
+
+def test_download_to_path_streams_in_chunks(tmp_path):
+    with StubServer() as server:
+        db = make_db(server, tmp_path)
+        target = tmp_path / 'download.bin'
+
+        size = db.drive_service.download_to("uuid-1", "abc", str(target))
+
+        assert size == len(CONTENT)
+        assert target.read_bytes() == CONTENT
+        # Un bloque por solicitud: 300 000 bytes en bloques de 64 KiB
+        assert server.count('GET', 'files/abc') == 5
+
+
+def test_download_to_file_object_and_download_file(tmp_path):
+    with StubServer() as server:
+        db = make_db(server, tmp_path)
+
+        sink = io.BytesIO()
+        assert db.drive_service.download_to("uuid-1", "abc", sink, chunk_size=100_000) == len(CONTENT)
+        assert sink.getvalue() == CONTENT
+        assert server.count('GET', 'files/abc') == 3
+
+        assert db.drive_service.download_file("uuid-1", "abc") == CONTENT
+
+
+def test_failed_download_removes_partial_file(tmp_path):
+    with StubServer() as server:
+        db = make_db(server, tmp_path)
+        server.routes[('GET', 'files/abc')] = lambda params, body: (404, {"error": "not found"})
+        target = tmp_path / 'download.bin'
+
+        assert db.drive_service.download_to("uuid-1", "abc", str(target)) is None
+        assert not target.exists()
+
+
+def test_read_file_range(tmp_path):
+    with StubServer() as server:
+        db = make_db(server, tmp_path)
+
+        assert db.drive_service.read_file_range("uuid-1", "abc", 10, 19) == CONTENT[10:20]
+        assert db.drive_service.read_file_range("uuid-1", "abc", len(CONTENT) - 5) == CONTENT[-5:]
+        assert db.drive_service.read_file_range("uuid-1", "abc", len(CONTENT) + 10) == b""
+        assert server.count('GET', 'files/abc') == 3
+
+
+def test_document_content_streams_to_destination(tmp_path):
+    with StubServer() as server:
+        db = make_db(server, tmp_path)
+        target = tmp_path / 'informe.pdf'
+
+        success, result = db.get_document_content_from_drive(42, "doc-1", destination=str(target))
+
+        assert success
+        assert result['file_path'] == str(target)
+        assert result['file_size'] == len(CONTENT)
+        assert 'file_content' not in result
+        assert target.read_bytes() == CONTENT
+
+        # Sin destino se mantiene el contenido en memoria, como antes
+        success, result = db.get_document_content_from_drive(42, "doc-1")
+        assert success
+        assert result['file_content'] == CONTENT
+
+
+def test_empty_drive_file_creates_document(tmp_path):
+    def empty_file(params, body):
+        if params.get('alt') == 'media':
+            return 200, b''
+        return 200, {"id": "empty", "name": "vacio.txt", "mimeType": "text/plain", "size": "0"}
+
+    with StubServer() as server:
+        db = make_db(server, tmp_path)
+        db.embeddings_service = None
+        server.routes.update({
+            ('GET', 'files/empty'): empty_file,
+            ('POST', 'documents'): lambda params, body: (201, [{"id": "doc-9"}]),
+            ('POST', 'group_documents'): lambda params, body: (201, []),
+        })
+
+        # Una descarga de 0 bytes es válida: no es un error de Drive
+        success, document_id = db.create_document_from_drive_file(42, "empty", group_id="group-1")
+
+        assert success, document_id
+        assert document_id == "doc-9"
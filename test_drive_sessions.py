@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las cachés de Google Drive por usuario: perfil (fila del usuario)
+y sesión (credenciales y clientes)
+"""
+
+import os
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cryptography.fernet import Fernet
+
+from ttl_cache import TTLCache
+from supabase_client import SupabaseClient
+from google_drive_service import PROFILE_FIELDS, GoogleDriveService
+from benchmarks.stub_server import StubServer
+
+USER_ID = "uuid-1"
+
+
+def make_service(server, expires_in):
+    service = GoogleDriveService(server.url, 'test-key', Fernet.generate_key().decode(),
+                                 supabase_client=SupabaseClient(server.url, 'test-key'))
+    service.sessions = TTLCache(maxsize=10, ttl=3600)
+    service.profiles = TTLCache(maxsize=10, ttl=300)
+    token = service._encrypt_token({
+        'token': 'old-token',
+        'refresh_token': 'refresh-token',
+        'token_uri': f"{server.url}/token",
+        'client_id': 'client-id',
+        'client_secret': 'client-secret',
+        'scopes': GoogleDriveService.SCOPES,
+        'expiry': (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat()
+    })
+    profile = {"id": USER_ID, "google_drive_connected": True, "google_drive_token": token}
+    server.routes[('GET', 'users')] = lambda params, body: (200, [profile])
+    return service
+
+
+def make_server():
+    return StubServer({
+        ('POST', 'token'): lambda params, body: (200, {"access_token": "new-token", "expires_in": 3600}),
+        ('PATCH', 'users'): lambda params, body: (204, None),
+    })
+
+
+def test_session_is_cached_per_user():
+    with make_server() as server:
+        service = make_service(server, expires_in=3600)
+
+        files = service._get_drive_files(USER_ID)
+        assert files is not None
+        assert service._get_drive_files(USER_ID) is files
+        assert server.count('GET', 'users') == 1
+        assert server.count('POST', 'token') == 0
+
+        # La entrada vence cuando vence el token
+        _, expires_at = service.sessions._data[USER_ID]
+        assert 3500 < expires_at - time.monotonic() <= 3600
+
+        # Otro hilo usa su propio cliente con las mismas credenciales
+        other = {}
+        thread = threading.Thread(target=lambda: other.update(files=service._get_drive_files(USER_ID)))
+        thread.start()
+        thread.join()
+        assert other['files'] is not files
+        assert server.count('GET', 'users') == 1
+
+
+def test_concurrent_first_use_loads_credentials_once():
+    with make_server() as server:
+        server.latency = 0.05
+        service = make_service(server, expires_in=3600)
+
+        threads = [threading.Thread(target=service._get_drive_files, args=(USER_ID,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert server.count('GET', 'users') == 1
+
+
+def test_expiring_token_is_refreshed_ahead_of_time():
+    with make_server() as server:
+        service = make_service(server, expires_in=60)
+
+        # Vence dentro del margen: se renueva al cargar y se guarda el token nuevo
+        session = service._get_drive_session(USER_ID)
+        assert session.credentials.token == 'new-token'
+        assert server.count('POST', 'token') == 1
+        assert server.count('PATCH', 'users') == 1
+
+        # Una sesión en caché que entra en el margen se renueva sin volver a Supabase
+        session.credentials.expiry = datetime.utcnow() + timedelta(seconds=60)
+        assert service._get_drive_session(USER_ID) is session
+        assert server.count('POST', 'token') == 2
+        assert server.count('GET', 'users') == 1
+        assert session.credentials.expiry > datetime.utcnow() + timedelta(seconds=3000)
+
+
+def test_failed_refresh_drops_session():
+    with make_server() as server:
+        service = make_service(server, expires_in=3600)
+        session = service._get_drive_session(USER_ID)
+
+        server.routes[('POST', 'token')] = lambda params, body: (400, {"error": "invalid_grant"})
+        session.credentials.expiry = datetime.utcnow() + timedelta(seconds=60)
+
+        assert service._get_drive_session(USER_ID) is None
+        assert USER_ID not in service.sessions._data
+
+
+def test_invalidate_reloads_credentials():
+    with make_server() as server:
+        service = make_service(server, expires_in=3600)
+        service._get_drive_files(USER_ID)
+
+        # La sesión se reconstruye desde el perfil en caché
+        assert service.invalidate_drive_session(USER_ID)
+        service._get_drive_files(USER_ID)
+        assert server.count('GET', 'users') == 1
+
+        # Como tras handle_oauth_callback: perfil y sesión se vuelven a leer
+        assert service.invalidate_user_profile(USER_ID)
+        assert service.invalidate_drive_session(USER_ID)
+        service._get_drive_files(USER_ID)
+        assert server.count('GET', 'users') == 2
+
+
+def test_user_without_token_is_not_cached():
+    with make_server() as server:
+        service = make_service(server, expires_in=3600)
+        original_route = server.routes[('GET', 'users')]
+        server.routes[('GET', 'users')] = lambda params, body: (
+            200, [{"id": USER_ID, "google_drive_connected": False}]
+        )
+
+        assert not service.is_user_connected(USER_ID)
+        assert service._get_drive_files(USER_ID) is None
+        assert len(service.sessions) == 0
+        assert len(service.profiles) == 0
+
+        # Drive se vincula en otro proceso: el siguiente intento ya lo ve sin invalidar nada
+        server.routes[('GET', 'users')] = original_route
+        assert service.is_user_connected(USER_ID)
+        assert service._get_drive_files(USER_ID) is not None
+        assert server.count('GET', 'users') == 3
+
+
+def test_upload_reads_user_row_once():
+    with make_server() as server:
+        service = make_service(server, expires_in=3600)
+        profile_route = server.routes[('GET', 'users')]
+        server.routes[('GET', 'users')] = lambda params, body: (
+            200, [{**profile_route(params, body)[1][0], "google_drive_connected": True,
+                   "google_drive_folder_id": "folder-1"}]
+        )
+
+        # Las tres comprobaciones de una subida comparten la misma lectura
+        assert service.is_user_connected(USER_ID)
+        assert service._get_user_folder_id(USER_ID) == "folder-1"
+        assert service._get_drive_files(USER_ID) is not None
+        assert server.count('GET', 'users') == 1
+        assert server.requests[0][2]['select'] == PROFILE_FIELDS
+
+        # Guardar una carpeta nueva actualiza la copia en caché
+        assert service._save_user_folder_id(USER_ID, "folder-2")
+        assert service._get_user_folder_id(USER_ID) == "folder-2"
+        assert server.count('GET', 'users') == 1
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la caché persistente de embeddings por hash de contenido
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache, hash_file, hash_text
+
+
+def test_roundtrip_persists_across_instances(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    key = EmbeddingCache.make_key('abc', 'all-MiniLM-L6-v2')
+    vector = [0.25, -1.5, 3.0]
+
+    cache = EmbeddingCache(path)
+    assert cache.get(key) is None
+    cache.set(key, 'hola mundo', vector, {'content_type': 'text'})
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    entry = reopened.get(key)
+    assert entry == {'text': 'hola mundo', 'embedding': vector, 'metadata': {'content_type': 'text'}}
+    assert reopened.stats()['hits'] == 1
+    # El modelo forma parte de la clave
+    assert reopened.get(EmbeddingCache.make_key('abc', 'otro-modelo')) is None
+    reopened.close()
+
+
+def test_evicts_least_recently_used_by_size(tmp_path):
+    vector = np.ones(384, dtype=np.float32).tolist()
+    entry_size = 384 * 4 + 1
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite3'), max_bytes=entry_size * 3)
+
+    for name in 'abc':
+        cache.set(name, 'x', vector)
+    cache.get('a')  # 'b' pasa a ser la menos usada
+    cache.set('d', 'x', vector)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert len(cache) == 3
+    assert cache.stats()['size_bytes'] <= cache.max_bytes
+    cache.close()
+
+
+def test_content_hashes(tmp_path):
+    path = tmp_path / 'doc.txt'
+    path.write_bytes(b'contenido')
+    assert hash_file(str(path)) == hash_file(str(path))
+    assert hash_text('hola   mundo\n') == hash_text('hola mundo')
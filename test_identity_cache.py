@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la caché de identidad (telegram_id -> UUID y grupo personal)
+"""
+
+import os
+import sys
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ttl_cache import TTLCache
+from database import UserDatabase
+from async_database import AsyncUserDatabase
+from supabase_client import SupabaseClient
+from benchmarks.stub_server import StubServer
+
+USER = {"id": "uuid-1", "telegram_id": 42}
+GROUP = {"id": "group-1"}
+
+
+def make_routes():
+    return {
+        ('GET', 'users'): lambda params, body: (200, [USER] if params.get('telegram_id') == 'eq.42' else []),
+        ('GET', 'groups'): lambda params, body: (200, [GROUP]),
+        ('GET', 'group_documents'): lambda params, body: (200, []),
+    }
+
+
+def make_db(server, tmp_path):
+    db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+    db.client = SupabaseClient(server.url, 'test-key')
+    db.identity_cache = TTLCache(maxsize=100, ttl=60)
+    return db
+
+
+def test_ttl_cache_expiry_lru_and_stats():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # desaloja 'b', la menos usada
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+    time.sleep(0.06)
+    assert cache.get('a') is None
+    assert len(cache) == 1
+
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['hit_rate'] == 0.5
+
+
+def test_repeated_operations_resolve_identity_once(tmp_path):
+    with StubServer(routes=make_routes()) as server:
+        db = make_db(server, tmp_path)
+        for _ in range(5):
+            assert db.get_user_documents(42) == (True, [])
+        db.client.close()
+
+        assert server.count('GET', 'users') == 1
+        assert server.count('GET', 'groups') == 1
+        assert server.count('GET', 'group_documents') == 5
+        assert db.identity_cache.stats()['hits'] == 8
+
+
+def test_unknown_user_is_not_cached(tmp_path):
+    with StubServer(routes=make_routes()) as server:
+        db = make_db(server, tmp_path)
+        assert db.resolve_user_uuid(7) is None
+        assert db.resolve_user_uuid(7) is None
+        db.client.close()
+
+        assert server.count('GET', 'users') == 2
+
+
+def test_remove_and_login_invalidate(tmp_path):
+    with StubServer(routes=make_routes()) as server:
+        db = make_db(server, tmp_path)
+        assert db.resolve_personal_group_id(42) == "group-1"
+        assert len(db.identity_cache) == 2
+
+        db.remove_user(42)
+        assert len(db.identity_cache) == 0
+
+        db.resolve_personal_group_id(42)
+        db.login_web_user = lambda email, password: (True, "uuid-2")
+        db.login_telegram_user(42, "a@b.c", "secreto")
+        assert len(db.identity_cache) == 0
+        db.client.close()
+
+
+def test_async_layer_shares_cache(tmp_path):
+    async def scenario(server, db):
+        adb = AsyncUserDatabase(sync_db=db, supabase_url=server.url, supabase_key='test-key')
+        try:
+            first = await adb.get_personal_group_id(42)
+            second = await adb.get_personal_group_id(42)
+            removed = await adb.remove_user(42)
+        finally:
+            await adb.close()
+        return first, second, removed
+
+    with StubServer(routes=make_routes()) as server:
+        db = make_db(server, tmp_path)
+        first, second, removed = asyncio.run(scenario(server, db))
+        assert db.resolve_user_uuid(42) == "uuid-1"
+        db.client.close()
+
+        assert first == second == "group-1"
+        assert server.count('GET', 'groups') == 1
+        # La eliminación invalida la entrada y obliga a consultar de nuevo
+        assert server.count('GET', 'users') == 2
@@ -147,9 +147,10 @@ def test_similarity_search():
             {"text": "Base de datos relacionales", "embedding": None, "id": 4}
         ]
         
-        # Generar embeddings
-        for doc in docs:
-            doc["embedding"] = embeddings_service.generate_embedding(doc["text"])
+        # Generar embeddings en un solo lote
+        embeddings = embeddings_service.generate_embeddings_batch([doc["text"] for doc in docs])
+        for doc, embedding in zip(docs, embeddings):
+            doc["embedding"] = embedding
         
         # Buscar similares
         query = "programación en Python"
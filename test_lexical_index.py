@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Pruebas del índice BM25 local y de la búsqueda híbrida
+"""
+
+import os
+import sys
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from lexical_index import BM25Index, LexicalIndexManager, reciprocal_rank_fusion, tokenize
+from database import UserDatabase
+from supabase_client import SupabaseClient
+from benchmarks.stub_server import StubServer
+
+
+def test_tokenize_keeps_references_and_strips_accents():
+    terms = tokenize("Factura F-2024-0117 de Ángela, versión 2.1")
+    assert "f-2024-0117" in terms
+    assert {"2024", "0117", "angela", "version", "2.1"} <= set(terms)
+    assert "f" not in terms
+
+
+def test_bm25_ranks_exact_terms_and_updates_incrementally():
+    index = BM25Index.build(
+        ["d1", "d2", "d3"],
+        ["Factura F-2024-0117 del proveedor", "Factura F-2024-0200 del proveedor", "Acta de la reunión anual"]
+    )
+    assert index.search("F-2024-0117", limit=3)[0][0] == "d1"
+    assert [doc_id for doc_id, _ in index.search("reunion", limit=3)] == ["d3"]
+    assert index.search("inexistente") == []
+
+    index.add("d3", "Factura F-2024-0117 rectificada")
+    assert {doc_id for doc_id, _ in index.search("F-2024-0117", limit=2)} == {"d1", "d3"}
+    assert index.remove("d1")
+    assert index.search("F-2024-0117", limit=3)[0][0] == "d3"
+    assert "reunion" not in index.postings
+
+
+def test_manager_persists_and_reloads(tmp_path):
+    manager = LexicalIndexManager(str(tmp_path))
+    manager.build("g1", ["d1", "d2"], ["contrato de alquiler", "nómina de marzo"])
+    assert manager.add("g1", "d3", "contrato laboral")
+
+    other = LexicalIndexManager(str(tmp_path))
+    assert len(other.get("g1")) == 3
+    assert {doc_id for doc_id, _ in other.search("g1", "contrato")} == {"d1", "d3"}
+    assert other.search("g2", "contrato") is None
+
+
+
+def add_texts(index_dir, worker, count):
+    manager = LexicalIndexManager(index_dir)
+    for i in range(count):
+        assert manager.add("g1", f"w{worker}-{i}", f"informe {worker} número {i}")
+
+
+def test_concurrent_processes_do_not_lose_updates(tmp_path):
+    LexicalIndexManager(str(tmp_path)).build("g1", ["d0"], ["informe inicial"])
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=add_texts, args=(str(tmp_path), w, 15)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert len(LexicalIndexManager(str(tmp_path)).get("g1")) == 1 + 4 * 15
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+    assert fused[0][0] == "c"
+    assert [doc_id for doc_id, _ in fused] == ["c", "a", "b", "d"]
+
+
+def test_hybrid_search_without_embeddings_uses_lexical_ranking(tmp_path):
+    rows = [
+        {"document_id": "d1", "documents": {"id": "d1", "title": "Factura", "text_content": "Factura F-2024-0117"}},
+        {"document_id": "d2", "documents": {"id": "d2", "title": "Factura", "text_content": "Factura F-2024-0200"}},
+        {"document_id": "d3", "documents": {"id": "d3", "title": "Acta", "text_content": "Acta de la reunión"}},
+    ]
+
+    def documents(params, body):
+        ids = params['id'][len('in.('):-1].split(',')
+        return 200, [{"id": doc_id, "title": doc_id} for doc_id in ids]
+
+    routes = {
+        ('GET', 'users'): lambda params, body: (200, [{"id": "uuid-1"}]),
+        ('GET', 'groups'): lambda params, body: (200, [{"id": "group-1"}]),
+        ('GET', 'group_documents'): lambda params, body: (200, rows),
+        ('GET', 'documents'): documents,
+    }
+    with StubServer(routes=routes) as server:
+        db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+        db.client = SupabaseClient(server.url, 'test-key')
+        db.embeddings_service = None
+        db.lexical_index = LexicalIndexManager(str(tmp_path / 'index'))
+
+        success, results = db.hybrid_search_documents(5151, "factura F-2024-0117", limit=2)
+        db._index_document("group-1", "d4", None, "Recibo F-2024-0117")
+        _, second = db.hybrid_search_documents(5151, "F-2024-0117", limit=5)
+        db.client.close()
+
+        # El índice se construye una sola vez y después se actualiza en local
+        assert server.count('GET', 'group_documents') == 1
+
+    assert success is True
+    assert [doc['id'] for doc in results] == ["d1", "d2"]
+    assert results[0]['bm25_score'] > results[1]['bm25_score']
+    assert results[0]['similarity'] is None
+    assert {doc['id'] for doc in second[:2]} == {"d1", "d4"}
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Pruebas del OCR: preprocesado de fotos, caché por hash de imagen y OCR
+solo de las páginas de PDF sin capa de texto.
+"""
+
+import io
+import os
+import sys
+import shutil
+import hashlib
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image, ImageDraw
+
+import ocr
+from embedding_cache import EmbeddingCache, hash_file
+from ocr import OCREngine
+from pdf_extraction import extract_pdf_text
+
+
+def jpeg_bytes(size, orientation=None):
+    image = Image.new('RGB', size, 'white')
+    ImageDraw.Draw(image).rectangle([10, 10, size[0] // 2, size[1] // 2], fill='black')
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def write_scanned_pdf(path, jpeg, size, text_page=None):
+    """PDF con una página escaneada (solo una imagen JPEG) y opcionalmente una con texto"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R%s] /Count %d >>" % (" 6 0 R" if text_page else "", 2 if text_page else 1),
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        "/Resources << /XObject << /Im1 5 0 R >> >> /Contents 4 0 R >>",
+    ]
+    draw = "q 612 0 0 792 0 0 cm /Im1 Do Q"
+    objects.append(f"<< /Length {len(draw)} >>\nstream\n{draw}\nendstream")
+    image_header = (f"<< /Type /XObject /Subtype /Image /Width {size[0]} /Height {size[1]} "
+                    f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>")
+    if text_page:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text_page}) Tj ET"
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       "/Resources << /Font << /F1 8 0 R >> >> /Contents 7 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+        if number == 4:
+            # Objeto 5: la imagen, con su flujo binario
+            offsets.append(len(data))
+            data += f"5 0 obj\n{image_header}\nstream\n".encode('latin-1') + jpeg + b"\nendstream\nendobj\n"
+    xref = len(data)
+    data += f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for offset in offsets:
+        data += f"{offset:010d} 00000 n \n".encode('latin-1')
+    data += f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = OCREngine(max_side=1000, cache=EmbeddingCache(str(tmp_path / 'cache.sqlite3')))
+    monkeypatch.setattr(ocr, '_engine', engine)
+    yield engine
+    engine.cache.close()
+
+
+def test_prepare_downscales_to_grayscale_and_applies_exif_orientation(engine, tmp_path):
+    path = tmp_path / 'photo.jpg'
+    # Foto vertical guardada en horizontal con orientación EXIF 6 (girar 90°)
+    path.write_bytes(jpeg_bytes((4000, 3000), orientation=6))
+
+    with Image.open(path) as image:
+        prepared = engine.prepare(image)
+
+    assert prepared.mode == 'L'
+    # El decodificador JPEG reduce a 1/2 (1500x2000) y luego se remuestrea al objetivo
+    assert prepared.size == (750, 1000)
+
+
+def test_prepare_never_upscales(engine):
+    image = Image.new('RGB', (400, 300), 'white')
+    prepared = engine.prepare(image)
+    assert prepared.mode == 'L'
+    assert prepared.size == (400, 300)
+
+    assert engine.prepare(image, scale=0.5).size == (200, 150)
+
+
+def test_ocr_file_uses_cache_by_image_hash(engine, tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(jpeg_bytes((800, 600)))
+    key = EmbeddingCache.make_key(hash_file(str(path)), engine.cache_model, kind='ocr')
+    engine.cache.set(key, 'Factura 2024', [])
+
+    assert engine.ocr_file(str(path)) == 'Factura 2024'
+    assert engine.stats()['cache_hits'] == 1
+    assert engine.stats()['images'] == 0
+
+
+def test_only_pdf_pages_without_text_are_ocred(engine, tmp_path):
+    jpeg = jpeg_bytes((1275, 1650))
+    path = write_scanned_pdf(tmp_path / 'scan.pdf', jpeg, (1275, 1650), text_page='Pagina con texto')
+    key = EmbeddingCache.make_key(hashlib.sha256(jpeg).hexdigest(), engine.cache_model, kind='ocr')
+    engine.cache.set(key, 'Texto escaneado', [])
+
+    result = extract_pdf_text(path)
+
+    assert result['text'] == "Texto escaneado\nPagina con texto"
+    assert [page['page'] for page in result['pages']] == [1, 2]
+    # Una sola imagen consultada (la de la página escaneada), servida desde la caché
+    assert engine.stats()['cache_hits'] == 1
+    assert engine.cache.stats()['misses'] == 0
+
+
+def test_pdf_ocr_can_be_disabled(engine, tmp_path):
+    jpeg = jpeg_bytes((1275, 1650))
+    path = write_scanned_pdf(tmp_path / 'scan.pdf', jpeg, (1275, 1650))
+    engine.pdf_pages = False
+
+    assert extract_pdf_text(path)['text'] == ""
+    assert engine.cache.stats()['hits'] + engine.cache.stats()['misses'] == 0
+
+
+@pytest.mark.skipif(shutil.which('tesseract') is None, reason="tesseract no instalado")
+def test_ocr_reads_downscaled_photo(engine, tmp_path):
+    image = Image.new('L', (120, 30), 'white')
+    ImageDraw.Draw(image).text((5, 8), "HOLA 2024", fill='black')
+    # Simular una foto grande: el texto ocupa muchos más píxeles de los necesarios
+    image.resize((2400, 600), Image.Resampling.NEAREST).save(tmp_path / 'photo.png')
+
+    text = engine.ocr_file(str(tmp_path / 'photo.png'))
+
+    assert 'HOLA' in text.upper()
+    assert engine.stats()['images'] == 1
+    assert engine.ocr_file(str(tmp_path / 'photo.png')) == text
+    assert engine.stats()['cache_hits'] == 1
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la extracción de PDF por páginas: orden, presupuestos y rangos
+de caracteres de cada página (secuencial y repartida entre procesos).
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_extraction import extract_pdf_text, iter_pdf_pages, page_for_offset
+
+
+def write_pdf(path, page_texts):
+    """Escribir un PDF mínimo con una línea de texto por página"""
+    page_count = len(page_texts)
+    font_id = 3 + 2 * page_count
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(page_count)), page_count
+        )
+    ]
+    for i, text in enumerate(page_texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for offset in offsets:
+        data += f"{offset:010d} 00000 n \n".encode('latin-1')
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_extract_pdf_text_records_page_ranges(tmp_path):
+    path = write_pdf(tmp_path / 'doc.pdf', ['Primera pagina', '', 'Tercera pagina'])
+
+    result = extract_pdf_text(path)
+
+    assert result['text'] == "Primera pagina\nTercera pagina"
+    assert result['page_count'] == 3
+    assert result['pages_read'] == 3
+    assert not result['truncated']
+    # La página vacía no ocupa texto; cada rango apunta a su página real
+    assert result['pages'] == [
+        {'page': 1, 'start_char': 0, 'end_char': 14},
+        {'page': 3, 'start_char': 15, 'end_char': 29}
+    ]
+    for page in result['pages']:
+        assert result['text'][page['start_char']:page['end_char']].endswith('pagina')
+
+
+def test_extract_pdf_text_respects_page_and_char_budgets(tmp_path):
+    path = write_pdf(tmp_path / 'doc.pdf', [f'Pagina {i}' for i in range(1, 11)])
+
+    by_pages = extract_pdf_text(path, max_pages=3)
+    assert by_pages['text'] == "Pagina 1\nPagina 2\nPagina 3"
+    assert by_pages['pages_read'] == 3
+    assert by_pages['truncated']
+
+    by_chars = extract_pdf_text(path, max_chars=20)
+    assert len(by_chars['text']) == 20
+    assert by_chars['text'] == "Pagina 1\nPagina 2\nPa"
+    assert by_chars['truncated']
+    assert by_chars['pages'][-1] == {'page': 3, 'start_char': 18, 'end_char': 20}
+
+
+def test_parallel_extraction_keeps_page_order(tmp_path):
+    texts = [f'Pagina {i}' for i in range(1, 26)]
+    path = write_pdf(tmp_path / 'doc.pdf', texts)
+    submitted = []
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        def submit(func, *args):
+            submitted.append(args[1:])
+            return executor.submit(func, *args)
+
+        result = extract_pdf_text(path, submit=submit, pages_per_task=4, window=4)
+
+    assert result['text'] == "\n".join(texts)
+    assert submitted == [(start, min(start + 4, 25)) for start in range(0, 25, 4)]
+    assert result == extract_pdf_text(path)
+
+
+def test_iter_pdf_pages_stops_submitting_when_consumer_stops(tmp_path):
+    path = write_pdf(tmp_path / 'doc.pdf', [f'Pagina {i}' for i in range(1, 41)])
+    submitted = []
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        def submit(func, *args):
+            submitted.append(args[1:])
+            return executor.submit(func, *args)
+
+        pages = iter_pdf_pages(path, submit=submit, pages_per_task=5, window=2)
+        assert next(pages) == (1, 'Pagina 1')
+        pages.close()
+
+    # Rangos de 10 páginas (2 por hueco de la ventana): solo la ventana inicial
+    # más el rango que repone el primero consumido
+    assert submitted == [(0, 10), (10, 20), (20, 30)]
+
+
+def test_page_for_offset():
+    pages = [
+        {'page': 1, 'start_char': 0, 'end_char': 100},
+        {'page': 3, 'start_char': 101, 'end_char': 250}
+    ]
+    assert page_for_offset(pages, 0) == 1
+    assert page_for_offset(pages, 100) == 1
+    assert page_for_offset(pages, 101) == 3
+    assert page_for_offset(pages, 5000) == 3
+    assert page_for_offset([], 10) is None
+    assert page_for_offset(None, 10) is None
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Pruebas del pool de procesos para trabajo CPU (OCR, PDF, embeddings)
+"""
+
+import os
+import sys
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from processing_pool import ProcessingPool, ProcessingQueueFull, get_processing_pool
+
+
+def test_runs_jobs_in_worker_processes():
+    pool = ProcessingPool(max_workers=2)
+    try:
+        pids = {pool.submit(os.getpid).result() for _ in range(4)}
+        assert os.getpid() not in pids
+        assert pool.submit(pow, 2, 10).result() == 1024
+    finally:
+        pool.shutdown()
+
+
+def test_bounded_queue_rejects_when_full():
+    pool = ProcessingPool(max_workers=1, max_pending=1)
+    try:
+        busy = pool.submit(time.sleep, 0.5)
+        with pytest.raises(ProcessingQueueFull):
+            pool.submit(pow, 2, 2, timeout=0.05)
+        busy.result()
+        # Al terminar el trabajo se libera el hueco
+        assert pool.submit(pow, 2, 2, timeout=1).result() == 4
+    finally:
+        pool.shutdown()
+
+
+def test_async_run_does_not_block_event_loop():
+    pool = ProcessingPool(max_workers=1)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        await pool.run(time.sleep, 0.3)
+        task.cancel()
+        return ticks
+
+    try:
+        # Precalentar el proceso para no medir el arranque
+        pool.submit(pow, 1, 1).result()
+        assert asyncio.run(scenario()) >= 10
+    finally:
+        pool.shutdown()
+
+
+def test_pool_disabled_by_default(monkeypatch):
+    monkeypatch.delenv('PROCESSING_WORKERS', raising=False)
+    assert get_processing_pool() is None
+
+
+def test_unreadable_pdf_returns_empty_extraction(tmp_path):
+    bad_pdf = tmp_path / 'bad.pdf'
+    bad_pdf.write_bytes(b"%PDF-1.4\nno es un PDF completo")
+    pool = ProcessingPool(max_workers=1)
+    try:
+        extraction = pool.extract_pdf(str(bad_pdf))
+        assert extraction == {'text': "", 'pages': [], 'page_count': 0, 'pages_read': 0, 'truncated': False}
+        assert pool.extract_text(str(bad_pdf), 'pdf') == ""
+    finally:
+        pool.shutdown()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las cachés de embeddings de consulta y de resultados de búsqueda
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from ttl_cache import TTLCache
+from database import UserDatabase
+from supabase_client import SupabaseClient
+from benchmarks.stub_server import StubServer
+
+
+class FixedEmbedder:
+    """Sustituto del modelo: el embedding solo depende de la longitud de la consulta"""
+
+    def generate_query_embedding(self, text):
+        return [float(len(text)), 1.0]
+
+    def find_similar_documents(self, query_embedding, document_embeddings, threshold, limit):
+        # Búsqueda en cliente cuando la RPC devuelve menos de limit filas
+        return []
+
+
+def test_ttl_cache_reports_saved_latency():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert 'saved_ms' not in cache.stats()
+
+    cache.record_miss_cost(0.050)
+    cache.record_hit_cost(0.001)
+    cache.record_hit_cost(0.003)
+    stats = cache.stats()
+    assert stats['avg_miss_ms'] == pytest.approx(50.0)
+    assert stats['avg_hit_ms'] == pytest.approx(2.0)
+    assert stats['saved_ms'] == pytest.approx(96.0)
+
+    cache.clear()
+    assert 'saved_ms' not in cache.stats()
+
+
+def search_routes(groups):
+    def search(params, body):
+        return 200, [{"id": "d2", "title": "Dos", "similarity": 0.9},
+                     {"id": "d1", "title": "Uno", "similarity": 0.8}]
+
+    def documents(params, body):
+        ids = params['id'][len('in.('):-1].split(',')
+        return 200, [{"id": doc_id, "title": doc_id} for doc_id in sorted(ids)]
+
+    return {
+        ('GET', 'users'): lambda params, body: (200, [{"id": "uuid-1"}]),
+        ('GET', 'groups'): groups,
+        ('POST', 'rpc/search_documents_by_similarity'): search,
+        ('GET', 'documents'): documents,
+    }
+
+
+def make_db(server, tmp_path):
+    db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+    db.client = SupabaseClient(server.url, 'test-key')
+    db.embeddings_service = FixedEmbedder()
+    db.search_cache = TTLCache(maxsize=100, ttl=60)
+    return db
+
+
+def test_repeated_search_uses_result_cache_until_group_changes(tmp_path):
+    versions = {"group-1": 7}
+
+    def groups(params, body):
+        if params['select'] == 'documents_version':
+            return 200, [{"documents_version": versions[params['id'][len('eq.'):]]}]
+        return 200, [{"id": "group-1"}]
+
+    with StubServer(routes=search_routes(groups)) as server:
+        db = make_db(server, tmp_path)
+
+        first = db.search_documents_by_similarity(6161, "¿qué dice el contrato?", threshold=0.5, limit=2)
+        second = db.search_documents_by_similarity(6161, "¿qué dice el contrato?", threshold=0.5, limit=2)
+        other_limit = db.search_documents_by_similarity(6161, "¿qué dice el contrato?", threshold=0.5, limit=3)
+        assert server.count('POST', 'rpc/search_documents_by_similarity') == 2
+        assert server.count('GET', 'documents') == 1
+
+        # Otro proceso sube un documento al grupo: el trigger cambia la versión
+        # en la base e invalida los resultados guardados en este proceso
+        versions["group-1"] += 1
+        db.search_documents_by_similarity(6161, "¿qué dice el contrato?", threshold=0.5, limit=2)
+        assert server.count('POST', 'rpc/search_documents_by_similarity') == 3
+        db.client.close()
+
+    assert first[0] is True and other_limit[0] is True
+    # Desde la caché: mismo orden y similaridad, documentos descargados por ID
+    assert second[0] is True
+    assert [(doc['id'], doc['similarity']) for doc in second[1]] == [("d2", 0.9), ("d1", 0.8)]
+
+    stats = db.search_cache_stats()
+    assert stats['query_embeddings'] is None
+    assert stats['search_results']['hits'] == 1
+    assert stats['search_results']['misses'] == 3
+    assert 'saved_ms' in stats['search_results']
+
+
+def test_result_cache_uses_local_version_without_the_column(tmp_path):
+    def groups(params, body):
+        if params['select'] == 'documents_version':
+            return 400, {"message": "column groups.documents_version does not exist"}
+        return 200, [{"id": "group-1"}]
+
+    with StubServer(routes=search_routes(groups)) as server:
+        db = make_db(server, tmp_path)
+
+        db.search_documents_by_similarity(6161, "¿qué dice el contrato?", threshold=0.5, limit=2)
+        db.search_documents_by_similarity(6161, "¿qué dice el contrato?", threshold=0.5, limit=2)
+        assert server.count('POST', 'rpc/search_documents_by_similarity') == 1
+
+        db.bump_group_version("group-1")
+        db.search_documents_by_similarity(6161, "¿qué dice el contrato?", threshold=0.5, limit=2)
+        assert server.count('POST', 'rpc/search_documents_by_similarity') == 2
+        db.client.close()
+
+        # Tras el 400 no se vuelve a consultar la columna
+        assert db.documents_version_available is False
+        assert len([p for m, r, p in server.requests if r == 'groups' and p['select'] == 'documents_version']) == 1
+
+
+def test_query_embedding_cache_normalizes_text(monkeypatch):
+    pytest.importorskip('sentence_transformers')
+    from embeddings_service import EmbeddingsService
+
+    class Model:
+        def __init__(self, do_lower_case):
+            self.tokenizer = type('Tokenizer', (), {'do_lower_case': do_lower_case})()
+
+    for do_lower_case, expected_calls in ((True, 1), (False, 2)):
+        service = EmbeddingsService(cache=None)
+        service._model = Model(do_lower_case)
+        calls = []
+        monkeypatch.setattr(service, 'generate_embedding', lambda text: calls.append(text) or [0.5, 0.5])
+
+        assert service.generate_query_embedding("¿Qué dice  el contrato?") == [0.5, 0.5]
+        assert service.generate_query_embedding("¿qué dice el contrato? ") == [0.5, 0.5]
+        # Un modelo que distingue mayúsculas calcula cada variante con su propio texto
+        assert len(calls) == expected_calls
+        assert service.query_cache.stats()['hits'] == 2 - expected_calls
+
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Pruebas del cliente REST compartido de Supabase contra un servidor local
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from supabase_client import SupabaseClient, get_supabase_client
+from benchmarks.stub_server import StubServer
+
+
+def test_client_reuses_connection():
+    """Varias llamadas deben viajar por una única conexión keep-alive"""
+    with StubServer() as server:
+        client = SupabaseClient(server.url, 'test-key', pool_size=2)
+        for _ in range(5):
+            assert client.get("users", params={"telegram_id": "eq.1"}).status_code == 200
+        assert client.post("documents", json={"title": "a"}).status_code == 201
+        client.close()
+
+        assert server.connections == 1
+        assert server.count('GET', 'users') == 5
+        assert server.requests[0][2] == {"telegram_id": "eq.1"}
+
+
+def test_client_default_headers_and_rpc():
+    seen = {}
+
+    def rpc_handler(params, body):
+        seen['body'] = body
+        return 200, [{"ok": True}]
+
+    with StubServer(routes={('POST', 'rpc/search_documents'): rpc_handler}) as server:
+        client = SupabaseClient(server.url, 'test-key')
+        assert client.session.headers['apikey'] == 'test-key'
+        assert client.get_headers()['Authorization'] == 'Bearer test-key'
+
+        response = client.rpc('search_documents', {"query_text": "hola"})
+        assert response.json() == [{"ok": True}]
+        assert seen['body'] == {"query_text": "hola"}
+        client.close()
+
+
+def test_shared_client_per_project():
+    a = get_supabase_client('http://example.invalid', 'k1')
+    assert get_supabase_client('http://example.invalid', 'k1') is a
+    assert get_supabase_client('http://example.invalid', 'k2') is not a
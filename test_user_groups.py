@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Pruebas de UserDatabase.get_user_groups contra un servidor PostgREST local
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import UserDatabase
+from supabase_client import SupabaseClient
+from benchmarks.stub_server import StubServer
+
+USER_ID = "uuid-1"
+MEMBER_GROUPS = [{"id": f"group-{i}", "name": f"Grupo {i}", "admin_id": "otro"} for i in range(30)]
+ADMIN_GROUPS = [
+    {"id": "group-0", "name": "Grupo 0", "admin_id": USER_ID},
+    {"id": "admin-only", "name": "Sin membresía", "admin_id": USER_ID},
+]
+
+
+def make_routes():
+    def memberships(params, body):
+        # Sin el recurso embebido la prueba fallaría en lugar de hacer N+1 consultas
+        assert 'groups(*)' in params.get('select', '')
+        return 200, [
+            {"group_id": g["id"], "is_admin": i == 0, "status": "verified", "groups": g}
+            for i, g in enumerate(MEMBER_GROUPS)
+        ]
+
+    return {
+        ('GET', 'group_members'): memberships,
+        ('GET', 'groups'): lambda params, body: (
+            200, [dict(g) for g in ADMIN_GROUPS] if params.get('admin_id') == f"eq.{USER_ID}" else MEMBER_GROUPS
+        ),
+    }
+
+
+def test_user_groups_constant_request_count(tmp_path):
+    with StubServer(routes=make_routes()) as server:
+        db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+        db.client = SupabaseClient(server.url, 'test-key')
+        groups = db.get_user_groups(USER_ID)
+        db.client.close()
+
+        assert server.count('GET', 'group_members') == 1
+        assert server.count('GET', 'groups') == 1
+        # Solo el grupo administrado sin membresía provoca una escritura
+        assert server.count('POST', 'group_members') == 1
+
+    assert [g['id'] for g in groups] == [g['id'] for g in MEMBER_GROUPS] + ['admin-only']
+    assert groups[0]['is_admin'] is True
+    assert groups[1]['is_admin'] is False
+    assert groups[-1]['is_admin'] is True and groups[-1]['status'] == 'verified'
+
+
+def test_group_members_with_users_paginates(tmp_path):
+    rows = [
+        {"user_id": f"u{i}", "is_admin": i == 0, "status": "verified",
+         "joined_at": f"2024-01-01T00:00:{i:02d}", "users": {"email": f"u{i}@example.com"}}
+        for i in range(25)
+    ]
+    rows.append({"user_id": "borrado", "is_admin": False, "status": "pending",
+                 "joined_at": "2024-01-02T00:00:00", "users": None})
+
+    def members(params, body):
+        assert 'users(email)' in params['select']
+        offset, limit = int(params['offset']), int(params['limit'])
+        return 200, rows[offset:offset + limit]
+
+    with StubServer(routes={('GET', 'group_members'): members}) as server:
+        db = UserDatabase(db_file=str(tmp_path / 'users.json'))
+        db.client = SupabaseClient(server.url, 'test-key')
+        result = db.get_group_members_with_users("group-1", page_size=10)
+        first_page = db.get_group_members_with_users("group-1", page_size=10, limit=5)
+        db.client.close()
+
+        # 26 filas en páginas de 10 (3) + una página limitada a 5
+        assert server.count('GET', 'group_members') == 4
+        assert not server.count('GET', 'users')
+
+    assert len(result) == 25
+    assert result[0] == {"user_id": "u0", "email": "u0@example.com", "is_admin": True,
+                         "status": "verified", "joined_at": "2024-01-01T00:00:00"}
+    assert [m['user_id'] for m in first_page] == ["u0", "u1", "u2", "u3", "u4"]
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la búsqueda top-k vectorizada y del tipo Embedding
+"""
+
+import os
+import sys
+import json
+import pickle
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pytest
+
+from vector_search import (Embedding, QuantizedMatrix, as_vector, build_embedding_matrix, quantize_rows,
+                           to_pgvector, top_k_quantized, top_k_similar)
+
+
+def reference_top_k(query, embeddings, threshold, limit):
+    """Implementación anterior: similaridad documento a documento y orden completo"""
+    results = []
+    for position, embedding in enumerate(embeddings):
+        a, b = np.array(query), np.array(embedding)
+        norm = np.linalg.norm(a) * np.linalg.norm(b)
+        similarity = 0.0 if norm == 0 else max(0.0, min(1.0, float(np.dot(a, b) / norm)))
+        if similarity >= threshold:
+            results.append((position, similarity))
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results[:limit]
+
+
+def test_matches_reference_implementation():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(500, 32)).tolist()
+    query = rng.normal(size=32).tolist()
+
+    matrix, positions = build_embedding_matrix(embeddings)
+    for threshold, limit in [(0.0, 5), (0.2, 10), (0.9, 5), (0.0, 1000)]:
+        expected = reference_top_k(query, embeddings, threshold, limit)
+        got = [(positions[row], score) for row, score in top_k_similar(query, matrix, threshold, limit)]
+        assert [p for p, _ in got] == [p for p, _ in expected]
+        assert np.allclose([s for _, s in got], [s for _, s in expected], atol=1e-5)
+
+
+def test_skips_invalid_embeddings_and_parses_pgvector_text():
+    embeddings = ["[1, 0, 0]", None, [0, 0, 0], [0.0, 1.0], "no-vector", [0.6, 0.8, 0]]
+    matrix, positions = build_embedding_matrix(embeddings, dimension=3)
+
+    assert positions == [0, 2, 5]
+    assert matrix.dtype == np.float32
+    results = top_k_similar([1, 0, 0], matrix, threshold=0.1, limit=5)
+    assert [positions[row] for row, _ in results] == [0, 5]
+    assert results[1][1] == pytest.approx(0.6, abs=1e-6)
+
+
+def test_degenerate_queries():
+    matrix, _ = build_embedding_matrix([[1, 0], [0, 1]])
+    assert top_k_similar([0, 0], matrix) == []
+    assert top_k_similar([1, 0], matrix, limit=0) == []
+    assert top_k_similar([1, 0, 0], matrix) == []
+    assert as_vector([]) is None
+
+
+
+def test_embedding_wraps_float32_without_copy_and_round_trips_pgvector():
+    values = np.random.default_rng(3).normal(size=384).astype(np.float32)
+    embedding = Embedding(values)
+    assert embedding.array is values
+    assert as_vector(embedding, 384) is values
+    assert len(embedding) == 384 and embedding.nbytes == 384 * 4
+
+    text = embedding.to_pgvector()
+    assert text.startswith('[') and text.endswith(']')
+    assert len(text) < len(json.dumps(values.tolist()))
+    assert Embedding.from_pgvector(text) == embedding
+    assert np.array_equal(as_vector(text), values)
+
+    assert pickle.loads(pickle.dumps(embedding)) == embedding
+    assert to_pgvector([0.5, 0.25]) == '[0.5,0.25]'
+    assert to_pgvector(None) is None
+    matrix, positions = build_embedding_matrix([embedding, Embedding.zeros(384)])
+    assert matrix.shape == (2, 384) and positions == [0, 1]
+
+
+def test_embedding_validation_is_vectorized():
+    assert Embedding([0.1, 0.2]).is_valid(2)
+    assert not Embedding([0.1, 0.2]).is_valid(3)
+    assert not Embedding([0.1, np.nan]).is_valid()
+    assert not Embedding([np.inf, 0.0]).is_valid()
+    assert Embedding.zeros(4).is_zero()
+    with pytest.raises(ValueError):
+        Embedding([[1.0, 2.0]])
+
+
+def test_int8_quantization_error_is_small():
+    matrix, _ = build_embedding_matrix(np.random.default_rng(4).normal(size=(100, 64)))
+    codes, scales = quantize_rows(matrix)
+    assert codes.dtype == np.int8 and scales.dtype == np.float32
+    assert np.abs(codes * scales[:, None] - matrix).max() <= scales.max() / 2 + 1e-6
+
+
+def test_quantized_top_k_rescores_exactly_and_keeps_recall():
+    rng = np.random.default_rng(5)
+    centers = rng.normal(size=(30, 32))
+    embeddings = (centers[rng.integers(0, 30, 3000)] + 0.3 * rng.normal(size=(3000, 32))).tolist()
+    embeddings[10] = "no es un vector"
+
+    quantized, positions = QuantizedMatrix.from_embeddings(embeddings, chunk_size=500)
+    matrix, float_positions = build_embedding_matrix(embeddings)
+    assert positions == float_positions and 10 not in positions
+    assert quantized.nbytes < matrix.nbytes / 3
+
+    hits = 0
+    for query in rng.normal(size=(20, 32)):
+        expected = top_k_similar(query, matrix, 0.0, 10)
+        got = top_k_quantized(query, quantized, lambda rows: matrix[rows], 0.0, 10, oversample=4)
+        hits += len({row for row, _ in expected} & {row for row, _ in got})
+        # Las similaridades devueltas son las exactas, no las aproximadas
+        exact = dict(expected)
+        assert all(score == pytest.approx(exact[row]) for row, score in got if row in exact)
+    assert hits / 200 >= 0.95
+
+    assert top_k_quantized(np.zeros(32), quantized, lambda rows: matrix[rows]) == []
@@ -0,0 +1,107 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Caché en memoria con expiración (TTL), desalojo LRU y contadores de aciertos
+
+    Opcionalmente registra el coste de un acierto y de un fallo (calcular el
+    valor) para estimar el tiempo ahorrado por la caché.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        """
+        Inicializar caché
+
+        Args:
+            maxsize: Número máximo de entradas antes de desalojar la menos usada
+            ttl: Segundos de vida de cada entrada
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._hit_cost = [0, 0.0]
+        self._miss_cost = [0, 0.0]
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Obtener un valor vigente; cuenta acierto o fallo"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Guardar un valor, desalojando la entrada menos usada si hace falta"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def record_hit_cost(self, seconds: float):
+        """Registrar la duración de una consulta resuelta desde la caché"""
+        with self._lock:
+            self._hit_cost[0] += 1
+            self._hit_cost[1] += seconds
+
+    def record_miss_cost(self, seconds: float):
+        """Registrar la duración de una consulta que tuvo que calcular el valor"""
+        with self._lock:
+            self._miss_cost[0] += 1
+            self._miss_cost[1] += seconds
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Eliminar una entrada; devuelve True si existía"""
+        with self._lock:
+            return self._data.pop(key, _MISSING) is not _MISSING
+
+    def clear(self):
+        """Vaciar la caché y reiniciar contadores"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self._hit_cost = [0, 0.0]
+            self._miss_cost = [0, 0.0]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Obtener contadores de uso"""
+        total = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl
+        }
+
+        hit_count, hit_seconds = self._hit_cost
+        miss_count, miss_seconds = self._miss_cost
+        if miss_count:
+            # Ahorro estimado: cada acierto habría costado lo que un fallo medio
+            avg_hit = hit_seconds / hit_count if hit_count else 0.0
+            avg_miss = miss_seconds / miss_count
+            stats['avg_hit_ms'] = avg_hit * 1000
+            stats['avg_miss_ms'] = avg_miss * 1000
+            stats['saved_ms'] = max(0.0, avg_miss - avg_hit) * hit_count * 1000
+        return stats
@@ -0,0 +1,106 @@
+import os
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class TokenUsageBuffer:
+    """
+    Acumulador en memoria de deltas de tokens por usuario
+
+    Suma los incrementos de cada usuario y los envía juntos cada
+    flush_interval segundos, de modo que muchas consultas cortas se
+    convierten en una sola llamada a la base de datos. Si el envío falla,
+    los deltas se devuelven al buffer para el siguiente intento.
+    """
+
+    def __init__(self, flush_func: Callable[[Dict[str, int]], bool], flush_interval: float = 5.0):
+        """
+        Inicializar buffer
+
+        Args:
+            flush_func: Función que aplica {user_id: delta}; devuelve True si tuvo éxito
+            flush_interval: Segundos entre envíos automáticos
+        """
+        self.flush_func = flush_func
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='token-usage-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, user_id, delta: int):
+        """Acumular un delta de tokens para un usuario"""
+        if not delta:
+            return
+        with self._lock:
+            self._pending[str(user_id)] += delta
+
+    def pending(self) -> Dict[str, int]:
+        """Copia de los deltas aún no enviados"""
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self) -> bool:
+        """Enviar los deltas acumulados"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                deltas = dict(self._pending)
+                self._pending.clear()
+
+            try:
+                success = self.flush_func(deltas)
+            except Exception as e:
+                logger.error(f"Error al enviar tokens acumulados: {e}")
+                success = False
+
+            if not success:
+                # Reintentar en el próximo ciclo sin perder incrementos
+                with self._lock:
+                    for user_id, delta in deltas.items():
+                        self._pending[user_id] += delta
+            return success
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Detener el hilo y enviar lo pendiente"""
+        self._stop.set()
+        self.flush()
+
+
+_buffer: Optional[TokenUsageBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_token_usage_buffer(flush_func: Callable[[Dict[str, int]], bool]) -> Optional[TokenUsageBuffer]:
+    """
+    Obtener el buffer de tokens compartido del proceso
+
+    TOKEN_FLUSH_INTERVAL define los segundos entre envíos (0 = sin buffer,
+    cada consulta se envía al momento). Todas las instancias de UserDatabase
+    comparten un único hilo de envío y un único registro en atexit; se usa
+    la flush_func de la primera llamada.
+    """
+    global _buffer
+    flush_interval = float(os.getenv('TOKEN_FLUSH_INTERVAL', 0))
+    if flush_interval <= 0:
+        return None
+
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = TokenUsageBuffer(flush_func, flush_interval)
+        return _buffer
@@ -0,0 +1,313 @@
+import json
+import logging
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Embedding:
+    """
+    Embedding compacto: array float32 de una dimensión
+
+    Ocupa 4 bytes por componente en lugar de un objeto float de Python por
+    componente. Se comporta como una secuencia (len, índices, iteración) y
+    NumPy lo usa sin copiar (np.asarray). Solo se convierte a lista o texto
+    en los bordes: to_pgvector() para PostgREST y tolist() para JSON.
+    """
+
+    __slots__ = ('array',)
+
+    def __init__(self, values: Any):
+        array = np.asarray(values, dtype=np.float32)
+        if array.ndim != 1:
+            raise ValueError(f"Un embedding debe tener una dimensión, no {array.ndim}")
+        self.array = array
+
+    @classmethod
+    def zeros(cls, dimension: int) -> 'Embedding':
+        return cls(np.zeros(dimension, dtype=np.float32))
+
+    @classmethod
+    def from_pgvector(cls, text: str) -> 'Embedding':
+        """Leer el formato de texto de pgvector: "[0.1,0.2,...]" """
+        body = text.strip()[1:-1]
+        return cls(np.array(body.split(',') if body else [], dtype=np.float32))
+
+    def __len__(self) -> int:
+        return self.array.size
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+    def __array__(self, dtype=None):
+        return self.array if dtype is None else self.array.astype(dtype, copy=False)
+
+    def __eq__(self, other) -> bool:
+        try:
+            return bool(np.array_equal(self.array, np.asarray(other, dtype=np.float32)))
+        except (TypeError, ValueError):
+            return False
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"Embedding(dimension={self.array.size})"
+
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes
+
+    def is_zero(self) -> bool:
+        """True si todos los componentes son 0 (embedding de respaldo tras un fallo)"""
+        return not self.array.any()
+
+    def is_valid(self, dimension: Optional[int] = None) -> bool:
+        """Comprobar dimensión y que no haya NaN ni infinitos (vectorizado)"""
+        if dimension is not None and self.array.size != dimension:
+            return False
+        return self.array.size > 0 and bool(np.isfinite(self.array).all())
+
+    def tolist(self) -> List[float]:
+        return self.array.tolist()
+
+    def to_pgvector(self) -> str:
+        """
+        Texto en formato pgvector para enviar a PostgREST
+
+        9 cifras significativas bastan para recuperar exactamente cada float32,
+        con casi la mitad de caracteres que la lista JSON de floats de 64 bits.
+        """
+        return '[' + ','.join(['%.9g' % value for value in self.array.tolist()]) + ']'
+
+
+def to_pgvector(embedding: Any) -> Optional[str]:
+    """Convertir un embedding (Embedding, lista o array) al texto de pgvector; None se mantiene"""
+    if embedding is None or isinstance(embedding, str):
+        return embedding
+    if not isinstance(embedding, Embedding):
+        embedding = Embedding(embedding)
+    return embedding.to_pgvector()
+
+
+def as_vector(embedding: Any, dimension: Optional[int] = None) -> Optional[np.ndarray]:
+    """
+    Convertir un embedding a vector float32
+
+    Acepta Embedding, listas, arrays de NumPy o el texto "[0.1,0.2,...]" con
+    el que PostgREST devuelve columnas pgvector. Devuelve None si el valor no es un
+    vector numérico válido o no tiene la dimensión esperada.
+    """
+    try:
+        if isinstance(embedding, str):
+            embedding = json.loads(embedding)
+        vector = np.asarray(embedding, dtype=np.float32)
+    except (TypeError, ValueError):
+        return None
+
+    if vector.ndim != 1 or vector.size == 0:
+        return None
+    if dimension is not None and vector.size != dimension:
+        return None
+    return vector
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normalizar cada fila a norma 1 (las filas de ceros quedan en ceros)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def build_embedding_matrix(embeddings: Sequence[Any], dimension: Optional[int] = None) -> Tuple[np.ndarray, List[int]]:
+    """
+    Apilar embeddings en una matriz float32 normalizada
+
+    Returns:
+        (matriz de forma (n, dimension), posiciones originales de cada fila);
+        los embeddings inválidos se omiten
+    """
+    # Caso habitual: todas las filas son listas numéricas de la misma dimensión
+    try:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 2 and matrix.shape[0] > 0 and dimension in (None, matrix.shape[1]):
+            return normalize_rows(matrix), list(range(matrix.shape[0]))
+    except (TypeError, ValueError):
+        pass
+
+    # Filas mixtas o inválidas: convertir una a una y omitir las que fallen
+    vectors = []
+    positions = []
+    for position, embedding in enumerate(embeddings):
+        vector = as_vector(embedding, dimension)
+        if vector is None:
+            continue
+        if dimension is None:
+            dimension = vector.size
+        vectors.append(vector)
+        positions.append(position)
+
+    if not vectors:
+        return np.zeros((0, dimension or 0), dtype=np.float32), []
+    return normalize_rows(np.vstack(vectors)), positions
+
+
+def top_k_similar(query: Any, matrix: np.ndarray, threshold: float = 0.0,
+                  limit: int = 5) -> List[Tuple[int, float]]:
+    """
+    Buscar las filas más similares a la consulta
+
+    Args:
+        query: Embedding de la consulta
+        matrix: Matriz con filas normalizadas (ver build_embedding_matrix)
+        threshold: Similaridad coseno mínima (las puntuaciones se recortan a 0-1)
+        limit: Máximo número de resultados
+
+    Returns:
+        Lista de (fila, similaridad) ordenada por similaridad descendente;
+        a igual similaridad se mantiene el orden de las filas
+    """
+    if limit <= 0 or matrix.shape[0] == 0:
+        return []
+
+    query_vector = as_vector(query, matrix.shape[1])
+    if query_vector is None:
+        return []
+    query_norm = np.linalg.norm(query_vector)
+    if query_norm == 0:
+        return []
+
+    scores = matrix @ (query_vector / query_norm)
+    np.clip(scores, 0.0, 1.0, out=scores)
+
+    candidates = np.flatnonzero(scores >= threshold)
+    if candidates.size > limit:
+        # Seleccionar los k mejores sin ordenar todo el conjunto
+        best = np.argpartition(-scores[candidates], limit - 1)[:limit]
+        candidates = candidates[best]
+
+    # Orden final: similaridad descendente y, a igualdad, posición original
+    order = np.lexsort((candidates, -scores[candidates]))
+    return [(int(candidates[i]), float(scores[candidates[i]])) for i in order]
+
+
+def quantize_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cuantizar cada fila a int8 con su propia escala
+
+    Returns:
+        (códigos int8, escalas float32) tales que fila ≈ códigos * escala
+    """
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedMatrix:
+    """
+    Embeddings normalizados cuantizados a int8 (escalar, una escala por fila)
+
+    Ocupa 1 byte por componente más 4 bytes por fila, frente a 4 bytes por
+    componente de la matriz float32. Sirve para una puntuación aproximada
+    rápida; el orden final se obtiene re-puntuando los mejores candidatos
+    con los vectores originales (ver top_k_quantized).
+    """
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray):
+        self.codes = codes
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def dimension(self) -> int:
+        return self.codes.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    @classmethod
+    def from_embeddings(cls, embeddings: Sequence[Any], dimension: Optional[int] = None,
+                        chunk_size: int = 4096) -> Tuple['QuantizedMatrix', List[int]]:
+        """
+        Cuantizar embeddings por bloques, sin construir la matriz float32 completa
+
+        Returns:
+            (matriz cuantizada, posiciones originales de cada fila); los
+            embeddings inválidos se omiten
+        """
+        codes, scales, positions = [], [], []
+        for start in range(0, len(embeddings), chunk_size):
+            matrix, chunk_positions = build_embedding_matrix(embeddings[start:start + chunk_size], dimension)
+            if not chunk_positions:
+                continue
+            dimension = matrix.shape[1]
+            chunk_codes, chunk_scales = quantize_rows(matrix)
+            codes.append(chunk_codes)
+            scales.append(chunk_scales)
+            positions.extend(start + p for p in chunk_positions)
+
+        if not codes:
+            return cls(np.zeros((0, dimension or 0), np.int8), np.zeros(0, np.float32)), []
+        return cls(np.vstack(codes), np.concatenate(scales)), positions
+
+    def scores(self, query_vector: np.ndarray, chunk_size: int = 2048) -> np.ndarray:
+        """
+        Similaridad aproximada con una consulta normalizada
+
+        Se convierte a float32 por bloques pequeños que caben en caché: la
+        matriz int8 se lee una sola vez y nunca se duplica en memoria.
+        """
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), chunk_size):
+            block = self.codes[start:start + chunk_size].astype(np.float32)
+            scores[start:start + chunk_size] = (block @ query_vector) * self.scales[start:start + chunk_size]
+        return scores
+
+
+def top_k_quantized(query: Any, quantized: QuantizedMatrix, rescore: Callable[[List[int]], np.ndarray],
+                    threshold: float = 0.0, limit: int = 5, oversample: int = 4) -> List[Tuple[int, float]]:
+    """
+    Buscar las filas más similares con puntuación int8 y re-puntuación exacta
+
+    Args:
+        query: Embedding de la consulta
+        quantized: Matriz cuantizada (ver QuantizedMatrix.from_embeddings)
+        rescore: Recibe filas de quantized y devuelve sus vectores originales
+            normalizados (matriz float32 en el mismo orden)
+        threshold: Similaridad coseno mínima, aplicada a la puntuación exacta
+        limit: Máximo número de resultados
+        oversample: Candidatos re-puntuados por cada resultado pedido
+
+    Returns:
+        Lista de (fila, similaridad exacta) ordenada como top_k_similar
+    """
+    if limit <= 0 or len(quantized) == 0:
+        return []
+
+    query_vector = as_vector(query, quantized.dimension)
+    if query_vector is None:
+        return []
+    query_norm = np.linalg.norm(query_vector)
+    if query_norm == 0:
+        return []
+    query_vector = query_vector / query_norm
+
+    approximate = quantized.scores(query_vector)
+    candidates = np.arange(len(quantized))
+    if len(quantized) > limit * oversample:
+        candidates = np.argpartition(-approximate, limit * oversample - 1)[:limit * oversample]
+    # Mantener el orden de las filas para desempatar igual que la búsqueda exacta
+    candidates = np.sort(candidates)
+
+    exact = rescore(candidates.tolist())
+    return [(int(candidates[row]), score) for row, score in top_k_similar(query_vector, exact, threshold, limit)]
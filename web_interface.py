@@ -724,31 +724,8 @@ def group_detail(group_id):
     
     group = group_response.json()[0]
     
-    # Obtener miembros del grupo
-    members_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/group_members",
-        headers=headers,
-        params={"group_id": f"eq.{group_id}"}
-    )
-    
-    members = []
-    if members_response.status_code == 200:
-        for member in members_response.json():
-            user_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"id": f"eq.{member['user_id']}"}
-            )
-            
-            if user_response.status_code == 200 and user_response.json():
-                user = user_response.json()[0]
-                members.append({
-                    'user_id': member['user_id'],
-                    'email': user.get('email', 'Sin email'),
-                    'is_admin': member['is_admin'],
-                    'status': member['status'],
-                    'joined_at': member['joined_at']
-                })
+    # Obtener miembros del grupo con su email (una consulta por página)
+    members = db.get_group_members_with_users(group_id)
     
     # Obtener contenidos si el usuario está verificado
     contents = []